@@ -0,0 +1,91 @@
+"""
+Benchmark of import times of entry points.
+Each entry point is imported by fresh interpreters, so cold starts of containers and the first paint of the login screen
+are measured without modules cached by earlier imports. It also reports whether the OpenAI stack is loaded, which should
+be deferred until the first generation.
+
+    PYTHONPATH=src python benchmarks/imports.py --rounds 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from pydantic import BaseModel
+
+ENTRY_POINTS: dict[str, str] = {
+    # `blog_agent`, `blog_agent_batch` and `blog_agent_api` commands import it before parsing their arguments.
+    "cli": "import blog_agent.main",
+    # The login screen of `web.py` is painted after these imports.
+    "login": "import streamlit, blog_agent.auth",
+    # Pages import them after the login.
+    "pages": (
+        "from blog_agent.agent import PostEvent, PostGuide, ReviewGuide\n"
+        "import blog_agent.agent.jobs, blog_agent.agent.ratelimit, blog_agent.agent.routing, blog_agent.agent.store"
+    ),
+    "api": "import blog_agent.api",
+    "batch": "import blog_agent.agent.batch",
+    # The first generation imports the OpenAI stack.
+    "first model": "from blog_agent.agent import llm\nllm.preload()",
+}
+PROBE = """
+import json, sys, time
+started_at = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - started_at
+print(json.dumps({{"seconds": seconds, "modules": len(sys.modules), "openai": "langchain_openai" in sys.modules}}))
+"""
+
+
+class BenchmarkResult(BaseModel):
+    entry_point: str
+    seconds: float  # median of rounds
+    modules: int  # modules loaded after the import
+    openai: bool  # whether `langchain_openai` is loaded
+
+
+def run(rounds: int) -> list[BenchmarkResult]:
+    results: list[BenchmarkResult] = []
+    for entry_point, statement in ENTRY_POINTS.items():
+        probes: list[dict] = []
+        for _ in range(rounds):
+            output: str = subprocess.run(
+                [sys.executable, "-c", PROBE.format(statement=statement)], capture_output=True, text=True, check=True
+            ).stdout
+            probes.append(json.loads(output.splitlines()[-1]))
+        results.append(
+            BenchmarkResult(
+                entry_point=entry_point,
+                seconds=statistics.median(probe["seconds"] for probe in probes),
+                modules=probes[-1]["modules"],
+                openai=probes[-1]["openai"],
+            )
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark import times of entry points.")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+    results: list[BenchmarkResult] = run(args.rounds)
+    if args.json:
+        for result in results:
+            print(result.model_dump_json())
+        return
+    columns: list[str] = list(BenchmarkResult.model_fields)
+    print(" | ".join(columns))
+    print(" | ".join("---" for _ in columns))
+    for result in results:
+        print(
+            " | ".join(
+                f"{value:.3f}" if isinstance(value, float) else str(value) for value in result.model_dump().values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Offline benchmark of the post, review and hashtag pipelines with fake chat models.
+It reports end-to-end latency, LLM calls and prompt tokens of each pipeline, so orchestration regressions are visible
+without OpenAI.
+
+    PYTHONPATH=src python benchmarks/pipelines.py --latency 0.2 --tokens-per-second 100
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import time
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel
+
+from blog_agent.agent import llm
+from blog_agent.agent.cache import set_llm_cache
+from blog_agent.agent.fake import FakeChatModelSettings
+from blog_agent.agent.length import set_length_controller
+from blog_agent.agent.post import PostGuide, stream_post, write_hashtags, write_post
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.review import ReviewGuide, write_product_review
+from blog_agent.agent.telemetry import CACHE_HIT, PROMPT_TOKENS, StageSummary, Tracer
+
+POST_GUIDE = PostGuide(
+    title="소고기 천국 방문 후기",
+    review="숙성 등심이 부드러웠고, 된장찌개가 구수했다. 직원들이 친절했지만 웨이팅이 길었다.",
+    max_length=1500,
+    keywords=["서울맛집", "소고기", "숙성"],
+    foods=["등심", "된장찌개"],
+    restaurant="소고기 천국",
+)
+REVIEW_GUIDE = ReviewGuide(
+    category="전자제품",
+    product="무선 이어폰",
+    score=4,
+    max_length=1000,
+    positive_review="음질이 좋고 노이즈 캔슬링이 훌륭했다.",
+    negative_review="케이스가 크다.",
+    sponsored=False,
+    purchased_date="2025-01-01",
+    arrived_date="2025-01-03",
+    packaging_state="깔끔했다.",
+)
+SCENARIOS: dict[str, dict[str, Any]] = {
+    # Responses are long enough, so no step retries.
+    "long": {"response_letters": 2000},
+    # Paragraphs and revisions are shorter than their guidelines, so steps retry until retries run out.
+    "short": {"response_letters": 200},
+    # Responses are 80% of the asked letters, so paragraphs retry until the length controller learns it.
+    "undershoot": {"fulfillment": 0.8},
+}
+PARAGRAPH_STAGES = ("introduction", "body", "conclusion")
+
+
+class BenchmarkResult(BaseModel):
+    pipeline: str
+    scenario: str
+    seconds: float  # median of rounds
+    llm_calls: int
+    prompt_tokens: int
+    max_prompt_tokens: int  # The largest prompt shows how much retries grow prompts.
+    completion_tokens: int
+    paragraph_calls: float  # LLM calls per paragraph including continuations
+
+
+def pipelines(policy: RetryPolicy) -> dict[str, Callable[[Tracer], object]]:
+    return {
+        "post(sequential)": lambda tracer: write_post(POST_GUIDE, mode="sequential", policy=policy, tracer=tracer),
+        "post(parallel)": lambda tracer: write_post(POST_GUIDE, mode="parallel", policy=policy, tracer=tracer),
+        "review": lambda tracer: write_product_review(REVIEW_GUIDE, tracer=tracer),
+        "hashtags": lambda tracer: write_hashtags("소고기 " * 500, POST_GUIDE, tracer=tracer),
+        # Hashtags of the draft are written while the draft is revised, so it should take as long as the post only.
+        "post(parallel)+hashtags": lambda tracer: list(
+            stream_post(POST_GUIDE, mode="parallel", policy=policy, tracer=tracer, hashtags=True)
+        ),
+    }
+
+
+def run(settings: FakeChatModelSettings, rounds: int, policy: RetryPolicy) -> list[BenchmarkResult]:
+    # Cached responses and stored posts would hide LLM calls of repeated rounds.
+    set_llm_cache(None)
+    os.environ["BLOG_AGENT_POST_STORE"] = "none"
+    results: list[BenchmarkResult] = []
+    for scenario, update in SCENARIOS.items():
+        llm.set_chat_model_provider(settings.model_copy(update=update).provider())
+        # Lengths are learned from the first round of each scenario.
+        set_length_controller(None)
+        for pipeline, write in pipelines(policy).items():
+            seconds: list[float] = []
+            for _ in range(rounds):
+                tracer = Tracer(exporter=lambda span: None)
+                started_at: float = time.perf_counter()
+                write(tracer)
+                seconds.append(time.perf_counter() - started_at)
+            prompt_tokens: list[int] = [
+                int(span.attributes.get(PROMPT_TOKENS, 0))
+                for span in tracer.spans
+                if span.kind == "llm" and not span.attributes.get(CACHE_HIT)
+            ]
+            paragraphs: list[StageSummary] = [stage for stage in tracer.summary() if stage.stage in PARAGRAPH_STAGES]
+            results.append(
+                BenchmarkResult(
+                    pipeline=pipeline,
+                    scenario=scenario,
+                    seconds=statistics.median(seconds),
+                    llm_calls=len(prompt_tokens),
+                    prompt_tokens=sum(prompt_tokens),
+                    max_prompt_tokens=max(prompt_tokens, default=0),
+                    completion_tokens=sum(stage.completion_tokens for stage in tracer.summary()),
+                    paragraph_calls=sum(stage.llm_calls for stage in paragraphs)
+                    / max(sum(stage.spans for stage in paragraphs), 1),
+                )
+            )
+    llm.set_chat_model_provider(None)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pipelines with fake chat models.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Speed of completion tokens")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    settings = FakeChatModelSettings(latency=args.latency, tokens_per_second=args.tokens_per_second)
+    results: list[BenchmarkResult] = run(settings, args.rounds, RetryPolicy(backoff=0))
+    if args.json:
+        for result in results:
+            print(result.model_dump_json())
+        return
+    columns: list[str] = list(BenchmarkResult.model_fields)
+    print(" | ".join(columns))
+    print(" | ".join("---" for _ in columns))
+    for result in results:
+        print(
+            " | ".join(
+                f"{value:.3f}" if isinstance(value, float) else str(value) for value in result.model_dump().values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
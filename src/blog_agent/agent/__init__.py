@@ -1,8 +1,88 @@
-from blog_agent.agent.post import PostGuide, find_restaurant, write_hashtags, write_post
+"""
+Public functions of the agent.
+They are imported on first access, so importing submodules like `blog_agent.agent.store` doesn't load the LLM stack.
+"""
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from blog_agent.agent.post import (
+        PostEvent,
+        PostGuide,
+        afind_restaurant,
+        aplan_writing_post,
+        astream_post,
+        awrite_hashtags,
+        awrite_post,
+        awrite_post_with_hashtags,
+        find_restaurant,
+        plan_writing_post,
+        stream_post,
+        write_hashtags,
+        write_post,
+    )
+    from blog_agent.agent.review import (
+        ReviewGuide,
+        aextract_keywords,
+        awrite_product_review,
+        extract_keywords,
+        write_product_review,
+    )
+    from blog_agent.agent.telemetry import Tracer
+
+_modules: dict[str, str] = {
+    "PostEvent": "blog_agent.agent.post",
+    "PostGuide": "blog_agent.agent.post",
+    "ReviewGuide": "blog_agent.agent.review",
+    "Tracer": "blog_agent.agent.telemetry",
+    "aextract_keywords": "blog_agent.agent.review",
+    "afind_restaurant": "blog_agent.agent.post",
+    "aplan_writing_post": "blog_agent.agent.post",
+    "astream_post": "blog_agent.agent.post",
+    "awrite_hashtags": "blog_agent.agent.post",
+    "awrite_post": "blog_agent.agent.post",
+    "awrite_post_with_hashtags": "blog_agent.agent.post",
+    "awrite_product_review": "blog_agent.agent.review",
+    "extract_keywords": "blog_agent.agent.review",
+    "find_restaurant": "blog_agent.agent.post",
+    "plan_writing_post": "blog_agent.agent.post",
+    "stream_post": "blog_agent.agent.post",
+    "write_hashtags": "blog_agent.agent.post",
+    "write_post": "blog_agent.agent.post",
+    "write_product_review": "blog_agent.agent.review",
+}
 
 __all__ = (
+    "PostEvent",
     "PostGuide",
+    "ReviewGuide",
+    "Tracer",
+    "aextract_keywords",
+    "afind_restaurant",
+    "aplan_writing_post",
+    "astream_post",
+    "awrite_hashtags",
+    "awrite_post",
+    "awrite_post_with_hashtags",
+    "awrite_product_review",
+    "extract_keywords",
     "find_restaurant",
+    "plan_writing_post",
+    "stream_post",
     "write_hashtags",
     "write_post",
+    "write_product_review",
 )
+
+
+def __getattr__(name: str) -> Any:
+    if (module := _modules.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_modules])
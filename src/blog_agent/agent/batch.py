@@ -0,0 +1,209 @@
+"""
+Batch generation of posts and reviews.
+Results are appended to the output as each guide finishes, so the output is also the checkpoint of a run.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections.abc import AsyncIterator, Iterable, Iterator
+from pathlib import Path
+from typing import Any, Literal, Self, TextIO
+
+from pydantic import BaseModel, Field, model_validator
+
+from blog_agent.agent.llm import cancel_tasks, iterate_sync
+from blog_agent.agent.post import PostGuide, afind_restaurant, awrite_post_with_hashtags
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.review import Review, ReviewGuide, awrite_product_review
+
+_logger = logging.getLogger(__name__)
+
+
+class BatchRecord(BaseModel):
+    """
+    A guide of the batch. The JSONL line is the record itself or the bare guide.
+    When `id` is omitted, it is the hash of the guide.
+    """
+
+    id: str = Field(default="")
+    kind: Literal["post", "review"]
+    guide: PostGuide | ReviewGuide
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_bare_guide(cls, data: Any) -> Any:
+        if isinstance(data, PostGuide | ReviewGuide) or (isinstance(data, dict) and "guide" not in data):
+            data = {"guide": data}
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+        guide = data["guide"]
+        if "kind" not in data:
+            is_review = isinstance(guide, ReviewGuide) or (isinstance(guide, dict) and "product" in guide)
+            data["kind"] = "review" if is_review else "post"
+        if isinstance(guide, dict):
+            data["guide"] = ReviewGuide(**guide) if data["kind"] == "review" else PostGuide(**guide)
+        return data
+
+    @model_validator(mode="after")
+    def _with_id(self) -> Self:
+        if not self.id:
+            self.id = hashlib.sha256(f"{self.kind}:{self.guide.model_dump_json()}".encode()).hexdigest()[:16]
+        return self
+
+
+class BatchResult(BaseModel):
+    id: str
+    kind: Literal["post", "review"]
+    post: str | None = Field(default=None)
+    hashtags: list[str] | None = Field(default=None)
+    review: Review | None = Field(default=None)
+    error: str | None = Field(default=None)
+    elapsed: float  # seconds
+
+
+class RateLimiter:
+    """Start at most `rate` guides per minute across all workers of the batch."""
+
+    def __init__(self, rate: float):
+        self.interval = 60.0 / rate
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now: float = time.monotonic()
+            if (wait := self._next_start - now) > 0:
+                await asyncio.sleep(wait)
+            self._next_start = max(now, self._next_start) + self.interval
+
+
+def write_posts_batch(
+    guides: Iterable[PostGuide | ReviewGuide | BatchRecord | dict],
+    concurrency: int = 4,
+    rate: float | None = None,
+    policy: RetryPolicy | None = None,
+) -> Iterator[BatchResult]:
+    """Write posts and reviews of the guides. Results are yielded as each guide finishes."""
+    yield from iterate_sync(awrite_posts_batch(guides, concurrency=concurrency, rate=rate, policy=policy))
+
+
+async def awrite_posts_batch(
+    guides: Iterable[PostGuide | ReviewGuide | BatchRecord | dict],
+    concurrency: int = 4,
+    rate: float | None = None,
+    policy: RetryPolicy | None = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Async version of `write_posts_batch`.
+    - concurrency: Max guides written at the same time.
+    - rate: Max guides started per minute. It is unlimited by default.
+    """
+    records: list[BatchRecord] = [BatchRecord.model_validate(guide) for guide in guides]
+    pending: asyncio.Queue[BatchRecord] = asyncio.Queue()
+    for record in records:
+        pending.put_nowait(record)
+    results: asyncio.Queue[BatchResult] = asyncio.Queue()
+    limiter: RateLimiter | None = RateLimiter(rate) if rate else None
+
+    async def work() -> None:
+        while not pending.empty():
+            record: BatchRecord = pending.get_nowait()
+            if limiter is not None:
+                await limiter.acquire()
+            results.put_nowait(await _write_record(record, policy))
+
+    workers: list[asyncio.Task[None]] = [asyncio.ensure_future(work()) for _ in range(max(1, concurrency))]
+    try:
+        for _ in records:
+            yield await results.get()
+    finally:
+        await cancel_tasks(workers)
+
+
+async def _write_record(record: BatchRecord, policy: RetryPolicy | None) -> BatchResult:
+    started_at: float = time.perf_counter()
+    log_msg: str = f"Start {record.kind}: {record.id}"
+    _logger.info(log_msg)
+    try:
+        if isinstance(record.guide, PostGuide):
+            post_guide: PostGuide = record.guide
+            if not post_guide.restaurant:
+                post_guide = post_guide.with_restaurant(await afind_restaurant(post_guide.title))
+            post, hashtags = await awrite_post_with_hashtags(post_guide, policy=policy)
+            result = BatchResult(
+                id=record.id, kind=record.kind, post=post, hashtags=hashtags, elapsed=time.perf_counter() - started_at
+            )
+        else:
+            review: Review = await awrite_product_review(record.guide)
+            result = BatchResult(
+                id=record.id, kind=record.kind, review=review, elapsed=time.perf_counter() - started_at
+            )
+    except Exception as e:
+        log_msg = f"Fail {record.kind}: {record.id}"
+        _logger.exception(log_msg)
+        return BatchResult(id=record.id, kind=record.kind, error=repr(e), elapsed=time.perf_counter() - started_at)
+    log_msg = f"Finish {record.kind}: {record.id} in {result.elapsed:.2f}s"
+    _logger.info(log_msg)
+    return result
+
+
+def read_records(path: str | Path) -> list[BatchRecord]:
+    with open(path, encoding="utf-8") as fd:
+        return [BatchRecord.model_validate(json.loads(line)) for line in fd if line.strip()]
+
+
+def completed_ids(path: str | Path) -> set[str]:
+    """Ids which are written without errors in the output"""
+    if not Path(path).exists():
+        return set()
+    ids: set[str] = set()
+    with open(path, encoding="utf-8") as fd:
+        for line in fd:
+            if not line.strip():
+                continue
+            try:
+                result = BatchResult.model_validate_json(line)
+            except ValueError:
+                # The last line may be broken by a crash.
+                continue
+            if result.error is None:
+                ids.add(result.id)
+    return ids
+
+
+async def arun_batch_file(
+    input_path: str | Path,
+    output_path: str | Path,
+    concurrency: int = 4,
+    rate: float | None = None,
+    policy: RetryPolicy | None = None,
+) -> int:
+    """
+    Write guides of the input JSONL and append results to the output JSONL.
+    Guides completed by previous runs are skipped. Returns the number of failed guides.
+    """
+    # Files are read and written by threads, so they don't block the loop shared by other jobs.
+    records: list[BatchRecord] = await asyncio.to_thread(read_records, input_path)
+    done: set[str] = await asyncio.to_thread(completed_ids, output_path)
+    records = [record for record in records if record.id not in done]
+    log_msg: str = f"Batch: {len(records)} guides to write, {len(done)} guides already written"
+    _logger.info(log_msg)
+
+    failures: int = 0
+    fd: TextIO = await asyncio.to_thread(open, output_path, "a", encoding="utf-8")
+    try:
+        async for result in awrite_posts_batch(records, concurrency=concurrency, rate=rate, policy=policy):
+            await asyncio.to_thread(_append_result, fd, result)
+            failures += result.error is not None
+    finally:
+        await asyncio.to_thread(fd.close)
+    return failures
+
+
+def _append_result(fd: TextIO, result: BatchResult) -> None:
+    fd.write(result.model_dump_json() + "\n")
+    fd.flush()
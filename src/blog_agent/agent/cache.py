@@ -0,0 +1,212 @@
+"""
+Response caches of chat models.
+Keys are hashes of the model's configuration(model name, parameters and structured-output schema) and rendered messages.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Literal
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import ChatGeneration
+from pydantic import BaseModel
+
+from blog_agent.agent.telemetry import CACHE_HIT
+
+_logger = logging.getLogger(__name__)
+
+CacheBackend = Literal["memory", "sqlite", "none"]
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total: int = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LLMCache(BaseCache):
+    """Base cache counting hits and misses. Subclasses store values by hashed keys."""
+
+    def __init__(self, ttl: float | None = None):
+        self.ttl = ttl
+        self._stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        value: RETURN_VAL_TYPE | None = self._get(self.key(prompt, llm_string))
+        with self._stats_lock:
+            if value is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+        return _marked(value) if value is not None else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self._set(self.key(prompt, llm_string), return_val)
+
+    def stats(self) -> CacheStats:
+        with self._stats_lock:
+            return self._stats.model_copy()
+
+    def _expires_at(self) -> float | None:
+        return time.time() + self.ttl if self.ttl is not None else None
+
+    @abstractmethod
+    def _get(self, key: str) -> RETURN_VAL_TYPE | None: ...
+
+    @abstractmethod
+    def _set(self, key: str, value: RETURN_VAL_TYPE) -> None: ...
+
+
+def _marked(generations: RETURN_VAL_TYPE) -> RETURN_VAL_TYPE:
+    """
+    Copies of cached chat generations whose messages are marked by `CACHE_HIT`.
+    They keep the usage of their first call, so budgets and spans don't count them by the mark.
+    """
+    return [
+        generation.model_copy(
+            update={
+                "message": generation.message.model_copy(
+                    update={"response_metadata": {**generation.message.response_metadata, CACHE_HIT: True}}
+                )
+            }
+        )
+        if isinstance(generation, ChatGeneration)
+        else generation
+        for generation in generations
+    ]
+
+
+class InMemoryLRUCache(LLMCache):
+    """In-process cache which evicts the least recently used values and expired values."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        super().__init__(ttl=ttl)
+        self.maxsize = maxsize
+        self._values: OrderedDict[str, tuple[float | None, RETURN_VAL_TYPE]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> RETURN_VAL_TYPE | None:
+        with self._lock:
+            if (item := self._values.get(key)) is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[key]
+                return None
+            self._values.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: RETURN_VAL_TYPE) -> None:
+        with self._lock:
+            self._values[key] = (self._expires_at(), value)
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class SQLiteCache(LLMCache):
+    """On-disk cache which survives restarts"""
+
+    def __init__(self, path: str = "blog-agent-cache.sqlite3", ttl: float | None = None):
+        super().__init__(ttl=ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT NOT NULL)"
+            )
+
+    def _get(self, key: str) -> RETURN_VAL_TYPE | None:
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            expires_at, value = row
+            if expires_at is not None and expires_at <= time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+        try:
+            return loads(value)
+        except Exception:
+            log_msg: str = f"Invalid cached value: {key}"
+            _logger.warning(log_msg, exc_info=True)
+            return None
+
+    def _set(self, key: str, value: RETURN_VAL_TYPE) -> None:
+        serialized: str = dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, self._expires_at(), serialized),
+            )
+
+    def clear(self, **kwargs) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+_lock = threading.Lock()
+_llm_cache: LLMCache | None = None
+_is_configured: bool = False
+
+
+def cache_from_env() -> LLMCache | None:
+    backend: CacheBackend = os.getenv("BLOG_AGENT_LLM_CACHE", "memory")  # type: ignore[assignment]
+    ttl_env: str | None = os.getenv("BLOG_AGENT_LLM_CACHE_TTL")
+    ttl: float | None = float(ttl_env) if ttl_env else None
+    match backend:
+        case "memory":
+            return InMemoryLRUCache(maxsize=int(os.getenv("BLOG_AGENT_LLM_CACHE_SIZE", "1024")), ttl=ttl)
+        case "sqlite":
+            return SQLiteCache(path=os.getenv("BLOG_AGENT_LLM_CACHE_PATH", "blog-agent-cache.sqlite3"), ttl=ttl)
+        case "none":
+            return None
+        case _:
+            raise ValueError(f"Invalid cache backend: {backend}")
+
+
+def get_llm_cache() -> LLMCache | None:
+    """Cache shared by chat models. It is configured by environments at first."""
+    global _llm_cache, _is_configured
+    with _lock:
+        if not _is_configured:
+            _llm_cache = cache_from_env()
+            _is_configured = True
+        return _llm_cache
+
+
+def set_llm_cache(cache: LLMCache | None) -> None:
+    """Change the cache. Chat models built before are dropped to use the new cache."""
+    from blog_agent.agent import llm
+
+    global _llm_cache, _is_configured
+    with _lock:
+        _llm_cache = cache
+        _is_configured = True
+    llm.reset()
+
+
+def cache_stats() -> CacheStats:
+    return cache.stats() if (cache := get_llm_cache()) is not None else CacheStats()
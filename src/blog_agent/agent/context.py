@@ -0,0 +1,71 @@
+"""
+Compact context of prompts.
+Earlier paragraphs are kept as a rolling summary instead of the whole post, and drafts are serialized without JSON
+structure and indents.
+"""
+
+import math
+import os
+import re
+from typing import Literal
+
+from pydantic import BaseModel
+
+CompactionMode = Literal["summary", "none"]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def compaction_mode() -> CompactionMode:
+    """`summary`(default) compacts context. `none` sends the whole post and indented JSON like before."""
+    mode: CompactionMode = os.getenv("BLOG_AGENT_CONTEXT_COMPACTION", "summary")  # type: ignore[assignment]
+    if mode not in ("summary", "none"):
+        raise ValueError(f"Invalid context compaction: {mode}")
+    return mode
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count. A hangul letter is about 2/3 tokens and other letters are about 1/4 tokens."""
+    hangul: int = sum(1 for letter in text if "가" <= letter <= "힣")
+    return math.ceil(hangul / 1.5 + (len(text) - hangul) / 4)
+
+
+def summarize_paragraph(paragraph: str, max_letters: int = 120) -> str:
+    """The first sentence of the paragraph"""
+    sentence: str = _SENTENCE_END.split(paragraph.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_letters else sentence[: max_letters - 1] + "…"
+
+
+class RollingContext:
+    """
+    Paragraphs written so far.
+    Paragraphs before the last one are summarized by their subjects and first sentences, and the last paragraph is kept
+    to continue from it.
+    """
+
+    def __init__(self, mode: CompactionMode | None = None):
+        self.mode: CompactionMode = mode or compaction_mode()
+        self.post: str = ""
+        self._summaries: list[str] = []
+        self._last: tuple[str, str] | None = None
+
+    def add(self, subject: str, paragraph: str) -> None:
+        if self._last is not None:
+            last_subject, last_paragraph = self._last
+            self._summaries.append(f"- {last_subject}: {summarize_paragraph(last_paragraph)}")
+        self._last = (subject, paragraph)
+        self.post = f"{self.post}\n\n{paragraph}" if self.post else paragraph
+
+    def render(self) -> str:
+        if self.mode == "none" or not self._summaries or self._last is None:
+            return self.post
+        summaries: str = "\n".join(self._summaries)
+        return f"Summary of earlier paragraphs:\n{summaries}\n\nLast paragraph:\n{self._last[1]}"
+
+    def saved_tokens(self) -> int:
+        return estimate_tokens(self.post) - estimate_tokens(self.render())
+
+
+def dump_json(model: BaseModel, mode: CompactionMode | None = None, **kwargs) -> str:
+    """JSON of the model without indents unless compaction is off"""
+    return model.model_dump_json(indent=None if (mode or compaction_mode()) == "summary" else 4, **kwargs)
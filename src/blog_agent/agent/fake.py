@@ -0,0 +1,229 @@
+"""
+Deterministic chat model for benchmarks and offline runs.
+It answers placeholder Korean text after the configured latency, and reports token usage like OpenAI models.
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import time
+import types
+from collections.abc import AsyncIterator, Iterator
+from typing import Any, Literal, Union, get_args, get_origin, get_type_hints, is_typeddict
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel, Field
+
+from blog_agent.agent.llm import ChatModelProvider
+from blog_agent.agent.ratelimit import RateLimitedChatModel
+
+_ASKED_LETTERS = re.compile(r"longer than (\d+) letter")
+_SENTENCE = "오늘은 맛있는 음식을 천천히 즐기며 좋은 시간을 보냈다. "
+
+
+class FakeChatModelSettings(BaseModel):
+    """
+    Behavior of fake chat models.
+    - latency: Seconds before the first token.
+    - tokens_per_second: Speed of completion tokens. `None` completes instantly after the latency.
+    - response_letters: Letters of text responses. Responses are cut by `max_completion_tokens`.
+    - fulfillment: When set, text responses have this ratio of the letters asked by `longer than N letters` in prompts
+      instead of `response_letters`, like models which write shorter than asked.
+    - chars_per_token: Letters per token to count tokens of prompts and responses.
+    - number: Numbers of structured responses, like letter counts of the plan.
+    - items: Items of lists in structured responses.
+    """
+
+    latency: float = Field(default=0.0, ge=0)
+    tokens_per_second: float | None = Field(default=None, gt=0)
+    response_letters: int = Field(default=2000, ge=1)
+    fulfillment: float | None = Field(default=None, gt=0)
+    chars_per_token: float = Field(default=1.5, gt=0)
+    number: int = Field(default=300)
+    items: int = Field(default=3, ge=1)
+
+    @classmethod
+    def from_env(cls) -> "FakeChatModelSettings":
+        env = {
+            "latency": os.getenv("BLOG_AGENT_FAKE_LATENCY"),
+            "tokens_per_second": os.getenv("BLOG_AGENT_FAKE_TOKENS_PER_SECOND"),
+            "response_letters": os.getenv("BLOG_AGENT_FAKE_RESPONSE_LETTERS"),
+        }
+        return cls(**{key: value for key, value in env.items() if value is not None})
+
+    def provider(self) -> ChatModelProvider:
+        def build(
+            model: str, *, temperature: float, max_completion_tokens: int, cache: BaseCache | bool
+        ) -> BaseChatModel:
+            return RateLimitedFakeChatModel(
+                model=model,
+                temperature=temperature,
+                max_completion_tokens=max_completion_tokens,
+                cache=cache,
+                settings=self,
+            )
+
+        return build
+
+
+class FakeChatModel(BaseChatModel):
+    model: str = "fake"
+    temperature: float = 0.0
+    max_completion_tokens: int | None = None
+    settings: FakeChatModelSettings = Field(default_factory=FakeChatModelSettings)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_completion_tokens": self.max_completion_tokens,
+            **self.settings.model_dump(),
+        }
+
+    def with_structured_output(self, schema: dict | type, *, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        """Answer JSON filled with placeholder values of the schema"""
+
+        def parse(message: AIMessage) -> Any:
+            value: Any = json.loads(message.content)
+            return schema.model_validate(value) if isinstance(schema, type) and issubclass(schema, BaseModel) else value
+
+        return self.bind(structured_output=schema) | RunnableLambda(parse)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        content, usage = self._respond(messages, kwargs.get("structured_output"))
+        time.sleep(self._seconds(usage["output_tokens"]))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        content, usage = self._respond(messages, kwargs.get("structured_output"))
+        await asyncio.sleep(self._seconds(usage["output_tokens"]))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        content, usage = self._respond(messages, kwargs.get("structured_output"))
+        time.sleep(self.settings.latency)
+        for piece, seconds in self._pieces(content):
+            time.sleep(seconds)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        content, usage = self._respond(messages, kwargs.get("structured_output"))
+        await asyncio.sleep(self.settings.latency)
+        for piece, seconds in self._pieces(content):
+            await asyncio.sleep(seconds)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    def _respond(self, messages: list[BaseMessage], schema: dict | type | None) -> tuple[str, UsageMetadata]:
+        if schema is None:
+            letters: int = self.settings.response_letters
+            if self.settings.fulfillment is not None and (asked := _asked_letters(messages)) is not None:
+                letters = math.ceil(asked * self.settings.fulfillment)
+            if self.max_completion_tokens is not None:
+                letters = min(letters, int(self.max_completion_tokens * self.settings.chars_per_token))
+            content: str = _text(letters)
+        else:
+            content = json.dumps(self._fake_value(schema), ensure_ascii=False)
+        input_tokens: int = self._tokens(sum(len(str(message.content)) for message in messages))
+        output_tokens: int = self._tokens(len(content))
+        usage = UsageMetadata(
+            input_tokens=input_tokens, output_tokens=output_tokens, total_tokens=input_tokens + output_tokens
+        )
+        return content, usage
+
+    def _tokens(self, letters: int) -> int:
+        return math.ceil(letters / self.settings.chars_per_token)
+
+    def _seconds(self, tokens: int) -> float:
+        if self.settings.tokens_per_second is None:
+            return self.settings.latency
+        return self.settings.latency + tokens / self.settings.tokens_per_second
+
+    def _pieces(self, content: str) -> Iterator[tuple[str, float]]:
+        """Chunks of about 8 tokens with seconds to wait before each of them"""
+        size: int = max(1, int(8 * self.settings.chars_per_token))
+        for start in range(0, len(content), size):
+            piece: str = content[start : start + size]
+            seconds: float = (
+                self._tokens(len(piece)) / self.settings.tokens_per_second if self.settings.tokens_per_second else 0.0
+            )
+            yield piece, seconds
+
+    def _fake_value(self, annotation: Any) -> Any:
+        origin = get_origin(annotation)
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return {name: self._fake_value(field.annotation) for name, field in annotation.model_fields.items()}
+        if is_typeddict(annotation):
+            return {name: self._fake_value(hint) for name, hint in get_type_hints(annotation).items()}
+        if origin is list:
+            (item,) = get_args(annotation)
+            return [self._fake_value(item) for _ in range(self.settings.items)]
+        if origin is Literal:
+            return get_args(annotation)[0]
+        if origin in (Union, types.UnionType):
+            return self._fake_value(next(arg for arg in get_args(annotation) if arg is not type(None)))
+        if annotation is bool:
+            return False
+        if annotation in (int, float):
+            return self.settings.number
+        if isinstance(annotation, dict):
+            # JSON schemas are answered by their property names
+            return {name: _text(20) for name in annotation.get("properties", {})}
+        return _text(20)
+
+
+class RateLimitedFakeChatModel(RateLimitedChatModel, FakeChatModel):
+    """Fake chat model behind the process-wide rate limiter of its model, so throttling can be measured offline"""
+
+
+def _asked_letters(messages: list[BaseMessage]) -> int | None:
+    for message in messages:
+        if match := _ASKED_LETTERS.search(str(message.content)):
+            return int(match.group(1))
+    return None
+
+
+def _text(letters: int) -> str:
+    return (_SENTENCE * (letters // len(_SENTENCE) + 1))[:letters]
@@ -0,0 +1,235 @@
+"""
+Post pipeline as a LangGraph state machine.
+The state is checkpointed to SQLite after each node, so a failed or interrupted run resumes from the last completed node
+instead of paying for the plan and paragraphs again.
+
+    plan_post ─┬─ write_introduction ─┬─ write_conclusion ─ feedback_draft ─ revise_draft
+               └─ write_body × N ─────┘
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections.abc import AsyncIterator, Iterator
+from typing import Annotated, Any, TypedDict
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import Send, StreamWriter
+
+from blog_agent.agent.context import RollingContext
+from blog_agent.agent.llm import iterate_sync
+from blog_agent.agent.post import (
+    Draft,
+    DraftDetail,
+    Feedback,
+    PostEvent,
+    PostGuide,
+    WritingPlan,
+    _afeedback_draft,
+    _aplan_with_speculation,
+    _astream_revised_draft,
+    _awrite_post_body_by_plan,
+    _awrite_post_conclusion,
+    _awrite_post_introduction,
+    _log_spent_tokens,
+)
+from blog_agent.agent.retry import RetryBudget, RetryPolicy
+from blog_agent.agent.telemetry import Tracer
+from blog_agent.logs import payload
+
+_logger = logging.getLogger(__name__)
+
+_BUDGET_KEY = "blog_agent_budget"
+_SPECULATION_KEY = "blog_agent_speculation"
+
+
+def _merge_bodies(bodies: dict[int, DraftDetail], update: dict[int, DraftDetail]) -> dict[int, DraftDetail]:
+    """Body paragraphs are merged by their indexes. The empty update of a new plan clears bodies of the previous run."""
+    return bodies | update if update else {}
+
+
+class PostState(TypedDict, total=False):
+    """
+    State of the post pipeline. Body paragraphs are merged by their indexes because they are written concurrently.
+    Writing the same guide again runs on the thread of the finished run, so the plan clears the results of that run.
+    """
+
+    post_guide: PostGuide
+    plan: WritingPlan
+    introduction: DraftDetail | None
+    bodies: Annotated[dict[int, DraftDetail], _merge_bodies]
+    draft: Draft | None
+    feedback: Feedback | None
+    post: str
+
+
+class BodyState(TypedDict):
+    post_guide: PostGuide
+    plan: WritingPlan
+    index: int
+
+
+def checkpoint_path() -> str:
+    return os.getenv("BLOG_AGENT_CHECKPOINT_PATH", "blog-agent-checkpoints.sqlite3")
+
+
+def post_thread_id(post_guide: PostGuide) -> str:
+    """Thread of the guide. Writing the same guide again resumes its failed run."""
+    return hashlib.sha256(post_guide.model_dump_json().encode()).hexdigest()[:16]
+
+
+def build_post_graph(checkpointer: BaseCheckpointSaver | None = None) -> CompiledStateGraph:
+    graph = StateGraph(PostState)
+    graph.add_node("plan_post", _plan)
+    graph.add_node("write_introduction", _introduction)
+    graph.add_node("write_body", _body, input=BodyState)
+    graph.add_node("write_conclusion", _conclusion)
+    graph.add_node("feedback_draft", _feedback)
+    graph.add_node("revise_draft", _revise)
+
+    graph.add_edge(START, "plan_post")
+    graph.add_conditional_edges("plan_post", _fan_out_paragraphs, ["write_introduction", "write_body"])
+    graph.add_edge("write_introduction", "write_conclusion")
+    graph.add_edge("write_body", "write_conclusion")
+    graph.add_edge("write_conclusion", "feedback_draft")
+    graph.add_edge("feedback_draft", "revise_draft")
+    graph.add_edge("revise_draft", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def stream_post_graph(
+    post_guide: PostGuide,
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+    thread_id: str | None = None,
+) -> Iterator[PostEvent]:
+    """Sync version of `astream_post_graph`."""
+    yield from iterate_sync(astream_post_graph(post_guide, policy=policy, tracer=tracer, thread_id=thread_id))
+
+
+async def astream_post_graph(
+    post_guide: PostGuide,
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+    thread_id: str | None = None,
+) -> AsyncIterator[PostEvent]:
+    """
+    Write the post by the graph while yielding the same events as `stream_post`.
+    When the thread has an unfinished run, it resumes after events of the completed nodes are replayed.
+    Otherwise, the post is written from the plan.
+    """
+    thread_id = thread_id or post_thread_id(post_guide)
+    budget = RetryBudget(policy, tracer)
+    # The speculative introduction is handed from the plan node to the introduction node of this run only.
+    config: RunnableConfig = {"configurable": {"thread_id": thread_id, _BUDGET_KEY: budget, _SPECULATION_KEY: {}}}
+    async with AsyncSqliteSaver.from_conn_string(checkpoint_path()) as checkpointer:
+        graph: CompiledStateGraph = build_post_graph(checkpointer)
+        snapshot = await graph.aget_state(config)
+        graph_input: PostState | None = {"post_guide": post_guide}
+        with budget.tracer.span("post", mode="graph", thread_id=thread_id):
+            if snapshot.next:
+                log_msg: str = f"Resume the post of thread {thread_id} before {snapshot.next}"
+                _logger.info(log_msg)
+                graph_input = None
+                for event in _completed_events(snapshot.values):
+                    yield event
+            else:
+                log_msg = f"Write post by the graph of thread {thread_id}: {post_guide.title}"
+                _logger.info(log_msg, extra=payload(post_guide))
+            async for event in graph.astream(graph_input, config, stream_mode="custom"):
+                yield event
+    _log_spent_tokens(budget)
+
+
+def _completed_events(state: PostState) -> Iterator[PostEvent]:
+    """Events of nodes completed before the run was stopped"""
+    if "plan" in state:
+        yield PostEvent(stage="plan", plan=state["plan"])
+    if state.get("introduction") is not None:
+        yield PostEvent(stage="paragraph", content=state["introduction"].paragraph, index=0)
+    for idx, body in sorted(state.get("bodies", {}).items()):
+        yield PostEvent(stage="paragraph", content=body.paragraph, index=idx + 1)
+    if state.get("draft") is not None and state["draft"].conclusion is not None:
+        yield PostEvent(
+            stage="paragraph", content=state["draft"].conclusion.paragraph, index=len(state["plan"].bodies) + 1
+        )
+    if state.get("feedback") is not None:
+        yield PostEvent(stage="feedback", feedback=state["feedback"], draft=state["draft"])
+
+
+def _budget(config: RunnableConfig) -> RetryBudget:
+    return config["configurable"][_BUDGET_KEY]
+
+
+def _speculation(config: RunnableConfig) -> dict[str, Any]:
+    return config["configurable"][_SPECULATION_KEY]
+
+
+async def _plan(state: PostState, config: RunnableConfig, writer: StreamWriter) -> PostState:
+    plan, introduction = await _aplan_with_speculation(state["post_guide"], _budget(config))
+    if introduction is not None:
+        _speculation(config)["introduction"] = introduction
+    writer(PostEvent(stage="plan", plan=plan))
+    return {"plan": plan, "introduction": None, "bodies": {}, "draft": None, "feedback": None, "post": ""}
+
+
+def _fan_out_paragraphs(state: PostState) -> list[Send]:
+    """The introduction and body paragraphs only depend on the plan, so they are written concurrently."""
+    return [
+        Send("write_introduction", state),
+        *(
+            Send("write_body", BodyState(post_guide=state["post_guide"], plan=state["plan"], index=idx))
+            for idx in range(len(state["plan"].bodies))
+        ),
+    ]
+
+
+async def _introduction(state: PostState, config: RunnableConfig, writer: StreamWriter) -> PostState:
+    plan: WritingPlan = state["plan"]
+    speculated: asyncio.Task[str] | None = _speculation(config).pop("introduction", None)
+    introduction: str = (
+        await speculated
+        if speculated is not None
+        else await _awrite_post_introduction(state["post_guide"], plan.introduction, _budget(config))
+    )
+    writer(PostEvent(stage="paragraph", content=introduction, index=0))
+    return {"introduction": DraftDetail(plan=plan.introduction, paragraph=introduction)}
+
+
+async def _body(state: BodyState, config: RunnableConfig, writer: StreamWriter) -> PostState:
+    idx: int = state["index"]
+    body: str = await _awrite_post_body_by_plan(state["post_guide"], state["plan"], idx, _budget(config))
+    writer(PostEvent(stage="paragraph", content=body, index=idx + 1))
+    return {"bodies": {idx: DraftDetail(plan=state["plan"].bodies[idx], paragraph=body)}}
+
+
+async def _conclusion(state: PostState, config: RunnableConfig, writer: StreamWriter) -> PostState:
+    plan: WritingPlan = state["plan"]
+    draft = Draft(introduction=state["introduction"], bodies=[body for _, body in sorted(state["bodies"].items())])
+    context = RollingContext()
+    for detail in [draft.introduction, *draft.bodies]:
+        context.add(detail.plan.subject, detail.paragraph)
+    conclusion: str = await _awrite_post_conclusion(state["post_guide"], plan.conclution, context, _budget(config))
+    draft.conclusion = DraftDetail(plan=plan.conclution, paragraph=conclusion)
+    writer(PostEvent(stage="paragraph", content=conclusion, index=len(plan.bodies) + 1))
+    return {"draft": draft}
+
+
+async def _feedback(state: PostState, config: RunnableConfig, writer: StreamWriter) -> PostState:
+    feedback: Feedback = await _afeedback_draft(state["post_guide"], state["draft"], _budget(config))
+    writer(PostEvent(stage="feedback", feedback=feedback, draft=state["draft"]))
+    return {"feedback": feedback}
+
+
+async def _revise(state: PostState, config: RunnableConfig, writer: StreamWriter) -> PostState:
+    post: str = ""
+    async for event in _astream_revised_draft(state["post_guide"], state["draft"], state["feedback"], _budget(config)):
+        writer(event)
+        if event.stage == "post":
+            post = event.content
+    return {"post": post}
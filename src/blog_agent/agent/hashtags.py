@@ -0,0 +1,57 @@
+"""
+Hashtags of drafts.
+Hashtags depend on the content of the post rather than the wording of its revision, so pipelines write them from the
+draft while the draft is reviewed and revised. A few more candidates than needed are written, and they are re-ranked
+by mentions in the final post without LLM calls.
+"""
+
+import os
+from typing import Literal
+
+HashtagRerankMode = Literal["local", "none"]
+
+# Candidates written more than needed, so hashtags dropped by the revision can be replaced.
+EXTRA_CANDIDATES = 5
+
+
+def hashtag_rerank_mode() -> HashtagRerankMode:
+    """`local`(default) re-ranks candidates by the final post. `none` keeps hashtags of the draft in the LLM's order."""
+    mode: HashtagRerankMode = os.getenv("BLOG_AGENT_HASHTAG_RERANK", "local")  # type: ignore[assignment]
+    if mode not in ("local", "none"):
+        raise ValueError(f"Invalid hashtag re-ranking: {mode}")
+    return mode
+
+
+def candidate_number(number: int) -> int:
+    """Candidates to write from the draft for `number` hashtags"""
+    return number + EXTRA_CANDIDATES if number and hashtag_rerank_mode() == "local" else number
+
+
+def rerank_hashtags(candidates: list[str], post: str, number: int) -> list[str]:
+    """
+    The `number` candidates mentioned the most by the post. Mentions of the whole tag come first, and tags like
+    `#서울소고기맛집` which aren't written as is are ranked by their two-letter pieces found in the post.
+    Ties keep the order of the candidates, and duplicates are dropped.
+    """
+    unique: dict[str, str] = {}
+    for candidate in candidates:
+        unique.setdefault(_term(candidate), candidate)
+    if hashtag_rerank_mode() == "none":
+        return list(unique.values())[:number]
+    compact: str = "".join(post.split()).lower()
+    scores: dict[str, float] = {term: _score(term, compact) for term in unique}
+    ranked: list[str] = sorted(unique, key=lambda term: -scores[term])
+    return [unique[term] for term in ranked[:number]]
+
+
+def _term(hashtag: str) -> str:
+    return "".join(hashtag.strip("# ").split()).lower()
+
+
+def _score(term: str, post: str) -> float:
+    if not term:
+        return 0.0
+    if mentions := post.count(term):
+        return float(mentions) + 1
+    pieces: set[str] = {term[idx : idx + 2] for idx in range(len(term) - 1)} or {term}
+    return sum(1 for piece in pieces if piece in post) / len(pieces)
@@ -0,0 +1,246 @@
+"""
+Background jobs of posts and reviews.
+Pages submit jobs and follow their events instead of running pipelines in their script threads, so reruns and refreshes
+reattach to running jobs. Jobs are stored in SQLite, and finished jobs survive restarts.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Iterator
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from blog_agent.agent.batch import BatchRecord, BatchResult
+from blog_agent.agent.llm import run_in_background
+from blog_agent.agent.post import PostEvent, PostGuide, WritingMode, afind_restaurant, astream_post
+from blog_agent.agent.review import Review, ReviewEvent, ReviewGuide, astream_product_review
+from blog_agent.agent.telemetry import StageSummary, Tracer
+
+_logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+class JobSettings(BaseModel):
+    """
+    Limits of the job queue.
+    - workers: Max jobs running at the same time across all users.
+    - jobs_per_user: Max jobs of a user running at the same time. Other jobs of the user wait in the queue.
+    - queue_per_user: Max unfinished jobs of a user. More submissions are rejected.
+    - path: SQLite file of jobs.
+    """
+
+    workers: int = Field(default=4, ge=1)
+    jobs_per_user: int = Field(default=1, ge=1)
+    queue_per_user: int = Field(default=3, ge=1)
+    path: str = Field(default="blog-agent-jobs.sqlite3")
+
+    @classmethod
+    def from_env(cls) -> "JobSettings":
+        env = {
+            "workers": os.getenv("BLOG_AGENT_JOB_WORKERS"),
+            "jobs_per_user": os.getenv("BLOG_AGENT_JOB_PER_USER"),
+            "queue_per_user": os.getenv("BLOG_AGENT_JOB_QUEUE_PER_USER"),
+            "path": os.getenv("BLOG_AGENT_JOB_STORE_PATH"),
+        }
+        return cls(**{key: value for key, value in env.items() if value is not None})
+
+
+class Job(BaseModel):
+    """A post or review written in the background. Events are kept to replay them to pages reattaching to the job."""
+
+    id: str
+    user: str
+    record: BatchRecord
+    mode: WritingMode = Field(default="sequential")
+    status: JobStatus = Field(default="queued")
+    events: list[PostEvent | ReviewEvent] = Field(default_factory=list)
+    stages: list[StageSummary] = Field(default_factory=list)
+    result: BatchResult | None = Field(default=None)
+    created_at: float = Field(default_factory=time.time)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+
+class JobLimitError(ValueError):
+    """The user has too many unfinished jobs."""
+
+
+class JobStore:
+    """Jobs in SQLite. Events of running jobs are kept in memory and stored when the job finishes."""
+
+    def __init__(self, path: str = "blog-agent-jobs.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs "
+                "(id TEXT PRIMARY KEY, user TEXT NOT NULL, status TEXT NOT NULL, job TEXT NOT NULL, updated_at REAL)"
+            )
+
+    def save(self, job: Job) -> None:
+        serialized: str = job.model_dump_json()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, user, status, job, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, job.user, job.status, serialized, time.time()),
+            )
+
+    def load(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._conn.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.model_validate_json(row[0]) if row is not None else None
+
+    def unfinished(self) -> list[Job]:
+        with self._lock:
+            rows = self._conn.execute("SELECT job FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [Job.model_validate_json(row[0]) for row in rows]
+
+
+class JobQueue:
+    """
+    Process-wide queue which runs jobs on the shared background loop.
+    Jobs which were unfinished when the process stopped are failed, because their events are lost.
+    """
+
+    def __init__(self, settings: JobSettings | None = None):
+        self.settings = settings or JobSettings.from_env()
+        self.store = JobStore(self.settings.path)
+        self._jobs: dict[str, Job] = {}
+        self._changed = threading.Condition()
+        self._workers = asyncio.Semaphore(self.settings.workers)
+        self._user_slots: defaultdict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.settings.jobs_per_user)
+        )
+        for job in self.store.unfinished():
+            job.status = "failed"
+            job.result = BatchResult(id=job.record.id, kind=job.record.kind, error="Interrupted by restart", elapsed=0)
+            self.store.save(job)
+
+    def submit(self, user: str, guide: PostGuide | ReviewGuide | BatchRecord, mode: WritingMode = "sequential") -> Job:
+        """
+        Queue the guide of the user.
+        The unfinished job of the same guide is returned instead, so submitting it again doesn't write it twice.
+        """
+        record: BatchRecord = BatchRecord.model_validate(guide)
+        with self._changed:
+            unfinished: list[Job] = [job for job in self._jobs.values() if job.user == user and not job.done]
+            for job in unfinished:
+                if job.record.id == record.id:
+                    return job
+            if len(unfinished) >= self.settings.queue_per_user:
+                raise JobLimitError(f"{user} already has {len(unfinished)} unfinished jobs")
+            job = Job(id=uuid.uuid4().hex, user=user, record=record, mode=mode)
+            self._jobs[job.id] = job
+        self.store.save(job)
+        log_msg: str = f"Queue {record.kind} job {job.id} of {user}"
+        _logger.info(log_msg)
+        run_in_background(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._changed:
+            if (job := self._jobs.get(job_id)) is not None:
+                return job
+        return self.store.load(job_id)
+
+    def follow(self, job_id: str) -> Iterator[PostEvent | ReviewEvent]:
+        """Yield events of the job from the first one until the job finishes"""
+        if (job := self.get(job_id)) is None:
+            return
+        sent: int = 0
+        while True:
+            with self._changed:
+                while len(job.events) <= sent and not job.done:
+                    self._changed.wait()
+                events: list[PostEvent | ReviewEvent] = job.events[sent:]
+                done: bool = job.done
+            sent += len(events)
+            yield from events
+            if done:
+                return
+
+    async def _run(self, job: Job) -> None:
+        async with self._user_slots[job.user], self._workers:
+            self._update(job, status="running")
+            started_at: float = time.perf_counter()
+            tracer = Tracer()
+            try:
+                result: BatchResult = await self._write(job, tracer)
+                result.elapsed = time.perf_counter() - started_at
+                status: JobStatus = "succeeded"
+            except Exception as e:
+                log_msg: str = f"Fail {job.record.kind} job {job.id}"
+                _logger.exception(log_msg)
+                result = BatchResult(
+                    id=job.record.id, kind=job.record.kind, error=repr(e), elapsed=time.perf_counter() - started_at
+                )
+                status = "failed"
+            self._update(job, status=status, result=result, stages=tracer.summary())
+        with self._changed:
+            # Finished jobs are read from the store.
+            del self._jobs[job.id]
+        log_msg = f"Finish {job.record.kind} job {job.id} as {status} in {result.elapsed:.2f}s"
+        _logger.info(log_msg)
+
+    async def _write(self, job: Job, tracer: Tracer) -> BatchResult:
+        record: BatchRecord = job.record
+        if isinstance(record.guide, ReviewGuide):
+            review: Review | None = None
+            async for event in astream_product_review(record.guide, tracer=tracer):
+                self._append(job, event)
+                review = event.review or review
+            return BatchResult(id=record.id, kind=record.kind, review=review, elapsed=0)
+
+        post_guide: PostGuide = record.guide
+        if not post_guide.restaurant:
+            post_guide = post_guide.with_restaurant(await afind_restaurant(post_guide.title, tracer))
+        post: str = ""
+        hashtags: list[str] = []
+        async for event in astream_post(post_guide, mode=job.mode, tracer=tracer, hashtags=True):
+            self._append(job, event)
+            if event.stage == "post":
+                post, hashtags = event.content, event.hashtags or []
+        return BatchResult(id=record.id, kind=record.kind, post=post, hashtags=hashtags, elapsed=0)
+
+    def _append(self, job: Job, event: PostEvent | ReviewEvent) -> None:
+        with self._changed:
+            job.events.append(event)
+            self._changed.notify_all()
+
+    def _update(self, job: Job, **changes) -> None:
+        with self._changed:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            # Followers see the change after it is stored.
+            self.store.save(job)
+            self._changed.notify_all()
+
+
+_lock = threading.Lock()
+_job_queue: JobQueue | None = None
+
+
+def get_job_queue() -> JobQueue:
+    """Queue shared by all sessions. It is configured by environments at first."""
+    global _job_queue
+    with _lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+
+def set_job_queue(queue: JobQueue | None) -> None:
+    global _job_queue
+    with _lock:
+        _job_queue = queue
@@ -0,0 +1,205 @@
+"""
+Length control of text responses.
+Models write Korean paragraphs shorter than asked, and every short paragraph costs another call. Observed letters per
+token and the ratio of written letters to asked letters are learned by model, so the prompt asks for enough letters to
+reach the target at once and `max_completion_tokens` is sized by the target instead of a fixed maximum.
+Statistics are kept in memory, or in a JSON file shared by runs when the path is given.
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+from typing import Any, Literal
+
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel, Field
+
+_logger = logging.getLogger(__name__)
+
+LengthControlMode = Literal["calibrated", "none"]
+LengthKind = Literal["paragraph", "continuation"]
+
+# Completion tokens of uncalibrated requests, and the upper bound of calibrated ones
+MAX_COMPLETION_TOKENS: dict[LengthKind, int] = {"paragraph": 2000, "continuation": 1000}
+
+
+class LengthStats(BaseModel):
+    """
+    Observed lengths of a model's text responses. Means are weighted to recent responses.
+    - chars_per_token: Letters per completion token. A hangul letter is about 2/3 tokens.
+    - fulfillment: Written letters / asked letters of responses which are not cut by `max_completion_tokens`.
+    """
+
+    samples: int = 0
+    chars_per_token: float = 1.5
+    fulfillment: float = 1.0
+
+
+class LengthTarget(BaseModel):
+    """
+    How to ask for the letter count.
+    - prompt_letter_count: Letters asked by the prompt. It is larger than the target when the model writes short.
+    - max_completion_tokens: Enough tokens for twice the asked letters.
+    """
+
+    model: str
+    kind: LengthKind
+    letter_count: int
+    prompt_letter_count: int
+    max_completion_tokens: int
+
+
+class LengthSettings(BaseModel):
+    """
+    - smoothing: Weight of a new response in the means after the first `1 / smoothing` responses.
+    - min_fulfillment: The asked letters are at most `1 / min_fulfillment` times of the target.
+    - headroom: `max_completion_tokens` covers this ratio of the asked letters.
+    - small_shortfall: Shortfalls up to this ratio of the target are filled by a continuation even when the policy
+      regenerates paragraphs.
+    - save_interval: Seconds to batch observations before the file is written.
+    """
+
+    smoothing: float = Field(default=0.2, gt=0, le=1)
+    min_fulfillment: float = Field(default=0.5, gt=0, le=1)
+    headroom: float = Field(default=2.0, ge=1)
+    small_shortfall: float = Field(default=0.3, ge=0, le=1)
+    save_interval: float = Field(default=5.0, ge=0)
+
+
+def length_control_mode() -> LengthControlMode:
+    """`calibrated`(default) asks by learned statistics. `none` asks for the target with a fixed maximum like before."""
+    mode: LengthControlMode = os.getenv("BLOG_AGENT_LENGTH_CONTROL", "calibrated")  # type: ignore[assignment]
+    if mode not in ("calibrated", "none"):
+        raise ValueError(f"Invalid length control: {mode}")
+    return mode
+
+
+class LengthController:
+    """
+    Observations are made on the event loop after every response, so the file is written by a timer thread once per
+    `save_interval`, and at exit.
+    """
+
+    def __init__(self, path: str | None = None, settings: LengthSettings | None = None):
+        self.path = path
+        self.settings = settings or LengthSettings()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._stats: dict[str, LengthStats] = {}
+        self._timer: threading.Timer | None = None
+        if path is not None:
+            if os.path.exists(path):
+                self._load(path)
+            atexit.register(self.flush)
+
+    def stats(self, model: str, kind: LengthKind = "paragraph") -> LengthStats:
+        with self._lock:
+            return self._stats.get(_key(model, kind), LengthStats()).model_copy()
+
+    def target(self, model: str, letter_count: int, kind: LengthKind = "paragraph") -> LengthTarget:
+        if length_control_mode() == "none":
+            return LengthTarget(
+                model=model,
+                kind=kind,
+                letter_count=letter_count,
+                prompt_letter_count=letter_count,
+                max_completion_tokens=MAX_COMPLETION_TOKENS[kind],
+            )
+        stats: LengthStats = self.stats(model, kind)
+        fulfillment: float = min(max(stats.fulfillment, self.settings.min_fulfillment), 1.0)
+        prompt_letter_count: int = math.ceil(letter_count / fulfillment)
+        tokens: int = math.ceil(prompt_letter_count * self.settings.headroom / stats.chars_per_token)
+        return LengthTarget(
+            model=model,
+            kind=kind,
+            letter_count=letter_count,
+            prompt_letter_count=prompt_letter_count,
+            # Tokens are rounded up to hundreds, so chat models and chains are shared by similar targets.
+            max_completion_tokens=min(max(math.ceil(tokens / 100) * 100, 200), MAX_COMPLETION_TOKENS[kind]),
+        )
+
+    def is_small_shortfall(self, letter_count: int, letters: int) -> bool:
+        return letter_count - letters <= self.settings.small_shortfall * letter_count
+
+    def observe(self, target: LengthTarget, message: BaseMessage) -> None:
+        """Learn from the response to the target. Responses cut by `max_completion_tokens` only teach letters per token."""
+        letters: int = len(str(message.content))
+        tokens: int = (getattr(message, "usage_metadata", None) or {}).get("output_tokens", 0)
+        if not letters or not tokens:
+            return
+        truncated: bool = (
+            message.response_metadata.get("finish_reason") == "length" or tokens >= target.max_completion_tokens
+        )
+        with self._lock:
+            stats: LengthStats = self._stats.setdefault(_key(target.model, target.kind), LengthStats())
+            weight: float = max(self.settings.smoothing, 1 / (stats.samples + 1))
+            stats.chars_per_token += weight * (letters / tokens - stats.chars_per_token)
+            if not truncated:
+                stats.fulfillment += weight * (letters / target.prompt_letter_count - stats.fulfillment)
+            stats.samples += 1
+            log_msg: str = (
+                f"{target.kind.capitalize()} of {letters}/{target.prompt_letter_count} letters by {target.model}: "
+                f"{stats.chars_per_token:.2f} letters per token, {stats.fulfillment:.0%} fulfillment"
+            )
+            if self.path is not None and self._timer is None:
+                self._timer = threading.Timer(self.settings.save_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        _logger.debug(log_msg)
+
+    def flush(self) -> None:
+        """Write observations waiting for the timer"""
+        # Writes are serialized, so an older snapshot never replaces a newer one.
+        with self._save_lock:
+            with self._lock:
+                if self.path is None or self._timer is None:
+                    return
+                self._timer.cancel()
+                self._timer = None
+                entries: dict[str, Any] = {key: stats.model_dump() for key, stats in self._stats.items()}
+            self._save(self.path, entries)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path, encoding="utf-8") as fd:
+                entries: dict[str, Any] = json.load(fd)
+        except ValueError:
+            log_msg: str = f"Ignore invalid length statistics: {path}"
+            _logger.warning(log_msg)
+            return
+        self._stats = {key: LengthStats.model_validate(value) for key, value in entries.items()}
+
+    def _save(self, path: str, entries: dict[str, Any]) -> None:
+        # Replacing the file keeps it valid when the process stops while writing.
+        with open(f"{path}.tmp", "w", encoding="utf-8") as fd:
+            json.dump(entries, fd)
+        os.replace(f"{path}.tmp", path)
+
+
+def _key(model: str, kind: LengthKind) -> str:
+    return f"{model}:{kind}"
+
+
+_lock = threading.Lock()
+_controller: LengthController | None = None
+
+
+def get_length_controller() -> LengthController:
+    """Controller shared by the process"""
+    global _controller
+    with _lock:
+        if _controller is None:
+            _controller = LengthController(path=os.getenv("BLOG_AGENT_LENGTH_STATS_PATH"))
+        return _controller
+
+
+def set_length_controller(controller: LengthController | None) -> None:
+    """Change the controller. `None` builds it from environments again."""
+    global _controller
+    with _lock:
+        previous, _controller = _controller, controller
+    if previous is not None:
+        previous.flush()
@@ -0,0 +1,121 @@
+"""
+Local lint of post drafts by the mechanical rules of the feedback prompt.
+Greetings, prohibited expressions, lengths, keywords and the closing about the restaurant are checked without LLM
+calls. Drafts without violations skip the feedback and revision calls, and other drafts are revised only by their
+violations. Tone, tense and subjects are not checked, so the lint is opt-in.
+"""
+
+import math
+import os
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from blog_agent.agent.lookup import AhoCorasick
+
+FeedbackMode = Literal["lint", "llm"]
+LintRule = Literal["greeting", "prohibited", "length", "keywords", "closing"]
+
+PROHIBITED_EXPRESSIONS: tuple[str, ...] = ("추천", "너무", "정말", "특별한", "최고")
+LETTERS_PER_KEYWORD = 300
+# The closing is the last letters of the conclusion, which should mention the restaurant.
+CLOSING_LETTERS = 200
+
+
+def feedback_mode() -> FeedbackMode:
+    """`llm`(default) asks LLMs for feedback. `lint` feedbacks drafts by local rules without checking tone and tense."""
+    mode: FeedbackMode = os.getenv("BLOG_AGENT_FEEDBACK", "llm")  # type: ignore[assignment]
+    if mode not in ("lint", "llm"):
+        raise ValueError(f"Invalid feedback mode: {mode}")
+    return mode
+
+
+def greeting(restaurant: str) -> str:
+    return f"안녕하세요, 오늘 소개해드릴 곳은 {restaurant}입니다!"
+
+
+class Violation(BaseModel):
+    paragraph: str  # introduction, body 1, ..., conclusion or overall
+    rule: LintRule
+    advise: str
+
+
+class LintReport(BaseModel):
+    violations: list[Violation] = Field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.violations
+
+    def of(self, paragraph: str) -> list[Violation]:
+        return [violation for violation in self.violations if violation.paragraph == paragraph]
+
+    def score(self, paragraph: str) -> int:
+        """10 without violations, and 2 less by each violation"""
+        return max(10 - 2 * len(self.of(paragraph)), 0)
+
+
+def lint_paragraphs(
+    paragraphs: list[tuple[str, str, int]], *, restaurant: str | None, keywords: list[str], max_length: int
+) -> LintReport:
+    """
+    Lint `(name, paragraph, letter_count)` of a post. The first paragraph is the introduction and the last one is the
+    conclusion. Keywords should be used once per 300 letters of each paragraph.
+    """
+    automaton: AhoCorasick[bool] = AhoCorasick()
+    for keyword in keywords:
+        if keyword:
+            automaton.add(keyword, True)
+    for expression in PROHIBITED_EXPRESSIONS:
+        automaton.add(expression, False)
+
+    report = LintReport()
+    for idx, (name, paragraph, letter_count) in enumerate(paragraphs):
+        if idx == 0 and restaurant and not paragraph.startswith(greeting(restaurant)):
+            report.violations.append(
+                Violation(paragraph=name, rule="greeting", advise=f'Start with "{greeting(restaurant)}".')
+            )
+        if len(paragraph) < letter_count:
+            report.violations.append(
+                Violation(
+                    paragraph=name,
+                    rule="length",
+                    advise=f"Write longer than {letter_count} letters. It is {len(paragraph)} letters now.",
+                )
+            )
+        used_keywords: int = 0
+        prohibited: list[str] = []
+        for start, end, is_keyword in automaton.search(paragraph):
+            if is_keyword:
+                used_keywords += 1
+            elif paragraph[start:end] not in prohibited:
+                prohibited.append(paragraph[start:end])
+        if prohibited:
+            report.violations.append(
+                Violation(
+                    paragraph=name,
+                    rule="prohibited",
+                    advise=f"Remove prohibited expressions: {', '.join(prohibited)}.",
+                )
+            )
+        if keywords and used_keywords < (needed := max(math.ceil(len(paragraph) / LETTERS_PER_KEYWORD), 1)):
+            report.violations.append(
+                Violation(
+                    paragraph=name,
+                    rule="keywords",
+                    advise=f"Use keywords({', '.join(keywords)}) {needed} times or more. They are used {used_keywords} times now.",
+                )
+            )
+        if idx == len(paragraphs) - 1 and restaurant and restaurant not in paragraph[-CLOSING_LETTERS:]:
+            report.violations.append(
+                Violation(paragraph=name, rule="closing", advise=f"End with sentences about visiting {restaurant}.")
+            )
+    if (length := sum(len(paragraph) for _, paragraph, _ in paragraphs)) < max_length:
+        report.violations.append(
+            Violation(
+                paragraph="overall",
+                rule="length",
+                advise=f"The post should be longer than {max_length} letters. It is {length} letters now.",
+            )
+        )
+    return report
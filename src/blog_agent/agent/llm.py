@@ -0,0 +1,314 @@
+"""
+Shared LLM clients and prompt chains.
+Chat models are built once per (model, temperature, max_completion_tokens, schema) key and share one pooled HTTP client.
+They are built by the chat model provider, OpenAI by default.
+`langchain_openai` and `openai` take most of the import time, so they are imported when the first OpenAI model is built.
+`langchain_core` and `httpx` are imported at the top, because the tracer and the rate limiter load them anyway.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import threading
+import weakref
+from collections.abc import AsyncIterator, Callable, Coroutine, Iterable, Iterator
+from typing import Any
+
+import httpx
+from langchain_core.caches import BaseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel, Field
+
+from blog_agent.agent.cache import get_llm_cache
+from blog_agent.agent.ratelimit import RateLimitedChatModel, aobserve_response, observe_response
+
+_logger = logging.getLogger(__name__)
+
+ChatModelProvider = Callable[..., BaseChatModel]
+"""Build a chat model by `(model, *, temperature, max_completion_tokens, cache)`"""
+
+
+class HttpPoolSettings(BaseModel):
+    """Connection pool of the HTTP client shared by all chat models"""
+
+    max_connections: int = Field(default=100, ge=1)
+    max_keepalive_connections: int = Field(default=20, ge=0)
+    keepalive_expiry: float = Field(default=60.0, ge=0)  # seconds
+
+    @classmethod
+    def from_env(cls) -> "HttpPoolSettings":
+        env = {
+            "max_connections": os.getenv("BLOG_AGENT_HTTP_MAX_CONNECTIONS"),
+            "max_keepalive_connections": os.getenv("BLOG_AGENT_HTTP_MAX_KEEPALIVE_CONNECTIONS"),
+            "keepalive_expiry": os.getenv("BLOG_AGENT_HTTP_KEEPALIVE_EXPIRY"),
+        }
+        return cls(**{key: value for key, value in env.items() if value is not None})
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class LoopBoundTransport(httpx.AsyncBaseTransport):
+    """
+    Transport which sends requests by a transport of the running event loop.
+    Async connections are bound to the loop which opened them, so each loop has its own pool. Pools of closed loops are
+    dropped with their loops.
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport]):
+        self._factory = factory
+        self._transports: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        with self._lock:
+            if (transport := self._transports.get(loop)) is None:
+                transport = self._transports[loop] = self._factory()
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close the pool of the running loop. Pools of other loops can't be closed from this loop."""
+        with self._lock:
+            transport: httpx.AsyncBaseTransport | None = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+_lock = threading.RLock()
+_pool_settings: HttpPoolSettings | None = None
+_http_client: httpx.Client | None = None
+_async_http_client: httpx.AsyncClient | None = None
+_provider: ChatModelProvider | None = None
+_chat_models: dict[tuple, BaseChatModel] = {}
+_structured_models: dict[tuple, Runnable] = {}
+_chain_factories: list[Any] = []
+
+
+def configure_http_pool(settings: HttpPoolSettings) -> None:
+    """Change the connection pool. Models and chains built before are dropped."""
+    global _pool_settings
+    with _lock:
+        reset()
+        _pool_settings = settings
+
+
+def http_pool_settings() -> HttpPoolSettings:
+    global _pool_settings
+    with _lock:
+        if _pool_settings is None:
+            _pool_settings = HttpPoolSettings.from_env()
+        return _pool_settings
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=http_pool_settings().limits(), event_hooks={"response": [observe_response]}
+            )
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Async client shared by all chat models. Its connections are pooled per event loop by `LoopBoundTransport`,
+    so models built once can be called from any loop. Sync callers should use `run_sync` to reuse the background loop.
+    """
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            limits: httpx.Limits = http_pool_settings().limits()
+            _async_http_client = httpx.AsyncClient(
+                transport=LoopBoundTransport(lambda: httpx.AsyncHTTPTransport(limits=limits)),
+                event_hooks={"response": [aobserve_response]},
+            )
+        return _async_http_client
+
+
+@functools.cache
+def _rate_limited_chat_openai() -> type[BaseChatModel]:
+    from langchain_openai import ChatOpenAI
+
+    class RateLimitedChatOpenAI(RateLimitedChatModel, ChatOpenAI):
+        """OpenAI chat model behind the process-wide rate limiter of its model"""
+
+    return RateLimitedChatOpenAI
+
+
+def openai_chat_model(
+    model: str, *, temperature: float, max_completion_tokens: int, cache: BaseCache | bool
+) -> BaseChatModel:
+    return _rate_limited_chat_openai()(
+        model=model,
+        temperature=temperature,
+        max_completion_tokens=max_completion_tokens,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        cache=cache,
+        stream_usage=True,
+    )
+
+
+def provider_from_env() -> ChatModelProvider:
+    provider: str = os.getenv("BLOG_AGENT_LLM_PROVIDER", "openai")
+    match provider:
+        case "openai":
+            return openai_chat_model
+        case "fake":
+            from blog_agent.agent.fake import FakeChatModelSettings
+
+            return FakeChatModelSettings.from_env().provider()
+        case _:
+            raise ValueError(f"Invalid chat model provider: {provider}")
+
+
+def preload() -> None:
+    """
+    Import the OpenAI stack now instead of at the first generation.
+    Forking servers call it before forking, so workers share the imported modules.
+    """
+    if _provider is None and os.getenv("BLOG_AGENT_LLM_PROVIDER", "openai") == "openai":
+        _rate_limited_chat_openai()
+
+
+def set_chat_model_provider(provider: ChatModelProvider | None) -> None:
+    """Change the provider. `None` restores the provider of environments. Chat models built before are dropped."""
+    global _provider
+    with _lock:
+        _provider = provider
+    reset()
+
+
+def chat_model(model: str, *, temperature: float, max_completion_tokens: int, cache: bool = True) -> BaseChatModel:
+    """`cache=False` opts out of the response cache. Creative steps use it to keep variety."""
+    global _provider
+    key = (model, temperature, max_completion_tokens, cache)
+    with _lock:
+        if (llm := _chat_models.get(key)) is None:
+            log_msg: str = f"Build chat model: {key}"
+            _logger.info(log_msg)
+            if _provider is None:
+                _provider = provider_from_env()
+            llm = _provider(
+                model,
+                temperature=temperature,
+                max_completion_tokens=max_completion_tokens,
+                cache=(get_llm_cache() or False) if cache else False,
+            )
+            _chat_models[key] = llm
+        return llm
+
+
+def structured_chat_model(
+    schema: type,
+    *,
+    model: str,
+    temperature: float,
+    max_completion_tokens: int,
+    method: str = "function_calling",
+    cache: bool = True,
+) -> Runnable:
+    key = (model, temperature, max_completion_tokens, schema, method, cache)
+    with _lock:
+        if (llm := _structured_models.get(key)) is None:
+            llm = chat_model(
+                model, temperature=temperature, max_completion_tokens=max_completion_tokens, cache=cache
+            ).with_structured_output(schema, method=method)
+            _structured_models[key] = llm
+        return llm
+
+
+@functools.cache
+def prompt_template(*messages: tuple[str, str], placeholder: str | None = None) -> ChatPromptTemplate:
+    """
+    Template of `(role, prompt)` messages followed by the placeholder of messages, parsed once per process.
+    Chains of every model and token limit share it, and it is kept by `reset`.
+    """
+    return ChatPromptTemplate.from_messages(
+        [*messages, *([MessagesPlaceholder(placeholder)] if placeholder is not None else [])]
+    )
+
+
+def cached_chain[**P](factory: Callable[P, Runnable]) -> Callable[P, Runnable]:
+    """Build the chain once per arguments. Its template and model are reused by every call."""
+    cached = functools.cache(factory)
+    _chain_factories.append(cached)
+    return cached
+
+
+def reset() -> None:
+    """Drop every model and chain, and close the shared HTTP clients."""
+    global _http_client, _async_http_client
+    with _lock:
+        for factory in _chain_factories:
+            factory.cache_clear()
+        _chat_models.clear()
+        _structured_models.clear()
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        # Pools of the async client are bound to loops which may be already closed, so they are left to the garbage
+        # collector with their loops.
+        _async_http_client = None
+
+
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="blog-agent-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync[T](coro: Coroutine[Any, Any, T]) -> T:
+    """Run the coroutine on the shared background loop, so pooled async connections are reused across calls."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def run_in_background[T](coro: Coroutine[Any, Any, T]) -> concurrent.futures.Future[T]:
+    """Schedule the coroutine on the shared background loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop())
+
+
+async def cancel_tasks(tasks: Iterable[asyncio.Future[Any]]) -> None:
+    """Cancel the tasks and wait until they stop, so their LLM calls don't outlive the cancelled caller."""
+    tasks = list(tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iterate_sync[T](iterator: AsyncIterator[T]) -> Iterator[T]:
+    """Iterate the async iterator on the shared background loop."""
+
+    async def _next() -> T:
+        return await anext(iterator)
+
+    try:
+        while True:
+            try:
+                yield run_sync(_next())
+            except StopAsyncIteration:
+                return
+    finally:
+        if (aclose := getattr(iterator, "aclose", None)) is not None:
+            run_sync(aclose())
@@ -0,0 +1,209 @@
+"""
+Local lookup of restaurants and product keywords.
+Quoted names and known names are found without LLM calls. Known names are matched by an Aho-Corasick automaton over
+normalized texts, so names written with different spaces or punctuation still match.
+Every LLM answer is added to the index, so repeated restaurants and products skip LLM calls. Quoted names are guesses,
+so they are added after they are quoted by different titles.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from collections.abc import Iterator
+from typing import Any, Literal
+
+_logger = logging.getLogger(__name__)
+
+LookupBackend = Literal["local", "none"]
+LookupSource = Literal["quoted", "gazetteer", "llm"]
+
+# `[...]` and `<...>` aren't quotes. Titles use them for regions and tags, like `[서울/강남]` and `<내돈내산>`.
+_QUOTED_NAME = re.compile(r"[\"“「『《]([^\"“”「」『』《》]{2,30})[\"”」』》]")
+_IGNORED = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Text without spaces, punctuation and cases"""
+    return _IGNORED.sub("", text.casefold())
+
+
+def _word_bounds(text: str) -> set[int]:
+    """Offsets of the normalized text where words of the text start or end"""
+    bounds: set[int] = {0}
+    offset: int = 0
+    for word in _IGNORED.split(text.casefold()):
+        offset += len(word)
+        bounds.add(offset)
+    return bounds
+
+
+def quoted_name(title: str) -> str | None:
+    """The first quoted name of the title, like `"소고기 천국"` or `「소고기 천국」`"""
+    match = _QUOTED_NAME.search(title)
+    return match.group(1).strip() if match else None
+
+
+class AhoCorasick[V]:
+    """Automaton which finds all patterns in a text by one scan. Fail links are rebuilt lazily after patterns are added."""
+
+    def __init__(self):
+        self._goto: list[dict[str, int]] = [{}]
+        self._patterns: list[tuple[int, V] | None] = [None]
+        self._fail: list[int] = [0]
+        self._outputs: list[list[tuple[int, V]]] = [[]]
+        self._is_built: bool = True
+
+    def __len__(self) -> int:
+        return sum(pattern is not None for pattern in self._patterns)
+
+    def add(self, pattern: str, value: V) -> None:
+        node: int = 0
+        for letter in pattern:
+            if (next_node := self._goto[node].get(letter)) is None:
+                next_node = len(self._goto)
+                self._goto[node][letter] = next_node
+                self._goto.append({})
+                self._patterns.append(None)
+            node = next_node
+        self._patterns[node] = (len(pattern), value)
+        self._is_built = False
+
+    def search(self, text: str) -> Iterator[tuple[int, int, V]]:
+        """Yield `(start, end, value)` of every pattern in the text"""
+        if not self._is_built:
+            self._build()
+        node: int = 0
+        for end, letter in enumerate(text, start=1):
+            while node and letter not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(letter, 0)
+            for length, value in self._outputs[node]:
+                yield end - length, end, value
+
+    def _build(self) -> None:
+        self._fail = [0] * len(self._goto)
+        self._outputs = [[pattern] if pattern is not None else [] for pattern in self._patterns]
+        queue: deque[int] = deque(self._goto[0].values())
+        while queue:
+            node: int = queue.popleft()
+            for letter, child in self._goto[node].items():
+                fail: int = self._fail[node]
+                while fail and letter not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(letter, 0)
+                self._outputs[child] += self._outputs[self._fail[child]]
+                queue.append(child)
+        self._is_built = True
+
+
+class LookupIndex[V]:
+    """
+    Values by known names. Names are normalized and names shorter than 2 letters are ignored.
+    When the path is given, entries are loaded from and appended to the JSONL file.
+    """
+
+    def __init__(self, name: str, path: str | None = None):
+        self.name = name
+        self.path = path
+        self._lock = threading.Lock()
+        self._automaton: AhoCorasick[V] = AhoCorasick()
+        self._values: dict[str, V] = {}
+        self._suggestions: dict[str, set[str]] = {}
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._values)
+
+    def add(self, key: str, value: V) -> None:
+        if len(normalized := normalize(key)) < 2:
+            return
+        with self._lock:
+            if self._values.get(normalized) == value:
+                return
+            self._set(normalized, value)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as fd:
+                    fd.write(json.dumps({"index": self.name, "key": key, "value": value}, ensure_ascii=False) + "\n")
+
+    def suggest(self, key: str, value: V, source: str, confirmations: int = 2) -> None:
+        """Add the name after it is suggested by `confirmations` different sources, like quoted names of titles"""
+        if len(normalized := normalize(key)) < 2:
+            return
+        with self._lock:
+            if normalized in self._values:
+                return
+            sources: set[str] = self._suggestions.setdefault(normalized, set())
+            sources.add(source)
+            if len(sources) < confirmations:
+                return
+            del self._suggestions[normalized]
+        self.add(key, value)
+
+    def get(self, key: str) -> V | None:
+        with self._lock:
+            return self._values.get(normalize(key))
+
+    def longest_match(self, text: str, min_coverage: float = 0.0, whole_words: bool = False) -> V | None:
+        """
+        Value of the longest known name in the text.
+        - min_coverage: Min ratio of the name's length to the text's length, to ignore short names in long texts.
+        - whole_words: Ignore names starting or ending inside words, like `명동` in `명동교자 본점`.
+        """
+        normalized: str = normalize(text)
+        with self._lock:
+            matches: list[tuple[int, int, V]] = list(self._automaton.search(normalized))
+        if whole_words:
+            bounds: set[int] = _word_bounds(text)
+            matches = [match for match in matches if match[0] in bounds and match[1] in bounds]
+        if not matches:
+            return None
+        start, end, value = max(matches, key=lambda match: (match[1] - match[0], -match[0]))
+        return value if (end - start) >= min_coverage * len(normalized) else None
+
+    def _set(self, normalized: str, value: V) -> None:
+        self._values[normalized] = value
+        self._automaton.add(normalized, value)
+
+    def _load(self, path: str) -> None:
+        with open(path, encoding="utf-8") as fd:
+            for line in fd:
+                try:
+                    entry: dict[str, Any] = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("index") == self.name and len(normalized := normalize(entry["key"])) >= 2:
+                    self._set(normalized, entry["value"])
+        log_msg: str = f"Loaded {len(self._values)} entries of {self.name} index from {path}"
+        _logger.info(log_msg)
+
+
+def lookup_backend() -> LookupBackend:
+    """`local`(default) looks up names before LLM calls. `none` always calls LLMs like before."""
+    backend: LookupBackend = os.getenv("BLOG_AGENT_LOOKUP", "local")  # type: ignore[assignment]
+    if backend not in ("local", "none"):
+        raise ValueError(f"Invalid lookup backend: {backend}")
+    return backend
+
+
+_lock = threading.Lock()
+_indexes: dict[str, LookupIndex] = {}
+
+
+def get_index(name: Literal["restaurant", "keywords"]) -> LookupIndex | None:
+    """Index shared by the process. It is `None` when the lookup is off."""
+    if lookup_backend() == "none":
+        return None
+    with _lock:
+        if name not in _indexes:
+            _indexes[name] = LookupIndex(name, path=os.getenv("BLOG_AGENT_LOOKUP_PATH"))
+        return _indexes[name]
+
+
+def reset_indexes() -> None:
+    with _lock:
+        _indexes.clear()
@@ -1,13 +1,49 @@
+import asyncio
 import logging
-from typing import Self, TypedDict
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any, Literal, Self, TypedDict
 
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.runnables import Runnable
 from pydantic import BaseModel, Field
 
+from blog_agent.agent.context import CompactionMode, RollingContext, compaction_mode, dump_json, estimate_tokens
+from blog_agent.agent.hashtags import candidate_number, rerank_hashtags
+from blog_agent.agent.length import LengthController, LengthTarget, get_length_controller
+from blog_agent.agent.lint import LintReport, feedback_mode, lint_paragraphs
+from blog_agent.agent.llm import (
+    cached_chain,
+    cancel_tasks,
+    chat_model,
+    iterate_sync,
+    prompt_template,
+    run_sync,
+    structured_chat_model,
+)
+from blog_agent.agent.lookup import get_index, quoted_name
+from blog_agent.agent.retry import RetryBudget, RetryPolicy
+from blog_agent.agent.routing import route
+from blog_agent.agent.speculation import record_speculation, same_subject, speculative_planning
+from blog_agent.agent.store import get_post_store, guide_key
+from blog_agent.agent.telemetry import (
+    ASKED_LETTERS,
+    LINT_VIOLATIONS,
+    LOOKUP,
+    REGENERATIONS,
+    RETRIES,
+    SAVED_TOKENS,
+    SPECULATION,
+    Span,
+    Tracer,
+)
+from blog_agent.logs import payload
+
 _logger = logging.getLogger(__name__)
 
+WritingMode = Literal["sequential", "parallel", "graph"]
+PostStage = Literal["plan", "paragraph", "feedback", "revision", "retry", "post"]
+
 
 class PostGuide(BaseModel):
     title: str
@@ -62,7 +98,77 @@ class Feedback(BaseModel):
     overall: FeedbackDetail
 
 
-def find_restaurant(title: str) -> str:
+class PostEvent(BaseModel):
+    """
+    Progress of writing the post.
+    - plan: The plan is ready.
+    - paragraph: A paragraph of the draft is written. It has the index of the paragraph in the draft.
+    - feedback: The draft is reviewed. It has the draft.
+    - revision: A token of the revised post is streamed.
+    - retry: The revised post is too short, so it is revised again.
+    - post: The final post is written. It has hashtags when the pipeline is asked for them.
+    """
+
+    stage: PostStage
+    content: str = Field(default="")
+    index: int | None = Field(default=None)
+    plan: WritingPlan | None = Field(default=None)
+    feedback: Feedback | None = Field(default=None)
+    draft: Draft | None = Field(default=None)
+    hashtags: list[str] | None = Field(default=None)
+
+
+class PostRecord(BaseModel):
+    """The post of the guide and its intermediate results, stored to answer the same guide without writing it again"""
+
+    post_guide: PostGuide
+    plan: WritingPlan | None = Field(default=None)
+    draft: Draft | None = Field(default=None)
+    feedback: Feedback | None = Field(default=None)
+    post: str = Field(default="")
+    hashtags: list[str] | None = Field(default=None)
+
+
+def find_restaurant(title: str, tracer: Tracer | None = None) -> str:
+    """Sync version of `afind_restaurant`."""
+    return run_sync(afind_restaurant(title, tracer))
+
+
+async def afind_restaurant(title: str, tracer: Tracer | None = None) -> str:
+    """Find the restaurant by its quoted name or known names in the title. LLM is asked only when both miss."""
+    tracer = tracer or Tracer()
+    with tracer.span("restaurant") as span:
+        # Names learned by the index are appended to its file, so the index is used off the loop.
+        if (restaurant := await asyncio.to_thread(_lookup_restaurant, title, span)) is not None:
+            return restaurant
+        response: dict[str, str] = await _find_restaurant_chain(route(span)).ainvoke(
+            {"title": title}, tracer.config(span)
+        )
+        await asyncio.to_thread(_remember_restaurant, response["restaurant"], span)
+    return response["restaurant"]
+
+
+def _lookup_restaurant(title: str, span: Span) -> str | None:
+    if (index := get_index("restaurant")) is None:
+        return None
+    if restaurant := quoted_name(title):
+        span.attributes[LOOKUP] = "quoted"
+        index.suggest(restaurant, restaurant, source=title)
+        return restaurant
+    if restaurant := index.longest_match(title, whole_words=True):
+        span.attributes[LOOKUP] = "gazetteer"
+        return restaurant
+    return None
+
+
+def _remember_restaurant(restaurant: str, span: Span) -> None:
+    span.attributes[LOOKUP] = "llm"
+    if (index := get_index("restaurant")) is not None:
+        index.add(restaurant, restaurant)
+
+
+@cached_chain
+def _find_restaurant_chain(model: str) -> Runnable:
     class Response(TypedDict):
         restaurant: str
 
@@ -79,21 +185,138 @@ Please do your best. Let's start!
 Title is here.
 {title}
 """.strip()
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-        ]
+    template = prompt_template(("system", system_prompt), ("human", human_prompt))
+    llm = structured_chat_model(
+        Response, model=model, temperature=0.52, max_completion_tokens=100, method="json_schema"
     )
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.52, max_completion_tokens=100)
-    chain = template | llm.with_structured_output(Response, method="json_schema")
-    response: Response = chain.invoke({"title": title})
-    return response["restaurant"]
+    return template | llm
+
+
+def plan_writing_post(
+    post_guide: PostGuide,
+    budget: RetryBudget | None = None,
+    on_plan: Callable[[WritingPlan], None] | None = None,
+) -> WritingPlan:
+    """Sync version of `aplan_writing_post`. `on_plan` is called in the background loop."""
+    return run_sync(aplan_writing_post(post_guide, budget, on_plan))
+
+
+async def aplan_writing_post(
+    post_guide: PostGuide,
+    budget: RetryBudget | None = None,
+    on_plan: Callable[[WritingPlan], None] | None = None,
+) -> WritingPlan:
+    """
+    Plan how to write the post. The plan needs to write long contents.
+    When retries run out, the plan closest to the post's length is used.
+    - on_plan: Called in the event loop with each plan as soon as it is answered, before the plan is validated.
+    """
+    budget = budget or RetryBudget()
+    with budget.tracer.span("plan") as span:
+        chain: Runnable = _plan_writing_post_chain(route(span))
+        prompt: dict[str, Any] = _plan_writing_post_prompt(post_guide)
+        plans: list[WritingPlan] = []
+        while True:
+            res: WritingPlan = await chain.ainvoke(prompt, budget.config(span))
+            plans.append(res)
+            if on_plan is not None:
+                on_plan(res)
+            if not _retry_plan(post_guide, prompt, res, len(plans), budget):
+                break
+            await asyncio.sleep(budget.policy.backoff_seconds(len(plans)))
+        span.attributes[RETRIES] = len(plans) - 1
+    return _closest_plan(post_guide, plans)
+
+
+def _plan_writing_post_prompt(post_guide: PostGuide) -> dict[str, Any]:
+    return {
+        "messages": [],
+        "post_guide": post_guide.model_dump_json(indent=4, exclude=["restaurant", "max_length"]),
+        "restaurant": post_guide.restaurant,
+        "min_letter_count": post_guide.max_length - 100,
+        "max_letter_count": post_guide.max_length + 100,
+    }
 
 
-def plan_writing_post(post_guide: PostGuide) -> WritingPlan:
-    """Plan how to write the post. The plan needs to write long contents."""
+def _retry_plan(
+    post_guide: PostGuide, prompt: dict[str, Any], plan: WritingPlan, tries: int, budget: RetryBudget
+) -> bool:
+    """Whether the plan is planned again. Messages of the retry are added to the prompt."""
+    log_msg: str = f"Writing plan of {len(plan.bodies)} bodies"
+    _logger.info(log_msg, extra=payload(plan))
+    min_letter_count: int = prompt["min_letter_count"]
+    max_letter_count: int = prompt["max_letter_count"]
+    if min_letter_count <= (letter_count := _plan_letter_count(plan)) <= max_letter_count:
+        return False
+    log_msg = f"Plan's total letter count is invalid: {letter_count} not in [{min_letter_count}, {max_letter_count}]"
+    _logger.warning(log_msg)
+    if not budget.can_retry(tries):
+        return False
+    prompt["messages"].append(AIMessage(content=plan.model_dump_json()))
+    prompt["messages"].append(
+        HumanMessage(
+            content=f"The total length of all paragraphs is {letter_count}. The length should be between {min_letter_count} and {max_letter_count}."
+        )
+    )
+    return True
+
+
+def _closest_plan(post_guide: PostGuide, plans: list[WritingPlan]) -> WritingPlan:
+    return min(plans, key=lambda plan: abs(_plan_letter_count(plan) - post_guide.max_length))
+
+
+async def _aplan_with_speculation(
+    post_guide: PostGuide, budget: RetryBudget, span: Span | None = None
+) -> tuple[WritingPlan, asyncio.Task[str] | None]:
+    """
+    Plan the post while the introduction of the first plan is written concurrently.
+    The introduction is `None` when speculation is off or missed. A missed introduction is cancelled.
+    """
+    if not speculative_planning():
+        return await aplan_writing_post(post_guide, budget), None
+    speculated: list[WritingPlan] = []
+    introductions: list[asyncio.Task[str]] = []
+
+    def speculate(plan: WritingPlan) -> None:
+        speculated.append(plan)
+        if len(speculated) == 1:
+            introductions.append(
+                asyncio.ensure_future(_awrite_post_introduction(post_guide, plan.introduction, budget))
+            )
 
+    try:
+        plan: WritingPlan = await aplan_writing_post(post_guide, budget, on_plan=speculate)
+    except BaseException:
+        await cancel_tasks(introductions)
+        raise
+    (introduction,) = introductions
+    if _keep_speculation(speculated, plan, span):
+        return plan, introduction
+    await cancel_tasks([introduction])
+    return plan, None
+
+
+def _keep_speculation(speculated: list[WritingPlan], plan: WritingPlan, span: Span | None) -> bool:
+    """
+    Whether the introduction of the first plan is kept for the final plan.
+    Plans accepted without retries are not counted as hits, because they have nothing to speculate.
+    """
+    hit: bool = same_subject(speculated[0].introduction.subject, plan.introduction.subject)
+    if len(speculated) > 1:
+        record_speculation(hit)
+        if span is not None:
+            span.attributes[SPECULATION] = "hit" if hit else "miss"
+    return hit
+
+
+def _plan_letter_count(plan: WritingPlan) -> int:
+    return (
+        plan.introduction.letter_count + sum(body.letter_count for body in plan.bodies) + plan.conclution.letter_count
+    )
+
+
+@cached_chain
+def _plan_writing_post_chain(model: str) -> Runnable:
     system_prompt = """
 As a food columnist, your task is to plan how to write blog posts based on guidelines.
 The posts is written by reader's requests.
@@ -118,77 +341,459 @@ class WritingPlanDetail(TypedDict):
 Please do your best. Let's start!
 """.strip()
     human_prompt = "{post_guide}"
-    template = ChatPromptTemplate.from_messages(
-        [("system", system_prompt), ("human", human_prompt), MessagesPlaceholder("messages")]
-    )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=1000)
-    chain = template | llm.with_structured_output(WritingPlan)
+    template = prompt_template(("system", system_prompt), ("human", human_prompt), placeholder="messages")
+    llm = structured_chat_model(WritingPlan, model=model, temperature=0.52, max_completion_tokens=1000)
+    return template | llm
+
+
+def write_post(
+    post_guide: PostGuide,
+    mode: WritingMode = "sequential",
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+) -> str:
+    """
+    Sync version of `awrite_post`. The post is written on the background loop.
+    `graph` mode writes paragraphs concurrently by the checkpointed graph, so a failed run of the same guide resumes.
+    """
+    started_at: float = time.perf_counter()
+    result: str = ""
+    for event in stream_post(post_guide, mode=mode, policy=policy, tracer=tracer):
+        if event.stage == "post":
+            result = event.content
+    log_msg: str = f"Post is written in {time.perf_counter() - started_at:.2f}s by {mode} mode"
+    _logger.info(log_msg)
+    return result
 
-    min_letter_count = post_guide.max_length - 100
-    max_letter_count = post_guide.max_length + 100
-    prompt = {
-        "messages": [],
-        "post_guide": post_guide.model_dump_json(indent=4, exclude=["restaurant", "max_length"]),
-        "restaurant": post_guide.restaurant,
-        "min_letter_count": min_letter_count,
-        "max_letter_count": max_letter_count,
-    }
-    res: WritingPlan = chain.invoke(prompt)
-    log_msg: str = f"Writing Plan: {res.model_dump_json(indent=4)}"
+
+async def awrite_post(
+    post_guide: PostGuide,
+    mode: WritingMode = "parallel",
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+) -> str:
+    """
+    Write the post with a dependency-aware pipeline.
+    The introduction and body paragraphs only depend on the plan, so they are written concurrently.
+    The conclusion depends on the stitched paragraphs.
+    `sequential` and `graph` modes are also written in the event loop. Cancelling the task cancels its LLM calls.
+    """
+    result: str = ""
+    async for event in astream_post(post_guide, mode=mode, policy=policy, tracer=tracer):
+        if event.stage == "post":
+            result = event.content
+    return result
+
+
+async def awrite_post_with_hashtags(
+    post_guide: PostGuide,
+    mode: WritingMode = "parallel",
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+) -> tuple[str, list[str]]:
+    """`awrite_post` with hashtags, which are written from the draft while the draft is revised"""
+    async for event in astream_post(post_guide, mode=mode, policy=policy, tracer=tracer, hashtags=True):
+        if event.stage == "post":
+            return event.content, event.hashtags or []
+    return "", []
+
+
+def stream_post(
+    post_guide: PostGuide,
+    mode: WritingMode = "sequential",
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+    hashtags: bool = False,
+) -> Iterator[PostEvent]:
+    """
+    Write the post while yielding events of each stage. The last event is the final post.
+    Spans of stages and LLM calls are recorded by the tracer.
+    The post of the same guide is answered from the post store by replaying its events without LLM calls.
+    - hashtags: Write hashtags from the draft while it is reviewed and revised, and add them to the last event.
+    Events are written by `astream_post` on the background loop.
+    """
+    yield from iterate_sync(astream_post(post_guide, mode=mode, policy=policy, tracer=tracer, hashtags=hashtags))
+
+
+def _log_spent_tokens(budget: RetryBudget) -> None:
+    saved_tokens: int = sum(stage.saved_tokens for stage in budget.tracer.summary())
+    log_msg: str = f"Post spent {budget.total_tokens} tokens, and context compaction saved about {saved_tokens} tokens"
     _logger.info(log_msg)
-    letter_count = (
-        res.introduction.letter_count + sum(body.letter_count for body in res.bodies) + res.conclution.letter_count
-    )
-    while not (min_letter_count <= letter_count <= max_letter_count):
-        log_msg = (
-            f"Plan's total letter count is invalid: {letter_count} not in [{min_letter_count}, {max_letter_count}]"
+
+
+async def astream_post(
+    post_guide: PostGuide,
+    mode: WritingMode = "parallel",
+    policy: RetryPolicy | None = None,
+    tracer: Tracer | None = None,
+    hashtags: bool = False,
+) -> AsyncIterator[PostEvent]:
+    """
+    Write the post while yielding events of each stage. The last event is the final post.
+    Spans of stages and LLM calls are recorded by the tracer.
+    The post of the same guide is answered from the post store by replaying its events without LLM calls.
+    Paragraph events of `parallel` mode are yielded in the order of the plan.
+    - hashtags: Write hashtags from the draft while it is reviewed and revised, and add them to the last event.
+    """
+    tracer = tracer or Tracer()
+    if (record := await _aload_post(post_guide)) is not None:
+        with tracer.span("post", mode=mode) as span:
+            span.attributes[LOOKUP] = "store"
+            if hashtags and record.hashtags is None:
+                record.hashtags = await awrite_hashtags(record.post, post_guide, tracer)
+                await _asave_post(record)
+            for event in _stored_events(record, hashtags):
+                yield event
+        return
+    recorder = _PostRecorder(post_guide)
+    async for event in _astream_post(post_guide, mode, policy, tracer, hashtags):
+        await recorder.add(event)
+        yield event
+
+
+async def _astream_post(
+    post_guide: PostGuide, mode: WritingMode, policy: RetryPolicy | None, tracer: Tracer, hashtags: bool
+) -> AsyncIterator[PostEvent]:
+    if hashtags:
+        events: AsyncIterator[PostEvent] = _astream_post(post_guide, mode, policy, tracer, False)
+        async for event in _astream_with_hashtags(events, post_guide, tracer):
+            yield event
+        return
+    if mode == "sequential":
+        async for event in _astream_post_sequentially(post_guide, policy, tracer):
+            yield event
+        return
+    if mode == "graph":
+        from blog_agent.agent.graph import astream_post_graph
+
+        async for event in astream_post_graph(post_guide, policy=policy, tracer=tracer):
+            yield event
+        return
+
+    log_msg: str = f"Write post concurrently by the guide: {post_guide.title}"
+    _logger.info(log_msg, extra=payload(post_guide))
+    budget = RetryBudget(policy, tracer)
+    with budget.tracer.span("post", mode="parallel") as span:
+        plan, speculated = await _aplan_with_speculation(post_guide, budget, span)
+        yield PostEvent(stage="plan", plan=plan)
+
+        tasks: list[asyncio.Task[str]] = [
+            speculated
+            if speculated is not None
+            else asyncio.ensure_future(_awrite_post_introduction(post_guide, plan.introduction, budget)),
+            *(
+                asyncio.ensure_future(_awrite_post_body_by_plan(post_guide, plan, idx, budget))
+                for idx in range(len(plan.bodies))
+            ),
+        ]
+        try:
+            idx: int = 0
+            async for paragraph in _in_order(tasks):
+                yield PostEvent(stage="paragraph", content=paragraph, index=idx)
+                idx += 1
+        finally:
+            await cancel_tasks(tasks)
+        introduction, *bodies = [task.result() for task in tasks]
+        draft = Draft(
+            introduction=DraftDetail(plan=plan.introduction, paragraph=introduction),
+            bodies=[
+                DraftDetail(plan=body_plan, paragraph=body) for body_plan, body in zip(plan.bodies, bodies, strict=True)
+            ],
         )
+        context = RollingContext()
+        for detail in [draft.introduction, *draft.bodies]:
+            context.add(detail.plan.subject, detail.paragraph)
+
+        conclusion: str = await _awrite_post_conclusion(post_guide, plan.conclution, context, budget)
+        draft.conclusion = DraftDetail(plan=plan.conclution, paragraph=conclusion)
+        yield PostEvent(stage="paragraph", content=conclusion, index=len(plan.bodies) + 1)
+
+        feedback: Feedback = await _afeedback_draft(post_guide, draft, budget)
+        yield PostEvent(stage="feedback", feedback=feedback, draft=draft)
+        async for event in _astream_revised_draft(post_guide, draft, feedback, budget):
+            yield event
+    _log_spent_tokens(budget)
+
+
+async def _in_order(tasks: list[asyncio.Task[str]]) -> AsyncIterator[str]:
+    """Results of the tasks in their order. Early finishers wait for the tasks before them, but failures are raised."""
+    pending: set[asyncio.Task[str]] = set(tasks)
+    emitted: int = 0
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+        while emitted < len(tasks) and tasks[emitted].done():
+            yield tasks[emitted].result()
+            emitted += 1
+
+
+async def _astream_post_sequentially(
+    post_guide: PostGuide, policy: RetryPolicy | None, tracer: Tracer | None
+) -> AsyncIterator[PostEvent]:
+    """`sequential` mode of `astream_post`. Each paragraph is written with the rolling context of the paragraphs before."""
+    log_msg: str = f"Write post by the guide: {post_guide.title}"
+    _logger.info(log_msg, extra=payload(post_guide))
+    budget = RetryBudget(policy, tracer)
+    with budget.tracer.span("post", mode="sequential") as span:
+        plan, speculated = await _aplan_with_speculation(post_guide, budget, span)
+        try:
+            yield PostEvent(stage="plan", plan=plan)
+            introduction: str = (
+                await speculated
+                if speculated is not None
+                else await _awrite_post_introduction(post_guide, plan.introduction, budget)
+            )
+        finally:
+            # The speculative introduction isn't left running when the stream is closed after the plan.
+            if speculated is not None:
+                await cancel_tasks([speculated])
+        draft = Draft()
+
+        context = RollingContext()
+        context.add(plan.introduction.subject, introduction)
+        draft.introduction = DraftDetail(plan=plan.introduction, paragraph=introduction)
+        yield PostEvent(stage="paragraph", content=introduction, index=0)
+
+        for idx, body_plan in enumerate(plan.bodies, start=1):
+            body: str = await _awrite_post_body(post_guide, body_plan, context, budget)
+            context.add(body_plan.subject, body)
+            draft.bodies.append(DraftDetail(plan=body_plan, paragraph=body))
+            yield PostEvent(stage="paragraph", content=body, index=idx)
+
+        conclusion: str = await _awrite_post_conclusion(post_guide, plan.conclution, context, budget)
+        draft.conclusion = DraftDetail(plan=plan.conclution, paragraph=conclusion)
+        yield PostEvent(stage="paragraph", content=conclusion, index=len(plan.bodies) + 1)
+
+        feedback: Feedback = await _afeedback_draft(post_guide, draft, budget)
+        yield PostEvent(stage="feedback", feedback=feedback, draft=draft)
+        async for event in _astream_revised_draft(post_guide, draft, feedback, budget):
+            yield event
+    _log_spent_tokens(budget)
+
+
+async def _aload_post(post_guide: PostGuide) -> PostRecord | None:
+    if (store := get_post_store()) is None:
+        return None
+    # Calls of the store block on SQLite, so they are made off the loop.
+    if (record := await asyncio.to_thread(store.load, guide_key("post", post_guide), PostRecord)) is not None:
+        log_msg: str = f"Answer the post from the store: {post_guide.title}"
+        _logger.info(log_msg)
+    return record
+
+
+async def _asave_post(record: PostRecord) -> None:
+    if (store := get_post_store()) is not None:
+        key: str = guide_key("post", record.post_guide)
+        await asyncio.to_thread(store.save, key, "post", record.post_guide.title, record.post, record)
+
+
+def _stored_events(record: PostRecord, hashtags: bool) -> Iterator[PostEvent]:
+    """The same events as writing the post. The post is revised at once."""
+    if record.plan is not None:
+        yield PostEvent(stage="plan", plan=record.plan)
+    if record.draft is not None:
+        for idx, (_, detail) in enumerate(_draft_details(record.draft)):
+            if detail is not None:
+                yield PostEvent(stage="paragraph", content=detail.paragraph, index=idx)
+    if record.feedback is not None:
+        yield PostEvent(stage="feedback", feedback=record.feedback, draft=record.draft)
+    yield PostEvent(stage="revision", content=record.post)
+    yield PostEvent(stage="post", content=record.post, hashtags=record.hashtags if hashtags else None)
+
+
+class _PostRecorder:
+    """Results of the post collected from its events. They are stored when the final post is written."""
+
+    def __init__(self, post_guide: PostGuide):
+        # The guide is copied, so the key doesn't change when the caller changes the guide.
+        self.record = PostRecord(post_guide=post_guide.model_copy(deep=True))
+
+    async def add(self, event: PostEvent) -> None:
+        if event.stage == "plan":
+            self.record.plan = event.plan
+        elif event.stage == "feedback":
+            self.record.feedback, self.record.draft = event.feedback, event.draft
+        elif event.stage == "post":
+            self.record.post, self.record.hashtags = event.content, event.hashtags
+            await _asave_post(self.record)
+
+
+class _DraftCollector:
+    """
+    Paragraph events of the draft. Resumed graphs replay them, so the draft is complete in any mode.
+    Paragraphs are collected by their indexes, because concurrent modes may write them out of order.
+    """
+
+    def __init__(self):
+        self.paragraphs: dict[int, str] = {}
+        self.expected: int | None = None
+
+    def add(self, event: PostEvent) -> str | None:
+        """The draft when its last paragraph is added"""
+        if event.stage == "plan":
+            self.paragraphs, self.expected = {}, len(event.plan.bodies) + 2
+        elif event.stage == "paragraph":
+            self.paragraphs[event.index] = event.content
+            if len(self.paragraphs) == self.expected:
+                return "\n\n".join(paragraph for _, paragraph in sorted(self.paragraphs.items()))
+        return None
+
+
+async def _astream_with_hashtags(
+    events: AsyncIterator[PostEvent], post_guide: PostGuide, tracer: Tracer
+) -> AsyncIterator[PostEvent]:
+    """Write hashtags from the draft concurrently while the draft is reviewed and revised"""
+    collector = _DraftCollector()
+    candidates: asyncio.Task[list[str]] | None = None
+    try:
+        async for event in events:
+            if (draft := collector.add(event)) is not None and candidates is None:
+                candidates = asyncio.ensure_future(_awrite_draft_hashtags(draft, post_guide, tracer))
+            if event.stage == "post":
+                written: list[str] = (
+                    await candidates
+                    if candidates is not None
+                    else await _awrite_draft_hashtags(event.content, post_guide, tracer)
+                )
+                event = event.model_copy(update={"hashtags": _final_hashtags(written, event.content, post_guide)})
+            yield event
+    finally:
+        if candidates is not None:
+            await cancel_tasks([candidates])
+
+
+async def _ainvoke_until_long_enough(
+    chain_factory: Callable[[int, str], Runnable],
+    prompt: dict[str, Any],
+    post_guide: PostGuide,
+    plan: WritingPlanDetail,
+    paragraph_name: str,
+    budget: RetryBudget,
+    span: Span,
+) -> str:
+    """
+    Invoke the chain and repair the paragraph until it is longer than the letter count or retries run out.
+    Letters asked by the prompt and completion tokens of the chain are calibrated by the length controller.
+    Small shortfalls are filled by continuations even when the policy regenerates paragraphs.
+    """
+    controller: LengthController = get_length_controller()
+    target: LengthTarget = controller.target(route(span), plan.letter_count)
+    chain: Runnable = chain_factory(target.max_completion_tokens, target.model)
+    prompt["letter_count"] = span.attributes[ASKED_LETTERS] = target.prompt_letter_count
+    res = await chain.ainvoke(prompt, budget.config(span))
+    controller.observe(target, res)
+    content: str = res.content
+    log_msg: str = f"{paragraph_name.capitalize()} of {len(content)} letters"
+    _logger.info(log_msg, extra=payload(content))
+    attempts: int = 1
+    regenerations: int = 0
+    while (actual_letter_count := len(content)) < plan.letter_count:
+        log_msg = f"Letter count is less than desired letter count. {actual_letter_count} < {plan.letter_count}"
         _logger.warning(log_msg)
-        prompt["messages"].append(AIMessage(content=res.model_dump_json()))
-        prompt["messages"].append(
-            HumanMessage(
-                content=f"The total length of all paragraphs is {letter_count}. The length should be between {min_letter_count} and {max_letter_count}."
+        if not budget.can_retry(attempts):
+            break
+        await asyncio.sleep(budget.policy.backoff_seconds(attempts))
+        if budget.policy.repair == "extend" or controller.is_small_shortfall(plan.letter_count, actual_letter_count):
+            content = await _aextend_paragraph(post_guide, plan, paragraph_name, content, budget, span)
+        else:
+            prompt["messages"].append(AIMessage(content=content))
+            prompt["messages"].append(
+                _shorter_than_guideline_message(paragraph_name, actual_letter_count, target.prompt_letter_count)
             )
-        )
-        res: WritingPlan = chain.invoke(prompt)
+            res = await chain.ainvoke(prompt, budget.config(span))
+            controller.observe(target, res)
+            content = res.content
+            regenerations += 1
+        attempts += 1
+        log_msg = f"{paragraph_name.capitalize()} of {len(content)} letters"
+        _logger.info(log_msg, extra=payload(content))
+    span.attributes[RETRIES] = attempts - 1
+    span.attributes[REGENERATIONS] = regenerations
+    return content
+
+
+async def _aextend_paragraph(
+    post_guide: PostGuide, plan: WritingPlanDetail, paragraph_name: str, paragraph: str, budget: RetryBudget, span: Span
+) -> str:
+    """Ask only for the missing letters. The continuation's completion tokens are sized by the shortfall."""
+    controller: LengthController = get_length_controller()
+    target: LengthTarget = controller.target(route(span), plan.letter_count - len(paragraph), "continuation")
+    prompt: dict[str, Any] = _extend_paragraph_prompt(post_guide, plan, paragraph_name, paragraph, target)
+    continuation = await _extend_paragraph_chain(target.max_completion_tokens, target.model).ainvoke(
+        prompt, budget.config(span)
+    )
+    controller.observe(target, continuation)
+    return _join_continuation(paragraph, continuation.content)
+
+
+def _join_continuation(content: str, continuation: str) -> str:
+    return f"{content.rstrip()} {continuation.strip()}"
+
+
+def _extend_paragraph_prompt(
+    post_guide: PostGuide, plan: WritingPlanDetail, paragraph_name: str, paragraph: str, target: LengthTarget
+) -> dict[str, Any]:
+    return {
+        "paragraph_name": paragraph_name,
+        "subject": plan.subject,
+        "letter_count": target.prompt_letter_count,
+        "keywords": ", ".join(post_guide.keywords),
+        "paragraph": paragraph,
+    }
+
+
+@cached_chain
+def _extend_paragraph_chain(max_completion_tokens: int, model: str) -> Runnable:
+    """Ask only for the continuation of a short paragraph instead of the whole conversation."""
+    system_prompt = """
+As a food columnist, your task is to continue blog post's {paragraph_name} which is shorter than the guideline.
+
+---
+Please follow these guidelines ordered by **their priorities**.
+1. Continue right after the last sentence of the given {paragraph_name} about its subject, {subject}. MUST NOT repeat the given {paragraph_name}.
+2. The length of the continuation should be longer than {letter_count} letters.
+3. The continuation should be written attractive IN THE CALM TONE and MUST NOT use exaggerated or recommending expressions.
+    - Examples about prohibited expressions are "추천", "너무", "정말", "특별한", "최고", and more.
+4. The continuation should be written IN KOREAN and the PAST TENSE.
+5. The continuation should use these keywords by contexts: {keywords}
+
+---
+Please response as plain text only with the continuation. You don't need to use markdown.
+""".strip()
+    template = prompt_template(("system", system_prompt), ("human", "{paragraph}"))
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=max_completion_tokens, cache=False)
+    return template | llm
 
-        log_msg = f"Writing Plan: {res.model_dump_json(indent=4)}"
-        _logger.info(log_msg)
 
-        letter_count = (
-            res.introduction.letter_count + sum(body.letter_count for body in res.bodies) + res.conclution.letter_count
+def _shorter_than_guideline_message(paragraph_name: str, actual_letter_count: int, letter_count: int) -> HumanMessage:
+    return HumanMessage(
+        content=f"The length of {paragraph_name} is {actual_letter_count} letters. And this is shorter than the guideline({letter_count}). Revise the {paragraph_name}."
+    )
+
+
+async def _awrite_post_introduction(post_guide: PostGuide, plan: WritingPlanDetail, budget: RetryBudget) -> str:
+    prompt = _post_paragraph_prompt(post_guide, plan)
+    with budget.tracer.span("introduction") as span:
+        return await _ainvoke_until_long_enough(
+            _post_introduction_chain, prompt, post_guide, plan, "introduction", budget, span
         )
-    return res
 
 
-def write_post(post_guide: PostGuide) -> str:
-    log_msg: str = f"Write post by the guide: {post_guide.model_dump_json(indent=4)}"
-    _logger.info(log_msg)
-    plan: WritingPlan = plan_writing_post(post_guide)
-    draft = Draft()
-
-    post: str = ""
-    introduction: str = _write_post_introduction(post_guide, plan.introduction)
-    post += introduction
-    draft.introduction = DraftDetail(plan=plan.introduction, paragraph=introduction)
-
-    for body_plan in plan.bodies:
-        body: str = _write_post_body(post_guide, body_plan, post)
-        post += "\n\n" + body
-        draft.bodies.append(DraftDetail(plan=body_plan, paragraph=body))
-
-    conclusion: str = _write_post_conclusion(post_guide, plan.conclution, post)
-    post += "\n\n" + conclusion
-    draft.conclusion = DraftDetail(plan=plan.conclution, paragraph=conclusion)
-
-    feedback: Feedback = _feedback_draft(post_guide, draft)
-    result: str = _revise_draft(post_guide, draft, feedback)
-    log_msg = f"Final post\n{result}"
-    _logger.info(log_msg)
-    return result
+def _post_paragraph_prompt(post_guide: PostGuide, plan: WritingPlanDetail, **kwargs: Any) -> dict[str, Any]:
+    return {
+        "messages": [],
+        "post_guide": post_guide.model_dump_json(exclude=["max_length"]),
+        "subject": plan.subject,
+        "letter_count": plan.letter_count,
+        "restaurant": post_guide.restaurant,
+        **kwargs,
+    }
 
 
-def _write_post_introduction(post_guide: PostGuide, plan: WritingPlanDetail) -> str:
+@cached_chain
+def _post_introduction_chain(max_completion_tokens: int, model: str) -> Runnable:
     system_prompt = """
 As a food columnist, your task is to write blog post's introduction based on guidelines.
 The posts is written by reader's requests.
@@ -214,40 +819,30 @@ Please response as plain text. You don't need to use markdown.
 Please do your best. Let's start!
 """.strip()
     human_prompt = "{post_guide}"
-    template = ChatPromptTemplate.from_messages(
-        [("system", system_prompt), ("human", human_prompt), MessagesPlaceholder("messages")]
-    )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=2000)
-    chain = template | llm
-
-    prompt = {
-        "messages": [],
-        "post_guide": post_guide.model_dump_json(exclude=["max_length"]),
-        "subject": plan.subject,
-        "letter_count": plan.letter_count,
-        "restaurant": post_guide.restaurant,
-    }
-    res = chain.invoke(prompt)
+    template = prompt_template(("system", system_prompt), ("human", human_prompt), placeholder="messages")
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=max_completion_tokens, cache=False)
+    return template | llm
+
+
+async def _awrite_post_body(
+    post_guide: PostGuide, plan: WritingPlanDetail, context: RollingContext, budget: RetryBudget
+) -> str:
+    prompt = _post_paragraph_prompt(post_guide, plan, post=context.render())
+    with budget.tracer.span("body") as span:
+        body: str = await _ainvoke_until_long_enough(
+            _post_body_chain, prompt, post_guide, plan, "paragraph", budget, span
+        )
+        span.attributes[SAVED_TOKENS] = context.saved_tokens() * _context_calls(span)
+    return body
 
-    log_msg: str = f"Introduction: {res.content}"
-    _logger.info(log_msg)
-    while (letter_count := len(res.content)) < plan.letter_count:
-        log_msg = f"Letter count is less than desired letter count. {letter_count} < {plan.letter_count}"
-        _logger.warning(log_msg)
 
-        prompt["messages"].append(res)
-        prompt["messages"].append(
-            HumanMessage(
-                content=f"The length of introduction is {letter_count} letters. And this is shorter than the guideline({plan.letter_count}). Revise the introduction."
-            )
-        )
-        res = chain.invoke(prompt)
-        log_msg = f"Introduction: {res.content}"
-        _logger.info(log_msg)
-    return res.content
+def _context_calls(span: Span) -> int:
+    """Calls which sent the context of the paragraph. Extensions don't send it."""
+    return 1 + int(span.attributes.get(REGENERATIONS, 0))
 
 
-def _write_post_body(post_guide: PostGuide, plan: WritingPlanDetail, post: str) -> str:
+@cached_chain
+def _post_body_chain(max_completion_tokens: int, model: str) -> Runnable:
     system_prompt = """
 As a food columnist, your task is to write blog post's current paragraph based on guidelines.
 The posts is written by reader's requests.
@@ -272,47 +867,80 @@ Please response as plain text. You don't need to use markdown.
 Please do your best. Let's start!
 """.strip()
     human_prompt = "{post_guide}"
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-            ("ai", post),
-            ("human", "Please write current paragraph"),
-            MessagesPlaceholder("messages"),
-        ]
+    template = prompt_template(
+        ("system", system_prompt),
+        ("human", human_prompt),
+        ("ai", "{post}"),
+        ("human", "Please write current paragraph"),
+        placeholder="messages",
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=2000)
-    chain = template | llm
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=max_completion_tokens, cache=False)
+    return template | llm
+
+
+async def _awrite_post_body_by_plan(post_guide: PostGuide, plan: WritingPlan, idx: int, budget: RetryBudget) -> str:
+    """Write the idx-th body paragraph only by the plan. Neighbouring subjects keep the paragraphs connected."""
+    body_plan: WritingPlanDetail = plan.bodies[idx]
+    previous_subject: str = plan.bodies[idx - 1].subject if idx > 0 else plan.introduction.subject
+    next_subject: str = plan.bodies[idx + 1].subject if idx + 1 < len(plan.bodies) else plan.conclution.subject
+    prompt = _post_paragraph_prompt(post_guide, body_plan, previous_subject=previous_subject, next_subject=next_subject)
+    with budget.tracer.span("body", index=idx) as span:
+        return await _ainvoke_until_long_enough(
+            _post_body_by_plan_chain, prompt, post_guide, body_plan, "paragraph", budget, span
+        )
 
-    prompt = {
-        "messages": [],
-        "post_guide": post_guide.model_dump_json(exclude=["max_length"]),
-        "subject": plan.subject,
-        "letter_count": plan.letter_count,
-        "restaurant": post_guide.restaurant,
-    }
-    res = chain.invoke(prompt)
 
-    log_msg: str = f"Body Paragraph: {res.content}"
-    _logger.info(log_msg)
-    while (letter_count := len(res.content)) <= plan.letter_count:
-        log_msg = f"Letter count is less than desired letter count. {letter_count} < {plan.letter_count}"
-        _logger.warning(log_msg)
+@cached_chain
+def _post_body_by_plan_chain(max_completion_tokens: int, model: str) -> Runnable:
+    system_prompt = """
+As a food columnist, your task is to write blog post's current paragraph based on guidelines.
+The posts is written by reader's requests. Other paragraphs are written by other columnists at the same time.
 
-        prompt["messages"].append(res)
-        prompt["messages"].append(
-            HumanMessage(
-                content=f"The length of paragraph is {letter_count} letters. And this is shorter than the guideline({plan.letter_count}). Revise the paragraph."
-            )
-        )
-        res = chain.invoke(prompt)
+---
+Please follow these guidelines ordered by **their priorities**.
+1. Paragraph's subject is {subject}.
+2. The length of paragraph should be longer than {letter_count} letteres.
+3. Paragraph should be written attractive IN THE CALM TONE and MUST NOT use exaggerated or recommending expressions even if given informations contain these expressions.
+    - Examples about prohibited expressions are "추천", "너무", "정말", "특별한", "최고", and more.
+4. Paragraph should be written IN KOREAN and the PAST TENSE.
+5. Paragraph should use at least one given keywords by contexts. If the length is longer than 300 letters, you should use more keywords.
+6. Paragraph should naturally follow the previous paragraph about {previous_subject} and lead to the next paragraph about {next_subject}. Don't write about their subjects.
 
-        log_msg: str = f"Body Paragraph: {res.content}"
-        _logger.info(log_msg)
-    return res.content
+---
+Please consider these LLM configurations.
+- temperature: 0.52
+
+---
+Please response as plain text. You don't need to use markdown.
+
+---
+Please do your best. Let's start!
+""".strip()
+    human_prompt = "{post_guide}"
+    template = prompt_template(
+        ("system", system_prompt),
+        ("human", human_prompt),
+        ("human", "Please write current paragraph"),
+        placeholder="messages",
+    )
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=max_completion_tokens, cache=False)
+    return template | llm
+
+
+async def _awrite_post_conclusion(
+    post_guide: PostGuide, plan: WritingPlanDetail, context: RollingContext, budget: RetryBudget
+) -> str:
+    prompt = _post_paragraph_prompt(post_guide, plan, post=context.render())
+    with budget.tracer.span("conclusion") as span:
+        conclusion: str = await _ainvoke_until_long_enough(
+            _post_conclusion_chain, prompt, post_guide, plan, "conclusion", budget, span
+        )
+        span.attributes[SAVED_TOKENS] = context.saved_tokens() * _context_calls(span)
+    return conclusion
 
 
-def _write_post_conclusion(post_guide: PostGuide, plan: WritingPlanDetail, post: str) -> str:
+@cached_chain
+def _post_conclusion_chain(max_completion_tokens: int, model: str) -> Runnable:
     system_prompt = """
 As a food columnist, your task is to write blog post's conclusion based on guidelines.
 The posts is written by reader's requests.
@@ -338,47 +966,67 @@ Please response as plain text. You don't need to use markdown.
 Please do your best. Let's start!
 """.strip()
     human_prompt = "{post_guide}"
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-            ("ai", post),
-            ("human", "Please write conclusion"),
-            MessagesPlaceholder("messages"),
-        ]
+    template = prompt_template(
+        ("system", system_prompt),
+        ("human", human_prompt),
+        ("ai", "{post}"),
+        ("human", "Please write conclusion"),
+        placeholder="messages",
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=2000)
-    chain = template | llm
-
-    prompt = {
-        "messages": [],
-        "post_guide": post_guide.model_dump_json(exclude=["max_length"]),
-        "subject": plan.subject,
-        "letter_count": plan.letter_count,
-        "restaurant": post_guide.restaurant,
-    }
-    res = chain.invoke(prompt)
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=max_completion_tokens, cache=False)
+    return template | llm
 
-    log_msg: str = f"Conclusion Paragraph: {res.content}"
-    _logger.info(log_msg)
-    while (letter_count := len(res.content)) <= plan.letter_count:
-        log_msg = f"Letter count is less than desired letter count. {letter_count} < {plan.letter_count}"
-        _logger.warning(log_msg)
 
-        prompt["messages"].append(res)
-        prompt["messages"].append(
-            HumanMessage(
-                content=f"The length of conclusion is {letter_count} letters. And this is shorter than the guideline({plan.letter_count}). Revise the conclusion."
-            )
+async def _afeedback_draft(post_guide: PostGuide, draft: Draft, budget: RetryBudget | None = None) -> Feedback:
+    budget = budget or RetryBudget()
+    if feedback_mode() == "lint":
+        return _lint_feedback(post_guide, draft, budget)
+    with budget.tracer.span("feedback") as span:
+        res: Feedback = await _feedback_draft_chain(route(span)).ainvoke(
+            {"restaurant": post_guide.restaurant, "draft": _dump_draft(draft)}, budget.config(span)
+        )
+        span.attributes[SAVED_TOKENS] = estimate_tokens(_dump_draft(draft, "none")) - estimate_tokens(
+            _dump_draft(draft)
         )
-        res = chain.invoke(prompt)
 
-        log_msg = f"Conclusion Paragraph: {res.content}"
-        _logger.info(log_msg)
-    return res.content
+    log_msg: str = f"Feedback of overall score {res.overall.score}"
+    _logger.info(log_msg, extra=payload(res))
+    return res
+
+
+def lint_draft(post_guide: PostGuide, draft: Draft) -> LintReport:
+    """Check the draft by the mechanical rules of the feedback without LLM calls"""
+    return lint_paragraphs(
+        [(name, detail.paragraph, detail.plan.letter_count) for name, detail in _draft_details(draft) if detail],
+        restaurant=post_guide.restaurant,
+        keywords=post_guide.keywords,
+        max_length=post_guide.max_length,
+    )
+
+
+def _lint_feedback(post_guide: PostGuide, draft: Draft, budget: RetryBudget) -> Feedback:
+    """Feedback of only the violations, so the revision focuses on them"""
+    with budget.tracer.span("feedback") as span:
+        report: LintReport = lint_draft(post_guide, draft)
+        span.attributes[LINT_VIOLATIONS] = len(report.violations)
 
+    def detail(name: str) -> FeedbackDetail:
+        advise: str = " ".join(violation.advise for violation in report.of(name)) or "Keep it."
+        return FeedbackDetail(score=report.score(name), advise=advise)
 
-def _feedback_draft(post_guide: PostGuide, draft: Draft) -> Feedback:
+    res = Feedback(
+        introduction=detail("introduction"),
+        bodies=[detail(f"body {idx}") for idx in range(1, len(draft.bodies) + 1)],
+        conclusion=detail("conclusion"),
+        overall=detail("overall"),
+    )
+    log_msg: str = f"Feedback by lint of overall score {res.overall.score}"
+    _logger.info(log_msg, extra=payload(res))
+    return res
+
+
+@cached_chain
+def _feedback_draft_chain(model: str) -> Runnable:
     system_prompt = """
 As a blog editor, your task is to review the food blog post's draft and feedback how to revise it based on guidelines.
 The posts is written by food columnist.
@@ -407,22 +1055,185 @@ class FeedbackDetail(TypedDict):
     score: int # 0(worst) to 10(best)
     advise: str # advise the draft based on guidelines
 """.strip()
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", "{draft}"),
-        ]
+    template = prompt_template(("system", system_prompt), ("human", "{draft}"))
+    llm = structured_chat_model(Feedback, model=model, temperature=0.52, max_completion_tokens=1000)
+    return template | llm
+
+
+async def _astream_revised_draft(
+    post_guide: PostGuide, draft: Draft, feedback: Feedback, budget: RetryBudget
+) -> AsyncIterator[PostEvent]:
+    """
+    Stream tokens of the revised post while tracking its length.
+    When the post ends shorter than the guideline, the streamed post is continued instead of revised again, so its
+    tokens keep streaming. `regenerate` repair policy revises it again when the shortfall is not small.
+    When retries run out, the longest revision is used.
+    """
+    if feedback_mode() == "lint" and lint_draft(post_guide, draft).passed:
+        for event in _unrevised_draft(draft, budget):
+            yield event
+        return
+    prompt: dict[str, Any] = _revise_draft_prompt(post_guide, draft, feedback)
+    saved_tokens: int = _saved_tokens(_revise_draft_prompt(post_guide, draft, feedback, "none"), prompt)
+    controller: LengthController = get_length_controller()
+    revisions: list[str] = []
+    with budget.tracer.span("revision") as span:
+        chain: Runnable = _revise_draft_chain(route(span))
+        attempts: int = 0
+        content: str = ""
+        while True:
+            if not content:
+                async for chunk in chain.astream(prompt, budget.config(span)):
+                    content += chunk.content
+                    yield PostEvent(stage="revision", content=chunk.content)
+                revisions.append(content)
+            else:
+                async for piece in _astream_post_continuation(post_guide, content, budget, span):
+                    content += piece
+                    yield PostEvent(stage="revision", content=piece)
+                revisions[-1] = content
+            attempts += 1
+
+            log_msg: str = f"Revised post of {len(content)} letters"
+            _logger.info(log_msg, extra=payload(content))
+            if len(content) >= post_guide.max_length:
+                break
+            log_msg = (
+                f"The length of the post is {len(content)}. This is shorter than the guideline({post_guide.max_length})"
+            )
+            _logger.warning(log_msg)
+            if not budget.can_retry(attempts):
+                break
+            await asyncio.sleep(budget.policy.backoff_seconds(attempts))
+            if budget.policy.repair == "regenerate" and not controller.is_small_shortfall(
+                post_guide.max_length, len(content)
+            ):
+                prompt = prompt | {"messages": _post_shorter_than_guideline_messages(content, post_guide.max_length)}
+                content = ""
+                yield PostEvent(stage="retry")
+        span.attributes[RETRIES] = attempts - 1
+        span.attributes[SAVED_TOKENS] = saved_tokens * len(revisions)
+    result: str = max(revisions, key=len)
+    log_msg = f"Final post of {len(result)} letters"
+    _logger.info(log_msg, extra=payload(result))
+    yield PostEvent(stage="post", content=result)
+
+
+def _unrevised_draft(draft: Draft, budget: RetryBudget) -> Iterator[PostEvent]:
+    """The draft without violations is the post as it is"""
+    with budget.tracer.span("revision", skipped=True):
+        post: str = "\n\n".join(detail.paragraph for _, detail in _draft_details(draft) if detail is not None)
+    log_msg: str = f"Final post of {len(post)} letters without revision"
+    _logger.info(log_msg, extra=payload(post))
+    yield PostEvent(stage="revision", content=post)
+    yield PostEvent(stage="post", content=post)
+
+
+async def _astream_post_continuation(
+    post_guide: PostGuide, post: str, budget: RetryBudget, span: Span
+) -> AsyncIterator[str]:
+    """Stream pieces which continue the post to the guideline. The first piece is separated from the post."""
+    controller: LengthController = get_length_controller()
+    target: LengthTarget = controller.target(route(span), post_guide.max_length - len(post), "continuation")
+    chain: Runnable = _continue_post_chain(target.max_completion_tokens, target.model)
+    message: BaseMessage | None = None
+    separator: str = "" if post[-1:].isspace() else " "
+    async for chunk in chain.astream(_continue_post_prompt(post_guide, post, target), budget.config(span)):
+        message = chunk if message is None else message + chunk
+        if piece := chunk.content if not separator else chunk.content.lstrip():
+            yield separator + piece
+            separator = ""
+    if message is not None:
+        controller.observe(target, message)
+
+
+def _continue_post_prompt(post_guide: PostGuide, post: str, target: LengthTarget) -> dict[str, Any]:
+    return {
+        "restaurant": post_guide.restaurant,
+        "letter_count": target.prompt_letter_count,
+        "keywords": ", ".join(post_guide.keywords),
+        "post": post,
+    }
+
+
+@cached_chain
+def _continue_post_chain(max_completion_tokens: int, model: str) -> Runnable:
+    """Ask only for the continuation of a short post instead of revising the whole post again."""
+    system_prompt = """
+As a food columnist, your task is to continue the blog post which is shorter than the guideline.
+
+---
+Please follow these guidelines ordered by **their priorities**.
+1. Continue right after the last sentence of the given post with more details of the visit. MUST NOT repeat the given post.
+2. The length of the continuation should be longer than {letter_count} letters.
+3. The continuation should be written attractive IN THE CALM TONE and MUST NOT use exaggerated or recommending expressions.
+    - Examples about prohibited expressions are "추천", "너무", "정말", "특별한", "최고", and more.
+4. The continuation should be written IN KOREAN and the PAST TENSE.
+5. The continuation should use these keywords by contexts: {keywords}
+6. The continuation should end with sentences about visiting {restaurant}.
+
+---
+Please response as plain text only with the continuation. You don't need to use markdown.
+""".strip()
+    template = prompt_template(("system", system_prompt), ("human", "{post}"))
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=max_completion_tokens, cache=False)
+    return template | llm
+
+
+def _revise_draft_prompt(
+    post_guide: PostGuide, draft: Draft, feedback: Feedback, mode: CompactionMode | None = None
+) -> dict[str, Any]:
+    return {
+        "restaurant": post_guide.restaurant,
+        "post_guide": dump_json(post_guide, mode, exclude=["restaurant", "max_length"]),
+        "draft": _dump_draft(draft, mode, indent=4),
+        "feedback": dump_json(feedback, mode),
+        "messages": [],
+    }
+
+
+def _saved_tokens(original: dict[str, Any], compacted: dict[str, Any]) -> int:
+    """Estimated tokens saved by compacting texts of the prompt"""
+    return sum(
+        estimate_tokens(original[key]) - estimate_tokens(value)
+        for key, value in compacted.items()
+        if isinstance(value, str)
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=1000)
-    chain = template | llm.with_structured_output(Feedback)
-    res: Feedback = chain.invoke({"restaurant": post_guide.restaurant, "draft": draft.model_dump_json()})
 
-    log_msg: str = f"Feedback: {res.model_dump_json(indent=4)}"
-    _logger.info(log_msg)
-    return res
+
+def _dump_draft(draft: Draft, mode: CompactionMode | None = None, indent: int | None = None) -> str:
+    """
+    Paragraphs of the draft headed by their plans.
+    Plans are written in a line instead of JSON objects, so paragraphs are not escaped and keys are not repeated.
+    """
+    if (mode or compaction_mode()) == "none":
+        return draft.model_dump_json(indent=indent)
+    return "\n\n".join(
+        f"[{name}] subject: {detail.plan.subject} / letter_count: {detail.plan.letter_count}\n{detail.paragraph}"
+        for name, detail in _draft_details(draft)
+        if detail is not None
+    )
+
+
+def _draft_details(draft: Draft) -> list[tuple[str, DraftDetail | None]]:
+    return [
+        ("introduction", draft.introduction),
+        *((f"body {idx}", body) for idx, body in enumerate(draft.bodies, start=1)),
+        ("conclusion", draft.conclusion),
+    ]
+
+
+def _post_shorter_than_guideline_messages(post: str, max_length: int) -> list[BaseMessage]:
+    return [
+        AIMessage(content=post),
+        HumanMessage(
+            f"The length of the post is {len(post)}. This is shorter than the guideline({max_length}). Please revise the post."
+        ),
+    ]
 
 
-def _revise_draft(post_guide: PostGuide, draft: Draft, feedback: Feedback) -> str:
+@cached_chain
+def _revise_draft_chain(model: str) -> Runnable:
     system_prompt = """
 As a food columnist, your task is to revise blog post's draft based on feedbacks.
 The post is written by reader's request and feedbacks are written by the blog editor based on guidelines.
@@ -446,52 +1257,66 @@ Please follow these llm configurations.
 Please response as plain text. You don't need to use markdown.
 """.strip()
 
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", "Request is here.\n{post_guide}"),
-            ("ai", "Draft is here.\n{draft}"),
-            ("human", "Feedback is here.\n{feedback}"),
-            ("human", "Based on the draft, please write the final post. You should consider feedbacks and guidelines."),
-            MessagesPlaceholder("messages"),
-        ]
+    template = prompt_template(
+        ("system", system_prompt),
+        ("human", "Request is here.\n{post_guide}"),
+        ("ai", "Draft is here.\n{draft}"),
+        ("human", "Feedback is here.\n{feedback}"),
+        ("human", "Based on the draft, please write the final post. You should consider feedbacks and guidelines."),
+        placeholder="messages",
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=2000)
-    chain = template | llm
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=2000, cache=False)
+    return template | llm
 
-    prompt = {
-        "restaurant": post_guide.restaurant,
-        "post_guide": post_guide.model_dump_json(exclude=["restaurant", "max_length"], indent=4),
-        "draft": draft.model_dump_json(indent=4),
-        "feedback": feedback.model_dump_json(indent=4),
-        "messages": [],
-    }
-    res = chain.invoke(prompt)
 
-    log_msg: str = f"Revised post: {res.content}"
-    _logger.info(log_msg)
+def write_hashtags(post: str, post_guide: PostGuide, tracer: Tracer | None = None) -> list[str]:
+    """Sync version of `awrite_hashtags`."""
+    return run_sync(awrite_hashtags(post, post_guide, tracer))
+
 
-    messages = []
-    while len(res.content) < post_guide.max_length:
-        log_msg = (
-            f"The length of the post is {len(res.content)}. This is shorter than the guideline({post_guide.max_length})"
+async def awrite_hashtags(post: str, post_guide: PostGuide, tracer: Tracer | None = None) -> list[str]:
+    tracer = tracer or Tracer()
+    hashtags: list[str] = []
+    if number := _hashtag_number(post_guide):
+        with tracer.span("hashtags") as span:
+            response: dict[str, list[str]] = await _write_hashtags_chain(route(span)).ainvoke(
+                {"post": post, "number": number}, tracer.config(span)
+            )
+        hashtags = response["hashtags"]
+    return _with_keyword_hashtags(hashtags, post_guide)
+
+
+async def _awrite_draft_hashtags(draft: str, post_guide: PostGuide, tracer: Tracer) -> list[str]:
+    """Candidates of hashtags from the draft. They are re-ranked by the final post."""
+    if not (number := candidate_number(_hashtag_number(post_guide))):
+        return []
+    with tracer.span("hashtags", source="draft") as span:
+        response: dict[str, list[str]] = await _write_hashtags_chain(route(span)).ainvoke(
+            {"post": draft, "number": number}, tracer.config(span)
         )
-        _logger.warning(log_msg)
-        messages = [
-            res,
-            HumanMessage(
-                f"The length of the post is {len(res.content)}. This is shorter than the guideline({post_guide.max_length}). Please revise the post."
-            ),
-        ]
-        prompt = prompt | {"messages": messages}
-        res = chain.invoke(prompt)
+    return response["hashtags"]
 
-        log_msg = f"Revised post: {res.content}"
-        _logger.info(log_msg)
-    return res.content
 
+def _final_hashtags(candidates: list[str], post: str, post_guide: PostGuide) -> list[str]:
+    return _with_keyword_hashtags(rerank_hashtags(candidates, post, _hashtag_number(post_guide)), post_guide)
+
+
+def _hashtag_number(post_guide: PostGuide) -> int:
+    """Hashtags written by LLMs. Keywords fill the rest of 20 hashtags."""
+    return max(0, 20 - len(post_guide.keywords))
+
+
+def _with_keyword_hashtags(hashtags: list[str], post_guide: PostGuide) -> list[str]:
+    keyword_hashtags: list[str] = ["#" + keyword.strip("# ") for keyword in post_guide.keywords[: 20 - len(hashtags)]]
+    res: list[str] = hashtags + keyword_hashtags
 
-def write_hashtags(post: str, post_guide: PostGuide) -> list[str]:
+    log_msg: str = f"Hashtags: {res}"
+    _logger.info(log_msg)
+    return res
+
+
+@cached_chain
+def _write_hashtags_chain(model: str) -> Runnable:
     class Response(TypedDict):
         hashtags: list[str]
 
@@ -517,20 +1342,13 @@ Post is here.
 
 {post}
 """.strip()
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-        ]
+    template = prompt_template(("system", system_prompt), ("human", human_prompt))
+    llm = structured_chat_model(
+        Response,
+        model=model,
+        temperature=0.52,
+        max_completion_tokens=500,
+        method="json_schema",
+        cache=False,
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=500)
-    chain = template | llm.with_structured_output(Response, method="json_schema")
-    if number := max(0, 20 - len(post_guide.keywords)):
-        response: Response = chain.invoke({"post": post, "number": number})
-    hashtags: list[str] = response["hashtags"]
-    keyword_hashtags: list[str] = ["#" + keyword.strip("# ") for keyword in post_guide.keywords[: 20 - len(hashtags)]]
-    res: list[str] = hashtags + keyword_hashtags
-
-    log_msg: str = f"Hashtags: {res}"
-    _logger.info(log_msg)
-    return res
+    return template | llm
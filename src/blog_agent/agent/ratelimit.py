@@ -0,0 +1,374 @@
+"""
+Process-wide rate limits of chat models.
+Each model has token buckets of requests and tokens per minute and an adaptive concurrency limit. Every request of
+chat models built by `chat_model` waits for them.
+Limits are learned from OpenAI's rate-limit response headers. Concurrency grows by one per window of successful
+requests, and it is halved by 429 responses and shrunk when the remaining budget is low.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import BaseModel, Field
+
+from blog_agent.agent.context import estimate_tokens
+
+_logger = logging.getLogger(__name__)
+
+_POLL_SECONDS = 0.05
+_LOW_REMAINING_RATIO = 0.1
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_SECONDS: dict[str, float] = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class RateLimitSettings(BaseModel):
+    """
+    Limits of a model. Limits in rate-limit headers replace `requests_per_minute` and `tokens_per_minute`.
+    - requests_per_minute: `None` doesn't limit requests until headers tell the limit.
+    - tokens_per_minute: Prompt tokens and max completion tokens are reserved by each request, and unused tokens are
+      refunded when it finishes. `None` doesn't limit tokens until headers tell the limit.
+    - max_concurrency: Max requests in flight. Concurrency starts from it and adapts between 1 and it.
+    """
+
+    requests_per_minute: float | None = Field(default=None, gt=0)
+    tokens_per_minute: float | None = Field(default=None, gt=0)
+    max_concurrency: int = Field(default=16, ge=1)
+
+    @classmethod
+    def from_env(cls, model: str) -> "RateLimitSettings":
+        """
+        Defaults of all models are `BLOG_AGENT_RATE_*` environments, and `BLOG_AGENT_RATE_LIMITS` overrides them by
+        models as JSON like `{"gpt-4o-mini": {"requests_per_minute": 500}}`.
+        """
+        env = {
+            "requests_per_minute": os.getenv("BLOG_AGENT_RATE_REQUESTS_PER_MINUTE"),
+            "tokens_per_minute": os.getenv("BLOG_AGENT_RATE_TOKENS_PER_MINUTE"),
+            "max_concurrency": os.getenv("BLOG_AGENT_RATE_MAX_CONCURRENCY"),
+        }
+        overrides: dict[str, Any] = json.loads(os.getenv("BLOG_AGENT_RATE_LIMITS", "{}")).get(model, {})
+        return cls(**{key: value for key, value in env.items() if value is not None} | overrides)
+
+
+class RateLimitStats(BaseModel):
+    model: str
+    concurrency: int
+    in_flight: int
+    waiting: int  # requests in the queue
+    requests_per_minute: float | None
+    tokens_per_minute: float | None
+    requests: int  # requests which waited for the limiter
+    rate_limited: int  # 429 responses
+    wait_seconds: float  # total seconds which requests waited
+    max_wait_seconds: float
+    paused_seconds: float = 0.0  # seconds until requests resume after a 429 response
+
+    @property
+    def mean_wait_seconds(self) -> float:
+        return self.wait_seconds / self.requests if self.requests else 0.0
+
+
+class ModelRateLimiter:
+    """Token buckets and the adaptive concurrency of a model, shared by threads and the background loop"""
+
+    def __init__(self, model: str, settings: RateLimitSettings | None = None):
+        self.model = model
+        self.settings = settings or RateLimitSettings.from_env(model)
+        self.requests_per_minute: float | None = self.settings.requests_per_minute
+        self.tokens_per_minute: float | None = self.settings.tokens_per_minute
+        self.concurrency: float = float(self.settings.max_concurrency)
+        self._lock = threading.Lock()
+        self._requests: float = self.requests_per_minute or 0.0
+        self._tokens: float = self.tokens_per_minute or 0.0
+        self._refilled_at: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._in_flight: int = 0
+        self._waiting: int = 0
+        self._stats = RateLimitStats(
+            model=model,
+            concurrency=int(self.concurrency),
+            in_flight=0,
+            waiting=0,
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
+            requests=0,
+            rate_limited=0,
+            wait_seconds=0.0,
+            max_wait_seconds=0.0,
+        )
+
+    def acquire(self, tokens: int) -> float:
+        """Wait until the request can be sent. Returns seconds waited."""
+        started_at: float = self._enqueue()
+        try:
+            while (wait := self._try_acquire(tokens)) > 0:
+                time.sleep(wait)
+        finally:
+            waited: float = self._dequeue(started_at)
+        return waited
+
+    async def aacquire(self, tokens: int) -> float:
+        """Async version of `acquire`."""
+        started_at: float = self._enqueue()
+        try:
+            while (wait := self._try_acquire(tokens)) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            waited: float = self._dequeue(started_at)
+        return waited
+
+    def release(self, reserved_tokens: int, used_tokens: int | None = None, error: BaseException | None = None) -> None:
+        """Finish the request. Reserved tokens which are not used are refunded."""
+        with self._lock:
+            self._in_flight -= 1
+            if used_tokens is not None and self.tokens_per_minute is not None:
+                self._tokens = min(self._tokens + reserved_tokens - used_tokens, self.tokens_per_minute)
+            # 429 responses are observed by the hook of the HTTP client including retries of the OpenAI client.
+            if error is None:
+                # Additive increase: one more slot after a window of successful requests.
+                self.concurrency = min(self.concurrency + 1 / self.concurrency, self.settings.max_concurrency)
+
+    def observe(self, status_code: int, headers: httpx.Headers | dict[str, str]) -> None:
+        """Adapt limits by rate-limit headers of a response"""
+        with self._lock:
+            self._refill(time.monotonic())
+            for kind in ("requests", "tokens"):
+                limit: float | None = _float(headers.get(f"x-ratelimit-limit-{kind}"))
+                remaining: float | None = _float(headers.get(f"x-ratelimit-remaining-{kind}"))
+                if limit is None or remaining is None:
+                    continue
+                # Budgets reserved by requests in flight may not be counted by the server yet.
+                available: float = getattr(self, f"_{kind}") if getattr(self, f"{kind}_per_minute") else limit
+                setattr(self, f"{kind}_per_minute", limit)
+                setattr(self, f"_{kind}", min(available, remaining))
+                if remaining < limit * _LOW_REMAINING_RATIO:
+                    self.concurrency = max(self.concurrency * 0.75, 1.0)
+            if status_code == 429:
+                self._stats.rate_limited += 1
+                # Multiplicative decrease
+                self.concurrency = max(self.concurrency / 2, 1.0)
+                retry_after: float | None = _float(headers.get("retry-after")) or _duration(
+                    headers.get("x-ratelimit-reset-requests") or headers.get("x-ratelimit-reset-tokens")
+                )
+                self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or 1.0))
+
+    def stats(self) -> RateLimitStats:
+        with self._lock:
+            return self._stats.model_copy(
+                update={
+                    "concurrency": int(self.concurrency),
+                    "in_flight": self._in_flight,
+                    "waiting": self._waiting,
+                    "requests_per_minute": self.requests_per_minute,
+                    "tokens_per_minute": self.tokens_per_minute,
+                    "paused_seconds": max(self._paused_until - time.monotonic(), 0.0),
+                }
+            )
+
+    def _enqueue(self) -> float:
+        with self._lock:
+            self._waiting += 1
+        return time.monotonic()
+
+    def _dequeue(self, started_at: float) -> float:
+        waited: float = time.monotonic() - started_at
+        with self._lock:
+            self._waiting -= 1
+            self._stats.requests += 1
+            self._stats.wait_seconds += waited
+            self._stats.max_wait_seconds = max(self._stats.max_wait_seconds, waited)
+        if waited >= 1.0:
+            log_msg: str = f"{self.model} request waited {waited:.2f}s for the rate limit"
+            _logger.info(log_msg)
+        return waited
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and reserve budgets. Returns 0 when they are taken, or seconds to wait before trying again."""
+        now: float = time.monotonic()
+        with self._lock:
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= int(self.concurrency):
+                return _POLL_SECONDS
+            waits: list[float] = []
+            if self.requests_per_minute is not None and self._requests < 1:
+                waits.append((1 - self._requests) * 60 / self.requests_per_minute)
+            # Requests larger than the bucket wait for the full bucket instead of waiting forever.
+            if self.tokens_per_minute is not None and self._tokens < (needed := min(tokens, self.tokens_per_minute)):
+                waits.append((needed - self._tokens) * 60 / self.tokens_per_minute)
+            if waits:
+                return max(max(waits), _POLL_SECONDS)
+            self._requests -= 1
+            self._tokens -= tokens
+            self._in_flight += 1
+            return 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed: float = now - self._refilled_at
+        self._refilled_at = now
+        if self.requests_per_minute is not None:
+            self._requests = min(self._requests + elapsed * self.requests_per_minute / 60, self.requests_per_minute)
+        if self.tokens_per_minute is not None:
+            self._tokens = min(self._tokens + elapsed * self.tokens_per_minute / 60, self.tokens_per_minute)
+
+
+def _float(value: str | None) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _duration(value: str | None) -> float | None:
+    """Seconds of durations in headers like `6m0s`, `1.5s` or `20ms`"""
+    if not value or not (parts := _DURATION.findall(value)):
+        return None
+    return sum(float(number) * _DURATION_SECONDS[unit] for number, unit in parts)
+
+
+_lock = threading.Lock()
+_limiters: dict[str, ModelRateLimiter] = {}
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    with _lock:
+        if (limiter := _limiters.get(model)) is None:
+            limiter = _limiters[model] = ModelRateLimiter(model)
+        return limiter
+
+
+def rate_limit_stats() -> list[RateLimitStats]:
+    """Queue depth, wait time and current limits of each model"""
+    with _lock:
+        limiters: list[ModelRateLimiter] = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def reset_rate_limiters() -> None:
+    with _lock:
+        _limiters.clear()
+
+
+def observe_response(response: httpx.Response) -> None:
+    """Hook of the HTTP client. Rate-limit headers of chat completions adapt the limiter of the requested model."""
+    if not response.request.url.path.endswith("/chat/completions"):
+        return
+    try:
+        model: str = json.loads(response.request.content)["model"]
+    except (ValueError, KeyError, httpx.RequestNotRead):
+        return
+    get_rate_limiter(model).observe(response.status_code, response.headers)
+
+
+async def aobserve_response(response: httpx.Response) -> None:
+    observe_response(response)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """Chat model whose requests wait for the rate limiter of the model. Responses from caches don't wait."""
+
+    def _limiter(self) -> ModelRateLimiter:
+        return get_rate_limiter(getattr(self, "model_name", None) or self.model)
+
+    def _reserved_tokens(self, messages: list[BaseMessage]) -> int:
+        prompt_tokens: int = sum(estimate_tokens(str(message.content)) for message in messages)
+        # `ChatOpenAI` stores `max_completion_tokens` in its `max_tokens` field.
+        max_tokens: int | None = getattr(self, "max_tokens", None) or getattr(self, "max_completion_tokens", None)
+        return prompt_tokens + (max_tokens or 0)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        limiter, tokens = self._limiter(), self._reserved_tokens(messages)
+        limiter.acquire(tokens)
+        try:
+            result: ChatResult = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except BaseException as e:
+            limiter.release(tokens, error=e)
+            raise
+        limiter.release(tokens, used_tokens=_used_tokens(result))
+        return result
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        limiter, tokens = self._limiter(), self._reserved_tokens(messages)
+        await limiter.aacquire(tokens)
+        try:
+            result: ChatResult = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except BaseException as e:
+            limiter.release(tokens, error=e)
+            raise
+        limiter.release(tokens, used_tokens=_used_tokens(result))
+        return result
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        limiter, tokens = self._limiter(), self._reserved_tokens(messages)
+        limiter.acquire(tokens)
+        used_tokens: int | None = None
+        try:
+            for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                used_tokens = _chunk_tokens(chunk, used_tokens)
+                yield chunk
+        except BaseException as e:
+            limiter.release(tokens, error=e)
+            raise
+        limiter.release(tokens, used_tokens=used_tokens)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        limiter, tokens = self._limiter(), self._reserved_tokens(messages)
+        await limiter.aacquire(tokens)
+        used_tokens: int | None = None
+        try:
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                used_tokens = _chunk_tokens(chunk, used_tokens)
+                yield chunk
+        except BaseException as e:
+            limiter.release(tokens, error=e)
+            raise
+        limiter.release(tokens, used_tokens=used_tokens)
+
+
+def _used_tokens(result: ChatResult) -> int | None:
+    usages = [usage for generation in result.generations if (usage := generation.message.usage_metadata)]
+    if usages:
+        return sum(usage["total_tokens"] for usage in usages)
+    return (result.llm_output or {}).get("token_usage", {}).get("total_tokens")
+
+
+def _chunk_tokens(chunk: ChatGenerationChunk, used_tokens: int | None) -> int | None:
+    if (usage := getattr(chunk.message, "usage_metadata", None)) is not None:
+        return (used_tokens or 0) + usage["total_tokens"]
+    return used_tokens
@@ -0,0 +1,95 @@
+"""
+Retry policy of LLM steps which validate their responses.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Literal
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field
+
+from blog_agent.agent.telemetry import Span, Tracer, token_usage
+
+_logger = logging.getLogger(__name__)
+
+RepairMode = Literal["extend", "regenerate"]
+
+
+class RetryPolicy(BaseModel):
+    """
+    How LLM steps retry when their responses are invalid.
+    - max_attempts: Max calls of a step including the first call.
+    - max_tokens_per_post: Steps stop retrying when a post spends more tokens.
+    - backoff: Seconds to wait before the first retry. It is doubled by each retry up to `max_backoff`.
+    - repair: `extend` asks only for the continuation of a short paragraph. `regenerate` rewrites the whole paragraph.
+    """
+
+    max_attempts: int = Field(default=3, ge=1)
+    max_tokens_per_post: int | None = Field(default=60_000, ge=1)
+    backoff: float = Field(default=0.5, ge=0)
+    max_backoff: float = Field(default=8.0, ge=0)
+    repair: RepairMode = Field(default="extend")
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        env = {
+            "max_attempts": os.getenv("BLOG_AGENT_RETRY_MAX_ATTEMPTS"),
+            "max_tokens_per_post": os.getenv("BLOG_AGENT_RETRY_MAX_TOKENS_PER_POST"),
+            "backoff": os.getenv("BLOG_AGENT_RETRY_BACKOFF"),
+            "repair": os.getenv("BLOG_AGENT_RETRY_REPAIR"),
+        }
+        return cls(**{key: value for key, value in env.items() if value is not None})
+
+    def backoff_seconds(self, retry: int) -> float:
+        """Seconds to wait before the retry. `retry` starts from 1."""
+        return min(self.backoff * 2 ** (retry - 1), self.max_backoff)
+
+
+class RetryBudget(BaseCallbackHandler):
+    """
+    Tokens spent by a post under the retry policy.
+    Pass it as a callback of chains to count their tokens. Spans of the post are recorded by its tracer.
+    """
+
+    run_inline = True
+
+    def __init__(self, policy: RetryPolicy | None = None, tracer: Tracer | None = None):
+        self.policy = policy or RetryPolicy.from_env()
+        self.tracer = tracer or Tracer()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self.policy.max_tokens_per_post is not None and self.total_tokens >= self.policy.max_tokens_per_post
+
+    def can_retry(self, attempts: int) -> bool:
+        """Whether a step which has been called `attempts` times can be called again."""
+        if attempts >= self.policy.max_attempts:
+            log_msg: str = f"Retry is stopped by max attempts: {attempts}"
+            _logger.warning(log_msg)
+            return False
+        if self.is_exhausted:
+            log_msg = f"Retry is stopped by the token budget: {self.total_tokens} >= {self.policy.max_tokens_per_post}"
+            _logger.warning(log_msg)
+            return False
+        return True
+
+    def config(self, span: Span | None = None) -> dict[str, Any]:
+        """Runnable config counting tokens of the call and recording it as a child of the span"""
+        config: dict[str, Any] = self.tracer.config(span)
+        return config | {"callbacks": [self, *config["callbacks"]]}
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = token_usage(response)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
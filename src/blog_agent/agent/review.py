@@ -1,10 +1,25 @@
+import asyncio
 import re
+from collections.abc import AsyncIterator, Iterator
 from typing import Literal, Self, TypedDict
 
-from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import Runnable
 from pydantic import BaseModel, Field
 
+from blog_agent.agent.llm import (
+    cached_chain,
+    cancel_tasks,
+    chat_model,
+    iterate_sync,
+    prompt_template,
+    run_sync,
+    structured_chat_model,
+)
+from blog_agent.agent.lookup import get_index
+from blog_agent.agent.routing import route
+from blog_agent.agent.store import get_post_store, guide_key
+from blog_agent.agent.telemetry import LOOKUP, Span, Tracer
+
 
 class ReviewGuide(BaseModel):
     category: str
@@ -26,7 +41,48 @@ class ReviewGuide(BaseModel):
         )
 
 
-def extract_keywords(review_guide: ReviewGuide) -> list[str]:
+def extract_keywords(review_guide: ReviewGuide, tracer: Tracer | None = None) -> list[str]:
+    """Sync version of `aextract_keywords`."""
+    return run_sync(aextract_keywords(review_guide, tracer=tracer))
+
+
+async def aextract_keywords(review_guide: ReviewGuide, tracer: Tracer | None = None) -> list[str]:
+    """Keywords of the guide. Keywords of a known product are reused without LLM calls."""
+    tracer = tracer or Tracer()
+    with tracer.span("keywords") as span:
+        if (keywords := _lookup_keywords(review_guide, span)) is not None:
+            return keywords
+        res: dict[str, list[str]] = await _extract_keywords_chain(route(span)).ainvoke(
+            review_guide.model_dump(), tracer.config(span)
+        )
+        # Keywords learned by the index are appended to its file off the loop.
+        await asyncio.to_thread(_remember_keywords, review_guide, res["keywords"], span)
+    return res["keywords"]
+
+
+_NOT_SPONSORED = "내돈내산"
+
+
+def _lookup_keywords(review_guide: ReviewGuide, span: Span) -> list[str] | None:
+    """Keywords of the product or a near-identical product name, like the name with a different model suffix"""
+    if (index := get_index("keywords")) is None:
+        return None
+    keywords: list[str] | None = index.longest_match(review_guide.product, min_coverage=0.8)
+    if keywords is None:
+        return None
+    span.attributes[LOOKUP] = "gazetteer"
+    # Whether the review is sponsored differs by reviews of the same product.
+    return keywords if review_guide.sponsored else [*keywords, _NOT_SPONSORED]
+
+
+def _remember_keywords(review_guide: ReviewGuide, keywords: list[str], span: Span) -> None:
+    span.attributes[LOOKUP] = "llm"
+    if (index := get_index("keywords")) is not None:
+        index.add(review_guide.product, [keyword for keyword in keywords if keyword != _NOT_SPONSORED])
+
+
+@cached_chain
+def _extract_keywords_chain(model: str) -> Runnable:
     class Response(TypedDict):
         keywords: list[str]
 
@@ -73,16 +129,11 @@ Arrived date is here.
 Packaging state is here.
 {packaging_state}
 """.strip()
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-        ]
+    template = prompt_template(("system", system_prompt), ("human", human_prompt))
+    llm = structured_chat_model(
+        Response, model=model, temperature=0.52, max_completion_tokens=200, method="json_schema"
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=200)
-    chain = template | llm.with_structured_output(Response, method="json_schema")
-    res: Response = chain.invoke(review_guide.model_dump())
-    return res["keywords"]
+    return template | llm
 
 
 class Review(BaseModel):
@@ -91,10 +142,108 @@ class Review(BaseModel):
     seller_review: str
 
 
-def write_product_review(review_guide: ReviewGuide) -> Review:
-    seller_review = _write_seller_review(review_guide=review_guide)
-    product_review = _write_product_review(review_guide=review_guide)
+class ReviewEvent(BaseModel):
+    """
+    Progress of writing the review.
+    - seller_review: A token of the seller review is streamed.
+    - review: The review is written.
+    """
+
+    stage: Literal["seller_review", "review"]
+    content: str = Field(default="")
+    review: Review | None = Field(default=None)
+
+
+class ReviewRecord(BaseModel):
+    """The review of the guide, stored to answer the same guide without writing it again"""
+
+    review_guide: ReviewGuide
+    review: Review
+
+
+def write_product_review(review_guide: ReviewGuide, tracer: Tracer | None = None) -> Review:
+    """Write the review. The seller review and the product review are written concurrently by `awrite_product_review`."""
+    return run_sync(awrite_product_review(review_guide, tracer=tracer))
+
 
+async def awrite_product_review(review_guide: ReviewGuide, tracer: Tracer | None = None) -> Review:
+    """
+    The seller review and the product review are independent, so both are written at once.
+    The review of the same guide is answered from the post store.
+    """
+    tracer = tracer or Tracer()
+    if (review := await _aload_review(review_guide, tracer)) is not None:
+        return review
+    with tracer.span("review"):
+        seller_review, product_review = await asyncio.gather(
+            _awrite_seller_review(review_guide=review_guide, tracer=tracer),
+            _awrite_product_review(review_guide=review_guide, tracer=tracer),
+        )
+    review = _to_review(seller_review, product_review)
+    await _asave_review(review_guide, review)
+    return review
+
+
+def stream_product_review(review_guide: ReviewGuide, tracer: Tracer | None = None) -> Iterator[ReviewEvent]:
+    """
+    Write the review while streaming the seller review. The last event is the review.
+    Spans of stages and LLM calls are recorded by the tracer.
+    """
+    yield from iterate_sync(astream_product_review(review_guide, tracer=tracer))
+
+
+async def astream_product_review(review_guide: ReviewGuide, tracer: Tracer | None = None) -> AsyncIterator[ReviewEvent]:
+    """Async version of `stream_product_review`. The product review is written while the seller review is streamed."""
+    tracer = tracer or Tracer()
+    if (review := await _aload_review(review_guide, tracer)) is not None:
+        yield ReviewEvent(stage="seller_review", content=review.seller_review)
+        yield ReviewEvent(stage="review", review=review)
+        return
+    with tracer.span("review"):
+        product_review_task: asyncio.Task[dict[Literal["title", "review"], str]] = asyncio.ensure_future(
+            _awrite_product_review(review_guide=review_guide, tracer=tracer)
+        )
+        try:
+            seller_review: str = ""
+            with tracer.span("seller_review") as span:
+                async for chunk in _write_seller_review_chain(route(span)).astream(
+                    review_guide.model_dump(), tracer.config(span)
+                ):
+                    seller_review += chunk.content
+                    yield ReviewEvent(stage="seller_review", content=chunk.content)
+            product_review = await product_review_task
+        finally:
+            await cancel_tasks([product_review_task])
+    review = _to_review(seller_review, product_review)
+    await _asave_review(review_guide, review)
+    yield ReviewEvent(stage="review", review=review)
+
+
+async def _aload_review(review_guide: ReviewGuide, tracer: Tracer) -> Review | None:
+    if (store := get_post_store()) is None:
+        return None
+    # Calls of the store block on SQLite, so they are made off the loop.
+    if (record := await asyncio.to_thread(store.load, guide_key("review", review_guide), ReviewRecord)) is None:
+        return None
+    with tracer.span("review") as span:
+        span.attributes[LOOKUP] = "store"
+    return record.review
+
+
+async def _asave_review(review_guide: ReviewGuide, review: Review) -> None:
+    if (store := get_post_store()) is not None:
+        content: str = f"{review.product_review}\n\n{review.seller_review}"
+        await asyncio.to_thread(
+            store.save,
+            guide_key("review", review_guide),
+            "review",
+            review.title,
+            content,
+            ReviewRecord(review_guide=review_guide, review=review),
+        )
+
+
+def _to_review(seller_review: str, product_review: dict[Literal["title", "review"], str]) -> Review:
     numbers = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
     subtitles = re.findall(r"## (.+?)\n", product_review["review"])
     numbered_subtitles = [number + subtitle for number, subtitle in zip(numbers, subtitles, strict=False)]
@@ -107,7 +256,14 @@ def write_product_review(review_guide: ReviewGuide) -> Review:
     )
 
 
-def _write_seller_review(review_guide: ReviewGuide) -> str:
+async def _awrite_seller_review(review_guide: ReviewGuide, tracer: Tracer) -> str:
+    with tracer.span("seller_review") as span:
+        res = await _write_seller_review_chain(route(span)).ainvoke(review_guide.model_dump(), tracer.config(span))
+    return res.content
+
+
+@cached_chain
+def _write_seller_review_chain(model: str) -> Runnable:
     system_prompt = """
 As a product reviewer, your task is to write product's review for its seller.
 ---
@@ -134,19 +290,21 @@ Arrived date is here.
 Packaging state is here.
 {packaging_state}
 """.strip()
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-        ]
-    )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=1000)
-    chain = template | llm
-    res = chain.invoke(review_guide.model_dump())
-    return res.content
+    template = prompt_template(("system", system_prompt), ("human", human_prompt))
+    llm = chat_model(model, temperature=0.52, max_completion_tokens=1000, cache=False)
+    return template | llm
+
+
+async def _awrite_product_review(review_guide: ReviewGuide, tracer: Tracer) -> dict[Literal["title", "review"], str]:
+    """Keywords are extracted first when the guide doesn't have them. The seller review doesn't wait for them."""
+    if review_guide.keywords is None:
+        review_guide = review_guide.with_keywords(keywords=await aextract_keywords(review_guide, tracer=tracer))
+    with tracer.span("product_review") as span:
+        return await _write_product_review_chain(route(span)).ainvoke(review_guide.model_dump(), tracer.config(span))
 
 
-def _write_product_review(review_guide: ReviewGuide) -> dict[Literal["title", "review"], str]:
+@cached_chain
+def _write_product_review_chain(model: str) -> Runnable:
     class Response(TypedDict):
         review: str
         title: str
@@ -213,13 +371,13 @@ Packaging state is here.
 Review's keywords are here.
 {keywords}
 """.strip()
-    template = ChatPromptTemplate.from_messages(
-        [
-            ("system", system_prompt),
-            ("human", human_prompt),
-        ]
+    template = prompt_template(("system", system_prompt), ("human", human_prompt))
+    llm = structured_chat_model(
+        Response,
+        model=model,
+        temperature=0.52,
+        max_completion_tokens=2000,
+        method="json_schema",
+        cache=False,
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-11-20", temperature=0.52, max_completion_tokens=2000)
-    chain = template | llm.with_structured_output(Response, method="json_schema")
-    res: Response = chain.invoke(review_guide.model_dump())
-    return res
+    return template | llm
@@ -0,0 +1,227 @@
+"""
+Routing of pipeline stages to models.
+Each stage is routed to a tier of models, like `quality` for paragraphs and `fast` for mechanical steps. Stages with a
+fallback tier are routed to it while their model is rate limited or slower than usual.
+Latency, retries and fallbacks are recorded by stage and model from stage spans, so stages can be moved between tiers
+by environments without editing source.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from blog_agent.agent.ratelimit import RateLimitStats, get_rate_limiter
+from blog_agent.agent.telemetry import CACHE_HIT, FALLBACK, MODEL, REGENERATIONS, RETRIES, Span, add_span_observer
+
+_logger = logging.getLogger(__name__)
+
+# Weights of a new latency in the recent and the usual means
+_RECENT_WEIGHT = 0.3
+_USUAL_WEIGHT = 0.05
+
+
+class Route(BaseModel):
+    """
+    - tier: Tier of models writing the stage.
+    - fallback: Tier used while the model of `tier` is under pressure. `None` waits for the model.
+    """
+
+    tier: str = Field(default="quality")
+    fallback: str | None = Field(default=None)
+
+
+DEFAULT_TIERS: dict[str, str] = {"quality": "gpt-4o-2024-11-20", "fast": "gpt-4o-mini"}
+# Writing steps wait for their model to keep the tone of posts. Mechanical steps fall back to the fast tier.
+DEFAULT_ROUTES: dict[str, Route] = {
+    "restaurant": Route(tier="fast"),
+    "plan": Route(fallback="fast"),
+    "introduction": Route(),
+    "body": Route(),
+    "conclusion": Route(),
+    "feedback": Route(fallback="fast"),
+    "revision": Route(),
+    "hashtags": Route(fallback="fast"),
+    "keywords": Route(fallback="fast"),
+    "seller_review": Route(),
+    "product_review": Route(),
+}
+
+
+class RoutingSettings(BaseModel):
+    """
+    - tiers: Models of tiers.
+    - routes: Routes of stages. Stages without routes are written by the `quality` tier without fallbacks.
+    - latency_spike: A model is slow for a stage when its recent latency is this times of its usual latency.
+    - min_samples: Stages observed less than this are not judged slow.
+    - cooldown: Seconds after the last observation until a slow model is tried again.
+    """
+
+    tiers: dict[str, str] = Field(default_factory=lambda: dict(DEFAULT_TIERS))
+    routes: dict[str, Route] = Field(default_factory=lambda: dict(DEFAULT_ROUTES))
+    latency_spike: float = Field(default=2.0, gt=1)
+    min_samples: int = Field(default=5, ge=1)
+    cooldown: float = Field(default=30.0, ge=0)
+
+    @field_validator("routes", mode="before")
+    @classmethod
+    def _tier_names(cls, routes: Any) -> Any:
+        """Routes can be tier names like `{"hashtags": "fast"}`"""
+        if not isinstance(routes, dict):
+            return routes
+        return {stage: {"tier": route} if isinstance(route, str) else route for stage, route in routes.items()}
+
+    @model_validator(mode="after")
+    def _known_tiers(self) -> "RoutingSettings":
+        for stage, route in self.routes.items():
+            for tier in (route.tier, route.fallback):
+                if tier is not None and tier not in self.tiers:
+                    raise ValueError(f"Unknown tier of {stage}: {tier}")
+        return self
+
+    @classmethod
+    def from_env(cls) -> "RoutingSettings":
+        """
+        `BLOG_AGENT_ROUTING` overrides defaults as JSON like `{"routes": {"hashtags": "fast"}}`.
+        Tiers and routes are merged into the defaults, so only changed stages are written.
+        """
+        overrides: dict[str, Any] = json.loads(os.getenv("BLOG_AGENT_ROUTING", "{}"))
+        defaults = cls()
+        routes: dict[str, Any] = {stage: route.model_dump() for stage, route in defaults.routes.items()}
+        routes.update(cls._tier_names(overrides.pop("routes", {})))
+        return cls(**{**overrides, "tiers": defaults.tiers | overrides.pop("tiers", {}), "routes": routes})
+
+    def route(self, stage: str) -> Route:
+        return self.routes.get(stage) or Route()
+
+
+class RouteMetrics(BaseModel):
+    """Stage spans written by a model"""
+
+    stage: str
+    model: str
+    spans: int = 0
+    seconds: float = 0.0
+    retries: int = 0  # retries and regenerations are signs of poor responses
+    errors: int = 0
+    fallbacks: int = 0  # spans routed to the model as a fallback
+    recent_seconds: float = 0.0
+    usual_seconds: float = 0.0
+    observed_at: float = Field(default=0.0, exclude=True)  # monotonic
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.spans if self.spans else 0.0
+
+    @property
+    def retry_rate(self) -> float:
+        return self.retries / self.spans if self.spans else 0.0
+
+
+class ModelRouter:
+    def __init__(self, settings: RoutingSettings | None = None):
+        self.settings = settings or RoutingSettings.from_env()
+        self._lock = threading.Lock()
+        self._metrics: dict[tuple[str, str], RouteMetrics] = {}
+
+    def model(self, stage: str) -> tuple[str, bool]:
+        """The model of the stage, and whether it is the fallback"""
+        route: Route = self.settings.route(stage)
+        model: str = self.settings.tiers[route.tier]
+        if route.fallback is None or not (reason := self._pressure(stage, model)):
+            return model, False
+        fallback: str = self.settings.tiers[route.fallback]
+        log_msg: str = f"Route {stage} to {fallback} instead of {model}: {reason}"
+        _logger.info(log_msg)
+        return fallback, True
+
+    def observe(self, span: Span) -> None:
+        """Record the stage span written by the model in its `MODEL` attribute"""
+        model: str = str(span.attributes[MODEL])
+        seconds: float = span.seconds
+        with self._lock:
+            metrics: RouteMetrics = self._metrics.setdefault(
+                (span.name, model), RouteMetrics(stage=span.name, model=model)
+            )
+            if not metrics.spans:
+                metrics.recent_seconds = metrics.usual_seconds = seconds
+            metrics.recent_seconds += _RECENT_WEIGHT * (seconds - metrics.recent_seconds)
+            metrics.usual_seconds += _USUAL_WEIGHT * (seconds - metrics.usual_seconds)
+            metrics.spans += 1
+            metrics.seconds += seconds
+            metrics.retries += int(span.attributes.get(RETRIES, 0)) + int(span.attributes.get(REGENERATIONS, 0))
+            metrics.errors += span.status == "error"
+            metrics.fallbacks += bool(span.attributes.get(FALLBACK, False))
+            metrics.observed_at = time.monotonic()
+
+    def metrics(self) -> list[RouteMetrics]:
+        with self._lock:
+            return [metrics.model_copy() for metrics in self._metrics.values()]
+
+    def _pressure(self, stage: str, model: str) -> str | None:
+        """Why the model should not write the stage now"""
+        stats: RateLimitStats = get_rate_limiter(model).stats()
+        if stats.paused_seconds > 0:
+            return f"rate limited for {stats.paused_seconds:.1f}s"
+        if stats.waiting >= max(stats.concurrency, 1):
+            return f"{stats.waiting} requests are waiting"
+        with self._lock:
+            metrics: RouteMetrics | None = self._metrics.get((stage, model))
+            if (
+                metrics is not None
+                and metrics.spans >= self.settings.min_samples
+                and time.monotonic() - metrics.observed_at < self.settings.cooldown
+                and metrics.recent_seconds > self.settings.latency_spike * metrics.usual_seconds
+            ):
+                return f"recent latency {metrics.recent_seconds:.1f}s, usually {metrics.usual_seconds:.1f}s"
+        return None
+
+
+_lock = threading.Lock()
+_router: ModelRouter | None = None
+
+
+def get_router() -> ModelRouter:
+    """Router shared by the process. It is configured by environments at first."""
+    global _router
+    with _lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
+
+
+def set_router(router: ModelRouter | None) -> None:
+    """Change the router. `None` builds it from environments again."""
+    global _router
+    with _lock:
+        _router = router
+
+
+def route(span: Span) -> str:
+    """
+    The model of the stage span. LLM calls of the same span share the model chosen by the first call, so continuations
+    are written by the model of their paragraph.
+    """
+    if (model := span.attributes.get(MODEL)) is None:
+        model, fallback = get_router().model(span.name)
+        span.attributes[MODEL] = model
+        if fallback:
+            span.attributes[FALLBACK] = True
+    return str(model)
+
+
+def route_metrics() -> list[RouteMetrics]:
+    return get_router().metrics()
+
+
+def _observe(span: Span) -> None:
+    # Stages answered only from the LLM cache don't tell the latency of their model.
+    if span.kind == "stage" and MODEL in span.attributes and not span.attributes.get(CACHE_HIT):
+        get_router().observe(span)
+
+
+add_span_observer(_observe)
@@ -0,0 +1,65 @@
+"""
+Speculative steps which start before their inputs are final.
+The introduction is written by the first plan while the plan is validated and retried. The paragraph is kept when the
+final plan's introduction has the same subject, and discarded otherwise. Hits and misses are counted by the process, so
+the hit rate shows whether speculation pays for its discarded paragraphs.
+"""
+
+import logging
+import os
+import threading
+from typing import Literal
+
+from pydantic import BaseModel
+
+_logger = logging.getLogger(__name__)
+
+SpeculationMode = Literal["on", "off"]
+
+
+class SpeculationStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total: int = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def speculative_planning() -> bool:
+    """`on`(default) writes the introduction while the plan is retried. `off` waits for the final plan like before."""
+    mode: SpeculationMode = os.getenv("BLOG_AGENT_SPECULATIVE_PLANNING", "on")  # type: ignore[assignment]
+    if mode not in ("on", "off"):
+        raise ValueError(f"Invalid speculative planning: {mode}")
+    return mode == "on"
+
+
+def same_subject(speculated: str, final: str) -> bool:
+    """Subjects are compared without spaces at both ends, because retried plans often only reformat them"""
+    return speculated.strip() == final.strip()
+
+
+_lock = threading.Lock()
+_stats = SpeculationStats()
+
+
+def record_speculation(hit: bool) -> None:
+    with _lock:
+        if hit:
+            _stats.hits += 1
+        else:
+            _stats.misses += 1
+        log_msg: str = f"Speculative introduction {'hit' if hit else 'missed'}: hit rate {_stats.hit_rate:.0%}"
+    _logger.info(log_msg)
+
+
+def speculation_stats() -> SpeculationStats:
+    with _lock:
+        return _stats.model_copy()
+
+
+def reset_speculation_stats() -> None:
+    with _lock:
+        _stats.hits = 0
+        _stats.misses = 0
@@ -0,0 +1,119 @@
+"""
+Store of written posts and reviews.
+Posts and reviews are saved in SQLite with their guides and intermediate results like plans, drafts and feedback.
+Records are keyed by the content hash of their guides, so the same guide is answered from the store instead of written
+again. Titles and contents are indexed by FTS5 to search past posts and reviews.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Literal
+
+from pydantic import BaseModel
+
+_logger = logging.getLogger(__name__)
+
+StoreBackend = Literal["sqlite", "none"]
+RecordKind = Literal["post", "review"]
+
+
+class StoredRecord(BaseModel):
+    """A record found by the search"""
+
+    key: str
+    kind: RecordKind
+    title: str
+    snippet: str  # matched terms are wrapped by `[` and `]`
+    created_at: float
+
+
+def store_backend() -> StoreBackend:
+    """`sqlite`(default) stores posts and reviews. `none` writes every guide like before."""
+    backend: StoreBackend = os.getenv("BLOG_AGENT_POST_STORE", "sqlite")  # type: ignore[assignment]
+    if backend not in ("sqlite", "none"):
+        raise ValueError(f"Invalid post store: {backend}")
+    return backend
+
+
+def guide_key(kind: RecordKind, guide: BaseModel) -> str:
+    """Content hash of the guide. Guides with the same fields share their key."""
+    return hashlib.sha256(f"{kind}:{guide.model_dump_json()}".encode()).hexdigest()
+
+
+class PostStore:
+    """Records of posts and reviews in SQLite, and their full-text index"""
+
+    def __init__(self, path: str = "blog-agent-posts.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records "
+                "(key TEXT PRIMARY KEY, kind TEXT NOT NULL, title TEXT NOT NULL, record TEXT NOT NULL, created_at REAL)"
+            )
+            # Prefix queries find Korean words followed by particles, like `소고기` in `소고기를`.
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(title, content, key UNINDEXED)"
+            )
+
+    def load[R: BaseModel](self, key: str, model: type[R]) -> R | None:
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM records WHERE key = ?", (key,)).fetchone()
+        return model.model_validate_json(row[0]) if row is not None else None
+
+    def save(self, key: str, kind: RecordKind, title: str, content: str, record: BaseModel) -> None:
+        """Save the record, replacing the record of the same key. `title` and `content` are searched."""
+        serialized: str = record.model_dump_json()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO records (key, kind, title, record, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, title, serialized, time.time()),
+            )
+            self._conn.execute("DELETE FROM records_fts WHERE key = ?", (key,))
+            self._conn.execute("INSERT INTO records_fts (title, content, key) VALUES (?, ?, ?)", (title, content, key))
+        log_msg: str = f"Stored {kind} {key[:16]}: {title}"
+        _logger.info(log_msg)
+
+    def search(self, query: str, kind: RecordKind | None = None, limit: int = 10) -> list[StoredRecord]:
+        """Records having every term of the query as a word or a word's prefix, the most relevant first"""
+        if not (terms := query.split()):
+            return []
+        match: str = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT records.key, records.kind, records.title, snippet(records_fts, 1, '[', ']', '…', 16), "
+                "records.created_at FROM records_fts JOIN records ON records.key = records_fts.key "
+                "WHERE records_fts MATCH ? AND (? IS NULL OR records.kind = ?) ORDER BY bm25(records_fts) LIMIT ?",
+                (match, kind, kind, limit),
+            ).fetchall()
+        return [
+            StoredRecord(key=key, kind=kind, title=title, snippet=snippet, created_at=created_at)
+            for key, kind, title, snippet, created_at in rows
+        ]
+
+
+_lock = threading.Lock()
+_store: PostStore | None = None
+
+
+def get_post_store() -> PostStore | None:
+    """Store shared by the process. It is `None` when the store is off."""
+    global _store
+    if store_backend() == "none":
+        return None
+    with _lock:
+        if _store is None:
+            _store = PostStore(os.getenv("BLOG_AGENT_POST_STORE_PATH", "blog-agent-posts.sqlite3"))
+        return _store
+
+
+def set_post_store(store: PostStore | None) -> None:
+    """Change the store. `None` opens it from environments again."""
+    global _store
+    with _lock:
+        _store = store
@@ -0,0 +1,280 @@
+"""
+Spans of pipeline stages and LLM calls.
+Spans follow OpenTelemetry's span data model and GenAI semantic conventions, so exported JSON lines can be ingested by OTLP collectors.
+"""
+
+import logging
+import os
+import secrets
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, Literal
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field
+
+_logger = logging.getLogger(__name__)
+
+SpanKind = Literal["stage", "llm"]
+TraceExporter = Literal["log", "jsonl", "none"]
+
+MODEL = "gen_ai.request.model"
+PROMPT_TOKENS = "gen_ai.usage.input_tokens"
+COMPLETION_TOKENS = "gen_ai.usage.output_tokens"
+RETRIES = "blog_agent.retries"
+SAVED_TOKENS = "blog_agent.saved_tokens"
+LOOKUP = "blog_agent.lookup"
+SPECULATION = "blog_agent.speculation"
+ASKED_LETTERS = "blog_agent.asked_letters"
+REGENERATIONS = "blog_agent.regenerations"
+LINT_VIOLATIONS = "blog_agent.lint_violations"
+FALLBACK = "blog_agent.fallback"
+CACHE_HIT = "blog_agent.cache_hit"
+
+_PARENT_SPAN_ID = "blog_agent_span_id"
+
+
+class Span(BaseModel):
+    name: str
+    kind: SpanKind
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None = Field(default=None)
+    start_time_unix_nano: int
+    end_time_unix_nano: int = Field(default=0)
+    status: Literal["ok", "error"] = Field(default="ok")
+    attributes: dict[str, str | int | float | bool] = Field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float:
+        return max(self.end_time_unix_nano - self.start_time_unix_nano, 0) / 1e9
+
+
+class StageSummary(BaseModel):
+    """Spans of a stage. LLM calls are counted by the stage which makes them, except responses from the LLM cache."""
+
+    stage: str
+    spans: int = 0
+    seconds: float = 0.0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    saved_tokens: int = 0  # estimated prompt tokens saved by context compaction
+    models: list[str] = Field(default_factory=list)
+
+
+class JsonLinesExporter:
+    """Append spans to a JSON lines file"""
+
+    def __init__(self, path: str = "blog-agent-spans.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span) -> None:
+        with self._lock, open(self.path, "a", encoding="utf-8") as fd:
+            fd.write(span.model_dump_json() + "\n")
+
+
+def log_exporter(span: Span) -> None:
+    """Log spans as JSON lines"""
+    _logger.info(span.model_dump_json())
+
+
+def exporter_from_env() -> Callable[[Span], None] | None:
+    exporter: TraceExporter = os.getenv("BLOG_AGENT_TRACE", "log")  # type: ignore[assignment]
+    match exporter:
+        case "log":
+            return log_exporter
+        case "jsonl":
+            return JsonLinesExporter(os.getenv("BLOG_AGENT_TRACE_PATH", "blog-agent-spans.jsonl"))
+        case "none":
+            return None
+        case _:
+            raise ValueError(f"Invalid trace exporter: {exporter}")
+
+
+_observers: list[Callable[[Span], None]] = []
+
+
+def add_span_observer(observer: Callable[[Span], None]) -> None:
+    """Observe finished spans of every tracer in the process, like metrics aggregated across posts"""
+    _observers.append(observer)
+
+
+def is_cache_hit(response: LLMResult) -> bool:
+    """Whether the response is answered from the LLM cache, whose messages are marked by `CACHE_HIT`"""
+    messages: list[BaseMessage | None] = [
+        getattr(generation, "message", None) for generations in response.generations for generation in generations
+    ]
+    return bool(messages) and all(
+        message is not None and message.response_metadata.get(CACHE_HIT) for message in messages
+    )
+
+
+def token_usage(response: LLMResult) -> tuple[int, int]:
+    """Prompt and completion tokens of the response. Responses from the LLM cache cost no tokens."""
+    if is_cache_hit(response):
+        return 0, 0
+    prompt_tokens, completion_tokens = 0, 0
+    for generations in response.generations:
+        for generation in generations:
+            if (usage := getattr(getattr(generation, "message", None), "usage_metadata", None)) is not None:
+                prompt_tokens += usage["input_tokens"]
+                completion_tokens += usage["output_tokens"]
+    if not (prompt_tokens or completion_tokens) and (token_usage := (response.llm_output or {}).get("token_usage")):
+        prompt_tokens = token_usage.get("prompt_tokens") or 0
+        completion_tokens = token_usage.get("completion_tokens") or 0
+    return prompt_tokens, completion_tokens
+
+
+class Tracer(BaseCallbackHandler):
+    """
+    Spans of a post or a review.
+    Stages are recorded by `span`, and LLM calls are recorded when chains are invoked with `config`.
+    The first span is the root of the others.
+    """
+
+    run_inline = True
+
+    def __init__(self, exporter: Callable[[Span], None] | None = None):
+        self.trace_id: str = secrets.token_hex(16)
+        self.exporter = exporter if exporter is not None else exporter_from_env()
+        self.spans: list[Span] = []
+        self._root: Span | None = None
+        self._llm_spans: dict[UUID, Span] = {}
+        # Open stages, and the ones which called models instead of only the LLM cache
+        self._stages: dict[str, Span] = {}
+        self._called: set[str] = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes: str | float | bool) -> Iterator[Span]:
+        """Record a stage. Attributes like retries can be set on the span until the stage is finished."""
+        with self._lock:
+            span = self._start(name, "stage", self._root.span_id if self._root is not None else None)
+            span.attributes.update(attributes)
+            if self._root is None:
+                self._root = span
+            self._stages[span.span_id] = span
+        try:
+            yield span
+        except Exception:
+            span.status = "error"
+            raise
+        finally:
+            with self._lock:
+                if self._root is span:
+                    self._root = None
+                self._stages.pop(span.span_id, None)
+                self._called.discard(span.span_id)
+            self._finish(span)
+
+    def config(self, span: Span | None = None) -> dict[str, Any]:
+        """Runnable config recording LLM calls as children of the span"""
+        return {"callbacks": [self], "metadata": {_PARENT_SPAN_ID: span.span_id} if span is not None else {}}
+
+    def summary(self) -> list[StageSummary]:
+        """Stages ordered by their first start"""
+        with self._lock:
+            spans: list[Span] = sorted(self.spans, key=lambda span: span.start_time_unix_nano)
+        names: dict[str, str] = {span.span_id: span.name for span in spans if span.kind == "stage"}
+        stages: dict[str, StageSummary] = {}
+        for span in spans:
+            if span.kind == "stage":
+                stage = stages.setdefault(span.name, StageSummary(stage=span.name))
+                stage.spans += 1
+                stage.seconds += span.seconds
+                stage.retries += int(span.attributes.get(RETRIES, 0))
+                stage.saved_tokens += int(span.attributes.get(SAVED_TOKENS, 0))
+                continue
+            if span.attributes.get(CACHE_HIT):
+                continue
+            name: str = names.get(span.parent_span_id or "", span.name)
+            stage = stages.setdefault(name, StageSummary(stage=name))
+            stage.llm_calls += 1
+            stage.llm_seconds += span.seconds
+            stage.prompt_tokens += int(span.attributes.get(PROMPT_TOKENS, 0))
+            stage.completion_tokens += int(span.attributes.get(COMPLETION_TOKENS, 0))
+            if (model := str(span.attributes.get(MODEL, ""))) and model not in stage.models:
+                stage.models.append(model)
+        return list(stages.values())
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[BaseMessage]],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        invocation_params: dict[str, Any] = kwargs.get("invocation_params") or {}
+        model: str = (
+            metadata.get("ls_model_name") or invocation_params.get("model") or invocation_params.get("model_name") or ""
+        )
+        with self._lock:
+            parent_span_id: str | None = metadata.get(_PARENT_SPAN_ID) or (
+                self._root.span_id if self._root is not None else None
+            )
+            span = self._start("chat", "llm", parent_span_id)
+            if model:
+                span.name = f"chat {model}"
+                span.attributes[MODEL] = model
+            self._llm_spans[run_id] = span
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            span: Span | None = self._llm_spans.pop(run_id, None)
+        if span is None:
+            return
+        span.attributes[PROMPT_TOKENS], span.attributes[COMPLETION_TOKENS] = token_usage(response)
+        self._mark_cache_hit(span, is_cache_hit(response))
+        self._finish(span)
+
+    def _mark_cache_hit(self, span: Span, hit: bool) -> None:
+        """Mark the LLM call answered from the cache, and its stage while every call of the stage is answered so"""
+        if hit:
+            span.attributes[CACHE_HIT] = True
+        with self._lock:
+            if (stage := self._stages.get(span.parent_span_id or "")) is None:
+                return
+            if not hit:
+                self._called.add(stage.span_id)
+                stage.attributes.pop(CACHE_HIT, None)
+            elif stage.span_id not in self._called:
+                stage.attributes[CACHE_HIT] = True
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            span: Span | None = self._llm_spans.pop(run_id, None)
+        if span is None:
+            return
+        span.status = "error"
+        self._finish(span)
+
+    def _start(self, name: str, kind: SpanKind, parent_span_id: str | None) -> Span:
+        return Span(
+            name=name,
+            kind=kind,
+            trace_id=self.trace_id,
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent_span_id,
+            start_time_unix_nano=time.time_ns(),
+        )
+
+    def _finish(self, span: Span) -> None:
+        span.end_time_unix_nano = time.time_ns()
+        with self._lock:
+            self.spans.append(span)
+        for observer in _observers:
+            observer(span)
+        if self.exporter is not None:
+            self.exporter(span)
@@ -0,0 +1,211 @@
+"""
+HTTP API of posts, reviews and hashtags.
+Requests are authenticated by the secret of pages in `Authorization: Bearer <secret>`. Requests accepting
+`text/event-stream` receive progress events as server-sent events, and other requests receive the result as JSON.
+Workers are forked processes sharing the listening socket, so the service scales by processes and behind proxies.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from typing import Any, get_args
+
+from pydantic import BaseModel, Field, ValidationError
+from tornado.httpserver import HTTPServer
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
+from tornado.web import Application, HTTPError, RequestHandler
+
+from blog_agent.agent import llm
+from blog_agent.agent.post import (
+    PostEvent,
+    PostGuide,
+    WritingMode,
+    afind_restaurant,
+    astream_post,
+    awrite_hashtags,
+)
+from blog_agent.agent.review import Review, ReviewEvent, ReviewGuide, astream_product_review, awrite_product_review
+from blog_agent.agent.store import RecordKind, StoredRecord, get_post_store
+from blog_agent.agent.telemetry import Tracer
+from blog_agent.auth import authenticate
+
+_logger = logging.getLogger(__name__)
+
+
+class ApiSettings(BaseModel):
+    """
+    - workers: Processes serving requests. `0` forks a process per CPU.
+    """
+
+    host: str = Field(default="0.0.0.0")
+    port: int = Field(default=8000, ge=0)
+    workers: int = Field(default=1, ge=0)
+
+    @classmethod
+    def from_env(cls) -> "ApiSettings":
+        env = {
+            "host": os.getenv("BLOG_AGENT_API_HOST"),
+            "port": os.getenv("BLOG_AGENT_API_PORT"),
+            "workers": os.getenv("BLOG_AGENT_API_WORKERS"),
+        }
+        return cls(**{key: value for key, value in env.items() if value is not None})
+
+
+class HashtagsRequest(BaseModel):
+    post: str
+    post_guide: PostGuide
+
+
+class _Handler(RequestHandler, ABC):
+    _response: asyncio.Task[None] | None = None
+    _closed: bool = False
+
+    def prepare(self) -> None:
+        authorization: str = self.request.headers.get("Authorization", "")
+        if not authenticate(secret=authorization.removeprefix("Bearer ")):
+            raise HTTPError(401, reason="Invalid secret")
+
+    async def post(self) -> None:
+        # A closed connection cancels the response, so its LLM calls stop.
+        self._response = asyncio.ensure_future(self.respond())
+        try:
+            await self._response
+        except asyncio.CancelledError:
+            if not self._closed:
+                raise
+            log_msg: str = f"Client closed the connection of {self.request.path}"
+            _logger.info(log_msg)
+
+    @abstractmethod
+    async def respond(self) -> None: ...
+
+    def on_connection_close(self) -> None:
+        self._closed = True
+        if self._response is not None:
+            self._response.cancel()
+
+    def write_error(self, status_code: int, **kwargs: Any) -> None:
+        self.finish({"error": self._reason})
+
+    def body[M: BaseModel](self, model: type[M]) -> M:
+        try:
+            return model.model_validate_json(self.request.body)
+        except ValidationError as e:
+            raise HTTPError(400, reason=f"Invalid {model.__name__}: {e.error_count()} errors") from e
+
+    def streams(self) -> bool:
+        return "text/event-stream" in self.request.headers.get("Accept", "")
+
+    async def send_events(self, events: AsyncIterator[PostEvent | ReviewEvent]) -> None:
+        """Send events as server-sent events. A failure after the first event is sent as an `error` event."""
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        # Proxies like nginx buffer responses by default, which delays events until the stream ends.
+        self.set_header("X-Accel-Buffering", "no")
+        try:
+            async for event in events:
+                self.write(f"event: {event.stage}\ndata: {event.model_dump_json()}\n\n")
+                await self.flush()
+        except StreamClosedError:
+            return
+        except Exception as e:
+            log_msg: str = f"Fail to stream {self.request.path}"
+            _logger.exception(log_msg)
+            self.write(f"event: error\ndata: {json.dumps({'error': repr(e)})}\n\n")
+        self.finish()
+
+
+class PostsHandler(_Handler):
+    async def respond(self) -> None:
+        post_guide: PostGuide = self.body(PostGuide)
+        mode: str = self.get_query_argument("mode", "parallel")
+        if mode not in get_args(WritingMode):
+            raise HTTPError(400, reason=f"Invalid writing mode: {mode}")
+        hashtags: bool = self.get_query_argument("hashtags", "false") == "true"
+        tracer = Tracer()
+        if not post_guide.restaurant:
+            post_guide = post_guide.with_restaurant(await afind_restaurant(post_guide.title, tracer))
+        events: AsyncIterator[PostEvent] = astream_post(post_guide, mode=mode, tracer=tracer, hashtags=hashtags)
+        if self.streams():
+            await self.send_events(events)
+            return
+        result: dict[str, Any] = {}
+        async for event in events:
+            if event.stage == "post":
+                result = {"post": event.content, "restaurant": post_guide.restaurant}
+                if hashtags:
+                    result["hashtags"] = event.hashtags
+        self.finish(result)
+
+
+class ReviewsHandler(_Handler):
+    async def respond(self) -> None:
+        review_guide: ReviewGuide = self.body(ReviewGuide)
+        if self.streams():
+            await self.send_events(astream_product_review(review_guide))
+            return
+        review: Review = await awrite_product_review(review_guide)
+        self.finish(review.model_dump())
+
+
+class HashtagsHandler(_Handler):
+    async def respond(self) -> None:
+        request: HashtagsRequest = self.body(HashtagsRequest)
+        hashtags: list[str] = await awrite_hashtags(request.post, request.post_guide)
+        self.finish({"hashtags": hashtags})
+
+
+class SearchHandler(_Handler):
+    SUPPORTED_METHODS = ("GET",)
+
+    async def get(self) -> None:
+        await self.respond()
+
+    async def respond(self) -> None:
+        if (store := get_post_store()) is None:
+            raise HTTPError(404, reason="Post store is off")
+        kind: str | None = self.get_query_argument("kind", None)
+        if kind is not None and kind not in get_args(RecordKind):
+            raise HTTPError(400, reason=f"Invalid kind: {kind}")
+        try:
+            limit: int = int(self.get_query_argument("limit", "10"))
+        except ValueError as e:
+            raise HTTPError(400, reason="Invalid limit") from e
+        results: list[StoredRecord] = await asyncio.to_thread(
+            store.search, self.get_query_argument("q", ""), kind=kind, limit=limit
+        )
+        self.finish({"results": [result.model_dump() for result in results]})
+
+
+def make_app() -> Application:
+    return Application(
+        [
+            (r"/posts", PostsHandler),
+            (r"/reviews", ReviewsHandler),
+            (r"/hashtags", HashtagsHandler),
+            (r"/search", SearchHandler),
+        ]
+    )
+
+
+def serve(settings: ApiSettings | None = None) -> None:
+    """Serve the API until the process is stopped. Workers are forked before any loop or client is made."""
+    settings = settings or ApiSettings.from_env()
+    sockets = bind_sockets(settings.port, settings.host)
+    llm.preload()
+    if settings.workers != 1:
+        fork_processes(settings.workers)
+    log_msg: str = f"Serve the API on {settings.host}:{settings.port}"
+    _logger.info(log_msg)
+    asyncio.run(_serve(sockets))
+
+
+async def _serve(sockets: list) -> None:
+    server = HTTPServer(make_app())
+    server.add_sockets(sockets)
+    await asyncio.Event().wait()
@@ -0,0 +1,214 @@
+"""
+Non-blocking structured logging.
+Records are put on queues by callers and written by listener threads, so stdout and log files aren't written on the
+request path. `JsonFormatter` writes records as JSON lines with previews of their messages and payloads.
+Large contents like plans and paragraphs are logged as payloads. When artifacts are on, full payloads are appended to
+gzip files of each day, and records refer to them by their `artifact` ids.
+"""
+
+import atexit
+import copy
+import gzip
+import json
+import logging
+import logging.config
+import os
+import queue
+import uuid
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+PAYLOAD = "payload"
+ARTIFACT = "artifact"
+
+LogArtifacts = Literal["on", "off"]
+
+
+def payload(value: BaseModel | str) -> dict[str, Any]:
+    """`extra` of a record logging the value as its payload, like `_logger.info(log_msg, extra=payload(plan))`"""
+    return {PAYLOAD: value}
+
+
+def log_artifacts() -> LogArtifacts:
+    """`on` stores full payloads as artifacts for debugging. `off`(default) keeps only their previews."""
+    artifacts: LogArtifacts = os.getenv("BLOG_AGENT_LOG_ARTIFACTS", "off")  # type: ignore[assignment]
+    if artifacts not in ("on", "off"):
+        raise ValueError(f"Invalid log artifacts: {artifacts}")
+    return artifacts
+
+
+def _default_preview_letters() -> int:
+    return int(os.getenv("BLOG_AGENT_LOG_PREVIEW_LETTERS", "200"))
+
+
+def preview(text: str, letters: int) -> str:
+    if len(text) <= letters:
+        return text
+    return f"{text[:letters]}…(+{len(text) - letters} letters)"
+
+
+def _payload_text(value: Any) -> str:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    """A JSON object per record. Messages and payloads are cut to `preview_letters`."""
+
+    def __init__(self, preview_letters: int | None = None):
+        super().__init__()
+        self.preview_letters = preview_letters if preview_letters is not None else _default_preview_letters()
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": preview(record.getMessage(), self.preview_letters),
+            "location": f"{record.pathname}:{record.lineno}",
+            "thread": record.threadName,
+        }
+        if (value := getattr(record, PAYLOAD, None)) is not None:
+            text: str = _payload_text(value)
+            entry[PAYLOAD] = preview(text, self.preview_letters)
+            entry["payload_letters"] = len(text)
+        if (artifact := getattr(record, ARTIFACT, None)) is not None:
+            entry[ARTIFACT] = artifact
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ArtifactStore:
+    """Full messages and payloads of records, appended to a gzip file of JSON lines per day"""
+
+    def __init__(self, path: str = "blog-agent-artifacts"):
+        self.path = Path(path)
+
+    def write(self, record: logging.LogRecord) -> str:
+        """Store the record and return its artifact id, `<day>/<id>`"""
+        day: str = datetime.fromtimestamp(record.created, UTC).strftime("%Y-%m-%d")
+        artifact: str = f"{day}/{uuid.uuid4().hex[:16]}"
+        entry: dict[str, Any] = {
+            ARTIFACT: artifact,
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if (value := getattr(record, PAYLOAD, None)) is not None:
+            entry[PAYLOAD] = _payload_text(value)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Each write is a gzip member. Concatenated members are read as one file by gzip readers like `zcat`.
+        with gzip.open(self.path / f"{day}.jsonl.gz", "at", encoding="utf-8") as fd:
+            fd.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return artifact
+
+    def read(self, artifact: str) -> dict[str, Any] | None:
+        day, _ = artifact.split("/", 1)
+        if not (file := self.path / f"{day}.jsonl.gz").exists():
+            return None
+        with gzip.open(file, "rt", encoding="utf-8") as fd:
+            for line in fd:
+                if (entry := json.loads(line))[ARTIFACT] == artifact:
+                    return entry
+        return None
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merge arguments into the message and serialize the payload before the record is queued, so listeners don't
+        see objects changed later. Unlike `QueueHandler`, messages aren't formatted, so listeners' formatters apply.
+        """
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if (value := getattr(record, PAYLOAD, None)) is not None:
+            setattr(record, PAYLOAD, _payload_text(value))
+        return record
+
+
+class _Listener(QueueListener):
+    def __init__(self, handlers: tuple[logging.Handler, ...], artifacts: ArtifactStore | None, preview_letters: int):
+        super().__init__(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+        self.artifacts = artifacts
+        self.preview_letters = preview_letters
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Store records whose payloads or messages are cut by previews"""
+        if self.artifacts is not None and (
+            getattr(record, PAYLOAD, None) is not None or len(record.getMessage()) > self.preview_letters
+        ):
+            try:
+                setattr(record, ARTIFACT, self.artifacts.write(record))
+            except OSError as e:
+                # The record is still written without its artifact.
+                setattr(record, ARTIFACT, f"failed: {e!r}")
+        return record
+
+
+_listeners: list[tuple[_Listener, list[_QueueHandler]]] = []
+
+
+def configure_logging(path: str = "logconfig.json") -> None:
+    """
+    Configure logging by the file, and move handlers of the loggers configured by it behind queues.
+    Loggers sharing the same handlers share a listener thread.
+    """
+    stop_logging()
+    with open(path) as fd:
+        config: dict[str, Any] = json.load(fd)
+    logging.config.dictConfig(config)
+    artifacts: ArtifactStore | None = (
+        ArtifactStore(os.getenv("BLOG_AGENT_LOG_ARTIFACT_PATH", "blog-agent-artifacts"))
+        if log_artifacts() == "on"
+        else None
+    )
+    preview_letters: int = _default_preview_letters()
+    listeners: dict[tuple[logging.Handler, ...], tuple[_Listener, list[_QueueHandler]]] = {}
+    loggers: list[logging.Logger] = [
+        *([logging.getLogger()] if "root" in config else []),
+        *(logging.getLogger(name) for name in config.get("loggers", {})),
+    ]
+    for logger in loggers:
+        if not (handlers := tuple(handler for handler in logger.handlers if not isinstance(handler, QueueHandler))):
+            continue
+        if handlers not in listeners:
+            listeners[handlers] = (_Listener(handlers, artifacts, preview_letters), [])
+        listener, queue_handlers = listeners[handlers]
+        queue_handler = _QueueHandler(listener.queue)
+        queue_handlers.append(queue_handler)
+        logger.handlers = [queue_handler]
+    for listener, _ in listeners.values():
+        listener.start()
+    _listeners.extend(listeners.values())
+
+
+def stop_logging() -> None:
+    """Write queued records and stop listener threads"""
+    while _listeners:
+        listener, _ = _listeners.pop()
+        listener.stop()
+
+
+def _restart_in_child() -> None:
+    """Listener threads aren't copied to forked workers, so workers start their own with new queues."""
+    for listener, queue_handlers in _listeners:
+        listener.queue = queue.SimpleQueue()
+        for queue_handler in queue_handlers:
+            queue_handler.queue = listener.queue
+        listener._thread = None
+        listener.start()
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
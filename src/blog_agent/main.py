@@ -2,16 +2,56 @@
 Entrypoint
 """
 
-import json
-import logging
-import logging.config
+import argparse
+import asyncio
+import sys
 from pathlib import Path
 
-from streamlit.web.bootstrap import run
+from blog_agent.logs import configure_logging
 
 
 def web():
-    with open("logconfig.json") as fd:
-        logconfig = json.load(fd)
-        logging.config.dictConfig(logconfig)
+    from streamlit.web.bootstrap import run
+
+    _configure_logging()
     run(str(Path(__file__).parent / "web.py"), is_hello=False, args=[], flag_options={})
+
+
+def batch():
+    """Write posts and reviews of guides in a JSONL file"""
+    from blog_agent.agent.batch import arun_batch_file
+
+    parser = argparse.ArgumentParser(prog="blog_agent_batch", description="Write posts and reviews of JSONL guides.")
+    parser.add_argument("input", type=Path, help="JSONL file of PostGuide or ReviewGuide records")
+    parser.add_argument(
+        "-o", "--output", type=Path, help="JSONL file of results. Completed guides in it are skipped on reruns."
+    )
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Max guides written at the same time")
+    parser.add_argument("-r", "--rate", type=float, default=None, help="Max guides started per minute")
+    args = parser.parse_args()
+
+    _configure_logging()
+    output: Path = args.output or args.input.with_suffix(".out.jsonl")
+    failures: int = asyncio.run(arun_batch_file(args.input, output, concurrency=args.concurrency, rate=args.rate))
+    sys.exit(1 if failures else 0)
+
+
+def api():
+    """Serve the HTTP API of posts, reviews and hashtags"""
+    from blog_agent.api import ApiSettings, serve
+
+    settings = ApiSettings.from_env()
+    parser = argparse.ArgumentParser(prog="blog_agent_api", description="Serve the HTTP API of posts and reviews.")
+    parser.add_argument("--host", default=settings.host, help="Address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=settings.port, help="Port to listen on")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=settings.workers, help="Processes serving requests. 0 forks one per CPU."
+    )
+    args = parser.parse_args()
+
+    _configure_logging()
+    serve(ApiSettings(host=args.host, port=args.port, workers=args.workers))
+
+
+def _configure_logging():
+    configure_logging("logconfig.json")
@@ -1,51 +1,124 @@
+from collections.abc import Iterator
+
 import streamlit as st
 
-from blog_agent.agent import PostGuide, find_restaurant, write_hashtags, write_post
-from blog_agent.web import AUTH_KEY
+from blog_agent.agent import PostEvent, PostGuide
+from blog_agent.agent.jobs import Job, JobLimitError, get_job_queue
+from blog_agent.agent.ratelimit import rate_limit_stats
+from blog_agent.agent.routing import route_metrics
+from blog_agent.agent.store import get_post_store
+from blog_agent.web import AUTH_KEY, current_user
 
 if not st.session_state.get(AUTH_KEY):
     st.stop()
 
-title = st.text_input("Enter title")
-review = st.text_area("Enter review")
-max_length = st.number_input("Enter post's length", min_value=500, max_value=2000)
-keywords: list[str] | str = st.text_input("Enter comma-seperated keywords. Example) 맛집,서울")
-keywords = [keyword.strip() for keyword in keywords.split(",")]
-foods: list[str] | str = st.text_input("Enter comma-seperated foods. Example) 고기,냉면")
-foods = [food.strip() for food in foods.split(",")]
-restaurant = st.text_input("Enter restaurant(Deprecated)")
+jobs = get_job_queue()
+job: Job | None = jobs.get(job_id) if (job_id := st.query_params.get("job")) else None
+if job is None:
+    with st.expander("Search past posts"):
+        if (store := get_post_store()) is not None and (query := st.text_input("Search")):
+            for result in store.search(query, kind="post"):
+                st.markdown(f"**{result.title}**  \n{result.snippet}")
+    title = st.text_input("Enter title")
+    review = st.text_area("Enter review")
+    max_length = st.number_input("Enter post's length", min_value=500, max_value=2000)
+    keywords: list[str] | str = st.text_input("Enter comma-seperated keywords. Example) 맛집,서울")
+    keywords = [keyword.strip() for keyword in keywords.split(",")]
+    foods: list[str] | str = st.text_input("Enter comma-seperated foods. Example) 고기,냉면")
+    foods = [food.strip() for food in foods.split(",")]
+    restaurant = st.text_input("Enter restaurant(Deprecated)")
+    mode = st.radio("Writing mode", options=["sequential", "parallel", "graph"], horizontal=True)
 
-if not st.button("Write!"):
-    st.stop()
-if not (title and review and max_length and keywords and foods):
-    st.warning("Fill all inputs")
-    st.stop()
+    if not st.button("Write!"):
+        st.stop()
+    if not (title and review and max_length and keywords and foods):
+        st.warning("Fill all inputs")
+        st.stop()
+
+    post_guide = PostGuide(
+        title=title,
+        review=review,
+        max_length=max_length,
+        keywords=keywords,
+        foods=foods,
+        restaurant=restaurant,
+    )
+    # The post is written in the background, so reruns and refreshes reattach to the job instead of writing it again.
+    try:
+        job = jobs.submit(current_user(), post_guide, mode=mode)
+    except JobLimitError:
+        st.warning("Too many posts are being written. Wait for them to finish.")
+        st.stop()
+    st.query_params["job"] = job.id
+elif st.button("Write another post"):
+    del st.query_params["job"]
+    st.rerun()
+
+st.markdown(f"# {job.record.guide.title}")
+events: Iterator[PostEvent] = jobs.follow(job.id)
+with st.status("Planning the post...", expanded=True) as status:
+    for event in events:
+        if event.stage == "plan":
+            status.update(label="Writing the draft...")
+            subjects = [event.plan.introduction, *event.plan.bodies, event.plan.conclution]
+            st.markdown("\n".join(f"1. {subject.subject} ({subject.letter_count})" for subject in subjects))
+        elif event.stage == "paragraph":
+            st.markdown(event.content)
+        elif event.stage == "feedback":
+            status.update(label="Revising the draft...", state="complete", expanded=False)
+            break
 
-post_guide = PostGuide(
-    title=title,
-    review=review,
-    max_length=max_length,
-    keywords=keywords,
-    foods=foods,
-    restaurant=restaurant,
-)
-if not restaurant:
-    restaurant = find_restaurant(title)
-
-post_guide = post_guide.with_restaurant(restaurant)
-post: str = write_post(post_guide=post_guide)
-hashtags: list[str] = write_hashtags(post=post, post_guide=post_guide)
+
+def revised_tokens(events: Iterator[PostEvent], final_post: list[str]) -> Iterator[str]:
+    """Yield tokens of the current revision. It stops when the post is revised again or finished."""
+    for event in events:
+        if event.stage == "revision":
+            yield event.content
+        elif event.stage == "post":
+            final_post.append(event.content)
+            return
+        elif event.stage == "retry":
+            return
+    # The job failed before the post is written.
+    final_post.append("")
+
+
+final_post: list[str] = []
+placeholder = st.empty()
+while not final_post:
+    with placeholder.container():
+        st.write_stream(revised_tokens(events, final_post))
+for _ in events:
+    # The result is stored when the job finishes after the last event.
+    pass
+job = jobs.get(job.id)
+if job.result.error is not None:
+    st.error(f"Failed to write the post: {job.result.error}")
+    st.stop()
+post: str = job.result.post
+hashtags: list[str] = job.result.hashtags
+# Streamed tokens are of the last revision, but the post may be an earlier and longer revision.
+placeholder.markdown(post)
 
 result = f"""
-# {title}
 | Property | Description |
 | -------- | ----------- |
 | Word     | {len(post.split())} |
 | Letter   | {len(post)} |
 
-{post}
-
 ## Hashtags
 {hashtags}
 """.strip()
 st.markdown(result)
+with st.expander("Stages"):
+    st.dataframe([stage.model_dump() for stage in job.stages], hide_index=True)
+with st.expander("Rate limits"):
+    st.dataframe([stats.model_dump() for stats in rate_limit_stats()], hide_index=True)
+with st.expander("Routes"):
+    st.dataframe(
+        [
+            metrics.model_dump() | {"mean_seconds": metrics.mean_seconds, "retry_rate": metrics.retry_rate}
+            for metrics in route_metrics()
+        ],
+        hide_index=True,
+    )
@@ -1,59 +1,89 @@
+from collections.abc import Iterator
+
 import streamlit as st
 
-from blog_agent.agent.review import Review, ReviewGuide, extract_keywords, write_product_review
-from blog_agent.web import AUTH_KEY
+from blog_agent.agent.jobs import Job, JobLimitError, get_job_queue
+from blog_agent.agent.ratelimit import rate_limit_stats
+from blog_agent.agent.review import Review, ReviewEvent, ReviewGuide
+from blog_agent.agent.routing import route_metrics
+from blog_agent.web import AUTH_KEY, current_user
 
 if not st.session_state.get(AUTH_KEY):
     st.stop()
-category = st.text_input("Enter category. Example) 전자제품")
-product = st.text_input("Enter product's name")
-score = st.number_input("Enter review's score. 0(worst) - 5(best)", min_value=0, max_value=5)
-max_length = st.number_input("Enter post's length", min_value=500, max_value=2000)
-positive_review = st.text_area("Enter positive review")
-negative_review = st.text_area("Enter negative review")
-sponsored = st.checkbox("Sponsored")
-purchased_date = st.date_input("Purchased date", format="YYYY-MM-DD")
-arrived_date = st.date_input("Arrived date", format="YYYY-MM-DD")
-packaging_state = st.text_input("Packaging state")
 
-if not st.button("Write!"):
-    st.stop()
-if not (
-    category
-    and product
-    and score
-    and max_length
-    and positive_review
-    and negative_review
-    and purchased_date
-    and arrived_date
-    and packaging_state
-):
-    st.warning("Fill all inputs")
-    st.stop()
+jobs = get_job_queue()
+job: Job | None = jobs.get(job_id) if (job_id := st.query_params.get("job")) else None
+if job is None:
+    category = st.text_input("Enter category. Example) 전자제품")
+    product = st.text_input("Enter product's name")
+    score = st.number_input("Enter review's score. 0(worst) - 5(best)", min_value=0, max_value=5)
+    max_length = st.number_input("Enter post's length", min_value=500, max_value=2000)
+    positive_review = st.text_area("Enter positive review")
+    negative_review = st.text_area("Enter negative review")
+    sponsored = st.checkbox("Sponsored")
+    purchased_date = st.date_input("Purchased date", format="YYYY-MM-DD")
+    arrived_date = st.date_input("Arrived date", format="YYYY-MM-DD")
+    packaging_state = st.text_input("Packaging state")
 
-review_guide = ReviewGuide(
-    category=category,
-    product=product,
-    score=score,
-    max_length=max_length,
-    positive_review=positive_review,
-    negative_review=negative_review,
-    sponsored=sponsored,
-    purchased_date=purchased_date.strftime("%Y-%m-%d"),
-    arrived_date=arrived_date.strftime("%Y-%m-%d"),
-    packaging_state=packaging_state,
-)
-keywords: list[str] = extract_keywords(review_guide=review_guide)
-review_guide = review_guide.with_keywords(keywords=keywords)
+    if not st.button("Write!"):
+        st.stop()
+    if not (
+        category
+        and product
+        and score
+        and max_length
+        and positive_review
+        and negative_review
+        and purchased_date
+        and arrived_date
+        and packaging_state
+    ):
+        st.warning("Fill all inputs")
+        st.stop()
 
-review: Review = write_product_review(review_guide=review_guide)
-product_review: str = review.product_review
-review_text = f"""
-> Seller Review
+    review_guide = ReviewGuide(
+        category=category,
+        product=product,
+        score=score,
+        max_length=max_length,
+        positive_review=positive_review,
+        negative_review=negative_review,
+        sponsored=sponsored,
+        purchased_date=purchased_date.strftime("%Y-%m-%d"),
+        arrived_date=arrived_date.strftime("%Y-%m-%d"),
+        packaging_state=packaging_state,
+    )
+    # The review is written in the background, so reruns and refreshes reattach to the job instead of writing it again.
+    try:
+        job = jobs.submit(current_user(), review_guide)
+    except JobLimitError:
+        st.warning("Too many reviews are being written. Wait for them to finish.")
+        st.stop()
+    st.query_params["job"] = job.id
+elif st.button("Write another review"):
+    del st.query_params["job"]
+    st.rerun()
+
+events: Iterator[ReviewEvent] = jobs.follow(job.id)
+reviews: list[Review] = []
 
-{review.seller_review}
 
+def seller_review_tokens(events: Iterator[ReviewEvent], reviews: list[Review]) -> Iterator[str]:
+    for event in events:
+        if event.stage == "seller_review":
+            yield event.content
+        elif event.stage == "review":
+            reviews.append(event.review)
+
+
+st.markdown("> Seller Review")
+with st.spinner("Writing the review..."):
+    st.write_stream(seller_review_tokens(events, reviews))
+if not reviews:
+    st.error(f"Failed to write the review: {jobs.get(job.id).result.error}")
+    st.stop()
+review: Review = reviews[0]
+review_text = f"""
 ---
 
 > Product Review
@@ -62,3 +92,15 @@ review_text = f"""
 {review.product_review}
 """.strip()
 st.markdown(review_text)
+with st.expander("Stages"):
+    st.dataframe([stage.model_dump() for stage in jobs.get(job.id).stages], hide_index=True)
+with st.expander("Rate limits"):
+    st.dataframe([stats.model_dump() for stats in rate_limit_stats()], hide_index=True)
+with st.expander("Routes"):
+    st.dataframe(
+        [
+            metrics.model_dump() | {"mean_seconds": metrics.mean_seconds, "retry_rate": metrics.retry_rate}
+            for metrics in route_metrics()
+        ],
+        hide_index=True,
+    )
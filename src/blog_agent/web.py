@@ -1,4 +1,5 @@
 import logging
+import uuid
 
 import streamlit as st
 
@@ -11,6 +12,17 @@ logging.basicConfig(
 )
 
 AUTH_KEY = "IS_AUTHENTICATED"
+USER_KEY = "USER"
+
+
+def current_user() -> str:
+    """Id of the browser. It is kept in the URL, so refreshed pages reattach to jobs of the same user."""
+    if USER_KEY not in st.session_state:
+        st.session_state[USER_KEY] = st.query_params.get("user") or uuid.uuid4().hex
+    st.query_params["user"] = st.session_state[USER_KEY]
+    return st.session_state[USER_KEY]
+
+
 if not st.session_state.get(AUTH_KEY):
     secret = st.text_input("Secret")
 
@@ -0,0 +1,47 @@
+from collections.abc import Callable, Iterator
+
+import pytest
+
+from blog_agent.agent import llm
+from blog_agent.agent.cache import set_llm_cache
+from blog_agent.agent.fake import FakeChatModelSettings
+from blog_agent.agent.post import PostGuide
+from blog_agent.agent.store import set_post_store
+
+
+@pytest.fixture(autouse=True)
+def post_store(monkeypatch, tmp_path):
+    """Each test starts with an empty post store, so guides of other tests are written again."""
+    monkeypatch.setenv("BLOG_AGENT_POST_STORE_PATH", str(tmp_path / "blog-agent-posts.sqlite3"))
+    set_post_store(None)
+    yield
+    set_post_store(None)
+
+
+@pytest.fixture
+def fake_llm(request) -> Iterator[Callable[..., None]]:
+    """
+    Chat models are answered by the fake model without the LLM cache.
+    Settings are given by indirect parametrization, and changed by calling the fixture like `fake_llm(latency=0.1)`.
+    """
+
+    def provide(**settings) -> None:
+        llm.set_chat_model_provider(FakeChatModelSettings(**settings).provider())
+
+    set_llm_cache(None)
+    provide(**getattr(request, "param", {}))
+    yield provide
+    llm.set_chat_model_provider(None)
+    set_llm_cache(None)
+
+
+@pytest.fixture
+def post_guide() -> PostGuide:
+    return PostGuide(
+        title="소고기 천국",
+        review="맛있다",
+        max_length=1500,
+        keywords=["소고기"],
+        foods=["등심"],
+        restaurant="소고기 천국",
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+from tornado.httpclient import AsyncHTTPClient, HTTPResponse
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+
+from blog_agent.api import make_app
+
+SECRET = {"Authorization": "Bearer TEST_SECRET"}
+
+
+pytestmark = pytest.mark.usefixtures("fake_llm")
+
+
+@pytest.fixture
+def post_guide(post_guide):
+    """Request body of the guide"""
+    return post_guide.model_dump(mode="json")
+
+
+def post(path: str, body: dict | None, headers: dict[str, str], method: str = "POST") -> HTTPResponse:
+    async def fetch() -> HTTPResponse:
+        sock, port = bind_unused_port()
+        server = HTTPServer(make_app())
+        server.add_socket(sock)
+        try:
+            return await AsyncHTTPClient().fetch(
+                f"http://127.0.0.1:{port}{path}",
+                method=method,
+                body=json.dumps(body) if body is not None else None,
+                headers=headers,
+                raise_error=False,
+                request_timeout=60,
+            )
+        finally:
+            server.stop()
+
+    return asyncio.run(fetch())
+
+
+def test_requests_without_secret_are_rejected(post_guide):
+    # when
+    response: HTTPResponse = post("/posts", post_guide, {"Authorization": "Bearer WRONG"})
+    # then
+    assert response.code == 401
+    assert json.loads(response.body) == {"error": "Invalid secret"}
+
+
+def test_post_progress_is_streamed_as_server_sent_events(post_guide):
+    # when
+    response: HTTPResponse = post("/posts?mode=sequential", post_guide, {**SECRET, "Accept": "text/event-stream"})
+    # then
+    assert response.code == 200
+    assert response.headers["Content-Type"] == "text/event-stream"
+    events: list[str] = response.body.decode().strip().split("\n\n")
+    stages: list[str] = [event.split("\n")[0].removeprefix("event: ") for event in events]
+    assert (stages[0], stages[-1]) == ("plan", "post")
+    assert json.loads(events[-1].split("\n")[1].removeprefix("data: "))["content"]
+
+
+def test_hashtags_are_answered_as_json(post_guide):
+    # when
+    response: HTTPResponse = post("/hashtags", {"post": "소고기 천국 방문기", "post_guide": post_guide}, SECRET)
+    invalid: HTTPResponse = post("/hashtags", {"post": "소고기 천국 방문기"}, SECRET)
+    # then
+    assert response.code == 200
+    assert "#소고기" in json.loads(response.body)["hashtags"]
+    assert invalid.code == 400
+
+
+def test_written_posts_are_searched(post_guide):
+    # given
+    written: HTTPResponse = post("/posts", post_guide, SECRET)
+    # when
+    response: HTTPResponse = post("/search?q=소고기&kind=post", None, SECRET, method="GET")
+    # then
+    assert written.code == response.code == 200
+    results: list[dict] = json.loads(response.body)["results"]
+    assert [result["title"] for result in results] == ["소고기 천국"]
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from blog_agent.agent import afind_restaurant, astream_post, awrite_hashtags, awrite_post, post
+from blog_agent.agent.ratelimit import rate_limit_stats, reset_rate_limiters
+from blog_agent.agent.retry import RetryPolicy
+
+
+@pytest.fixture(autouse=True)
+def limiters():
+    reset_rate_limiters()
+    yield
+    reset_rate_limiters()
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_cancelled_post_cancels_its_calls(fake_llm, post_guide, mode):
+    # given
+    fake_llm(latency=0.3)
+
+    async def cancel_while_writing() -> set[asyncio.Task]:
+        task = asyncio.ensure_future(awrite_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0)))
+        # The plan is answered, and paragraphs are being written.
+        await asyncio.sleep(0.45)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    # when
+    started_at: float = time.monotonic()
+    pending: set[asyncio.Task] = asyncio.run(cancel_while_writing())
+    # then
+    assert time.monotonic() - started_at < 1.0
+    assert not pending
+    assert all(stats.in_flight == 0 for stats in rate_limit_stats())
+
+
+def test_single_loop_drives_hundreds_of_calls(fake_llm, post_guide, monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_RATE_MAX_CONCURRENCY", "1000")
+    fake_llm(latency=0.2)
+
+    async def write_all() -> list[list[str]]:
+        restaurant: str = await afind_restaurant("'소고기 천국' 방문기")
+        return await asyncio.gather(
+            *(awrite_hashtags("소고기 천국 방문기", post_guide.with_restaurant(restaurant)) for _ in range(300))
+        )
+
+    # when
+    started_at: float = time.monotonic()
+    hashtags: list[list[str]] = asyncio.run(write_all())
+    # then
+    assert time.monotonic() - started_at < 2.0
+    assert len(hashtags) == 300
+    assert all("#소고기" in tags for tags in hashtags)
+
+
+def test_parallel_paragraphs_are_yielded_in_order_of_plan(fake_llm, post_guide, monkeypatch):
+    # given
+    async def write_introduction(post_guide, plan, budget) -> str:
+        await asyncio.sleep(0.3)
+        return "introduction"
+
+    async def write_body(post_guide, plan, idx, budget) -> str:
+        # Later bodies are written first.
+        await asyncio.sleep(0.2 - idx * 0.05)
+        return f"body {idx}"
+
+    monkeypatch.setattr(post, "_awrite_post_introduction", write_introduction)
+    monkeypatch.setattr(post, "_awrite_post_body_by_plan", write_body)
+
+    async def paragraphs() -> list[str]:
+        return [
+            event.content
+            async for event in astream_post(post_guide, mode="parallel", policy=RetryPolicy(backoff=0))
+            if event.stage == "paragraph"
+        ]
+
+    # when
+    written: list[str] = asyncio.run(paragraphs())
+    # then
+    assert written[:-1] == ["introduction", "body 0", "body 1", "body 2"]
@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+from blog_agent.agent import batch
+from blog_agent.agent.batch import BatchRecord, arun_batch_file
+
+
+@pytest.fixture
+def guides(tmp_path):
+    path = tmp_path / "guides.jsonl"
+    lines = [
+        {
+            "id": "beef",
+            "guide": {"title": "소고기 천국", "review": "맛있다", "max_length": 1000, "keywords": [], "foods": []},
+        },
+        {
+            "title": "냉면 천국",
+            "review": "시원하다",
+            "max_length": 1000,
+            "keywords": [],
+            "foods": [],
+            "restaurant": "냉면집",
+        },
+    ]
+    path.write_text("\n".join(json.dumps(line, ensure_ascii=False) for line in lines), encoding="utf-8")
+    return path
+
+
+def test_record_accepts_bare_guide():
+    # given
+    guide = {"title": "소고기 천국", "review": "맛있다", "max_length": 1000, "keywords": [], "foods": []}
+    # when
+    record = BatchRecord.model_validate(guide)
+    # then
+    assert record.kind == "post"
+    assert record.id == BatchRecord.model_validate(guide).id
+
+
+def test_batch_file_resumes_without_completed_guides(guides, tmp_path, monkeypatch):
+    # given
+    written: list[str] = []
+
+    async def awrite_post_with_hashtags(post_guide, policy=None):
+        written.append(post_guide.title)
+        if post_guide.title == "소고기 천국" and written.count("소고기 천국") == 1:
+            raise RuntimeError("crashed")
+        return f"{post_guide.restaurant} 후기", ["#맛집"]
+
+    async def afind_restaurant(title):
+        return "소고기집"
+
+    monkeypatch.setattr(batch, "awrite_post_with_hashtags", awrite_post_with_hashtags)
+    monkeypatch.setattr(batch, "afind_restaurant", afind_restaurant)
+    output = tmp_path / "results.jsonl"
+    # when
+    first_failures = asyncio.run(arun_batch_file(guides, output, concurrency=2))
+    second_failures = asyncio.run(arun_batch_file(guides, output, concurrency=2))
+    # then
+    assert (first_failures, second_failures) == (1, 0)
+    assert sorted(written) == ["냉면 천국", "소고기 천국", "소고기 천국"]
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [result["post"] for result in results if result["id"] == "beef"] == [None, "소고기집 후기"]
@@ -0,0 +1,47 @@
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.outputs import Generation
+
+from blog_agent.agent.cache import InMemoryLRUCache, SQLiteCache
+
+
+def test_cache_hits_same_prompt():
+    # given
+    cache = InMemoryLRUCache()
+    llm = FakeListChatModel(responses=["first", "second"], cache=cache)
+    # when
+    first = llm.invoke("소고기 천국")
+    second = llm.invoke("소고기 천국")
+    other = llm.invoke("냉면 천국")
+    # then
+    assert first.content == second.content == "first"
+    assert other.content == "second"
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (1, 2)
+
+
+def test_lru_cache_evicts_least_recently_used_and_expired():
+    # given
+    cache = InMemoryLRUCache(maxsize=2, ttl=0.05)
+    cache.update("a", "llm", [Generation(text="a")])
+    cache.update("b", "llm", [Generation(text="b")])
+    cache.lookup("a", "llm")
+    # when
+    cache.update("c", "llm", [Generation(text="c")])
+    # then
+    assert cache.lookup("b", "llm") is None
+    assert cache.lookup("a", "llm") == [Generation(text="a")]
+    time.sleep(0.06)
+    assert cache.lookup("a", "llm") is None
+
+
+def test_sqlite_cache_survives_restart(tmp_path):
+    # given
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path=path).update("prompt", "gpt-4o-mini", [Generation(text="소고기 천국")])
+    # when
+    cache = SQLiteCache(path=path)
+    # then
+    assert cache.lookup("prompt", "gpt-4o-mini") == [Generation(text="소고기 천국")]
+    assert cache.lookup("prompt", "gpt-4o-2024-11-20") is None
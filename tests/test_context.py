@@ -0,0 +1,34 @@
+from blog_agent.agent.context import RollingContext, estimate_tokens, summarize_paragraph
+
+
+def test_rolling_context_summarizes_paragraphs_before_the_last():
+    # given
+    context = RollingContext(mode="summary")
+    paragraphs = [
+        ("인사", "안녕하세요. 오늘은 소고기 천국에 다녀왔다."),
+        ("등심", "등심은 부드러웠다. 숙성이 잘 되어 있었다."),
+    ]
+    # when
+    for subject, paragraph in paragraphs:
+        context.add(subject, paragraph)
+    rendered = context.render()
+    # then
+    assert "- 인사: 안녕하세요." in rendered
+    assert rendered.endswith("등심은 부드러웠다. 숙성이 잘 되어 있었다.")
+    assert "오늘은 소고기 천국에 다녀왔다." not in rendered
+    assert context.post == "\n\n".join(paragraph for _, paragraph in paragraphs)
+
+
+def test_rolling_context_saves_tokens_of_long_posts():
+    # given
+    summary, none = RollingContext(mode="summary"), RollingContext(mode="none")
+    paragraph = "숙성 등심은 부드러웠다. " + "된장찌개가 구수했다. " * 40
+    # when
+    for context in (summary, none):
+        for idx in range(5):
+            context.add(f"subject {idx}", paragraph)
+    # then
+    assert none.render() == none.post
+    assert none.saved_tokens() == 0
+    assert summary.saved_tokens() > estimate_tokens(paragraph) * 3
+    assert summarize_paragraph(paragraph) == "숙성 등심은 부드러웠다."
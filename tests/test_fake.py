@@ -0,0 +1,54 @@
+import pytest
+
+from blog_agent.agent.post import WritingPlan, plan_writing_post, write_post
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.review import Review, ReviewGuide, write_product_review
+from blog_agent.agent.telemetry import Tracer
+
+
+def test_fake_model_answers_structured_output(fake_llm, post_guide):
+    # given
+    fake_llm(number=300, items=3)
+    # when
+    plan: WritingPlan = plan_writing_post(post_guide)
+    # then
+    assert len(plan.bodies) == 3
+    assert plan.introduction.letter_count == 300
+
+
+@pytest.mark.parametrize(("mode", "response_letters", "llm_calls"), [("sequential", 2000, 8), ("parallel", 200, 15)])
+def test_post_pipeline_calls_llm_within_retries(fake_llm, post_guide, mode, response_letters, llm_calls):
+    # given
+    fake_llm(response_letters=response_letters)
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    post: str = write_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0), tracer=tracer)
+    # then
+    assert post
+    assert sum(stage.llm_calls for stage in tracer.summary()) == llm_calls
+
+
+def test_review_writes_seller_review_and_product_review_concurrently(fake_llm):
+    # given
+    fake_llm(latency=0.1)
+    review_guide = ReviewGuide(
+        category="전자제품",
+        product="무선 이어폰",
+        score=4,
+        max_length=1000,
+        positive_review="음질이 좋다",
+        negative_review="케이스가 크다",
+        sponsored=False,
+        purchased_date="2025-01-01",
+        arrived_date="2025-01-03",
+        packaging_state="깔끔했다",
+    )
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    review: Review = write_product_review(review_guide, tracer=tracer)
+    # then
+    assert review.product_review
+    spans = {span.name: span for span in tracer.spans if span.kind == "stage"}
+    seller_review, keywords = spans["seller_review"], spans["keywords"]
+    assert seller_review.start_time_unix_nano < keywords.end_time_unix_nano
+    assert keywords.start_time_unix_nano < seller_review.end_time_unix_nano
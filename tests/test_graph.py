@@ -0,0 +1,54 @@
+import pytest
+
+from blog_agent.agent import graph
+from blog_agent.agent.post import PostEvent, write_post
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.telemetry import Tracer
+
+
+@pytest.fixture(autouse=True)
+def checkpoints(tmp_path, monkeypatch, fake_llm):
+    monkeypatch.setenv("BLOG_AGENT_CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite3"))
+
+
+def test_graph_writes_post_like_parallel_mode(post_guide):
+    # given
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    post: str = write_post(post_guide, mode="graph", policy=RetryPolicy(backoff=0), tracer=tracer)
+    # then
+    assert post
+    assert sum(stage.llm_calls for stage in tracer.summary()) == 8
+
+
+def test_graph_resumes_from_last_completed_node(post_guide, monkeypatch):
+    # given
+    async def fail(*args, **kwargs):
+        raise RuntimeError("Feedback is unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(graph, "_afeedback_draft", fail)
+        with pytest.raises(RuntimeError):
+            list(graph.stream_post_graph(post_guide, policy=RetryPolicy(backoff=0)))
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    events: list[PostEvent] = list(graph.stream_post_graph(post_guide, policy=RetryPolicy(backoff=0), tracer=tracer))
+    # then
+    assert [event.stage for event in events[:5]] == ["plan", "paragraph", "paragraph", "paragraph", "paragraph"]
+    assert events[-1].stage == "post"
+    stages: set[str] = {stage.stage for stage in tracer.summary() if stage.llm_calls}
+    assert stages == {"feedback", "revision"}
+
+
+def test_rerun_of_finished_guide_replaces_bodies_of_previous_run(fake_llm, post_guide):
+    # given
+    fake_llm(items=4)
+    list(graph.stream_post_graph(post_guide, policy=RetryPolicy(backoff=0)))
+    fake_llm(items=2)
+    # when
+    events: list[PostEvent] = list(graph.stream_post_graph(post_guide, policy=RetryPolicy(backoff=0)))
+    # then
+    plan, feedback = events[0], next(event for event in events if event.stage == "feedback")
+    assert len(plan.plan.bodies) == 2
+    assert len(feedback.draft.bodies) == 2
+    assert sum(1 for event in events if event.stage == "paragraph") == 4
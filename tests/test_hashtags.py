@@ -0,0 +1,63 @@
+import pytest
+
+from blog_agent.agent.hashtags import rerank_hashtags
+from blog_agent.agent.post import (
+    PostEvent,
+    WritingPlan,
+    WritingPlanDetail,
+    _DraftCollector,
+    stream_post,
+)
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.telemetry import Tracer
+
+
+def test_candidates_mentioned_by_post_are_ranked_first():
+    # given
+    candidates = ["#강남맛집", "#소고기", "#등심구이", "#된장찌개", "# 소고기"]
+    post = "소고기 천국에서 소고기를 먹었다. 등심은 두툼했고 된장 찌개로 마무리했다."
+    # when
+    hashtags: list[str] = rerank_hashtags(candidates, post, 3)
+    # then
+    assert hashtags == ["#소고기", "#된장찌개", "#등심구이"]
+
+
+def test_none_rerank_keeps_order_of_draft(monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_HASHTAG_RERANK", "none")
+    # when
+    hashtags: list[str] = rerank_hashtags(["#강남맛집", "#소고기", "#강남맛집"], "소고기", 2)
+    # then
+    assert hashtags == ["#강남맛집", "#소고기"]
+
+
+def test_draft_of_hashtags_is_collected_by_paragraph_indexes():
+    # given
+    detail = WritingPlanDetail(subject="등심", letter_count=500)
+    plan = WritingPlan(introduction=detail, bodies=[detail, detail], conclution=detail)
+    collector = _DraftCollector()
+    collector.add(PostEvent(stage="plan", plan=plan))
+    for idx, paragraph in [(2, "body 2"), (0, "introduction"), (1, "body 1")]:
+        collector.add(PostEvent(stage="paragraph", content=paragraph, index=idx))
+    # when
+    draft: str | None = collector.add(PostEvent(stage="paragraph", content="conclusion", index=3))
+    # then
+    assert draft == "introduction\n\nbody 1\n\nbody 2\n\nconclusion"
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_hashtags_are_written_while_draft_is_revised(fake_llm, post_guide, monkeypatch, mode):
+    # given
+    fake_llm(latency=0.1)
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    events: list[PostEvent] = list(
+        stream_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0), tracer=tracer, hashtags=True)
+    )
+    # then
+    assert events[-1].stage == "post"
+    assert events[-1].hashtags[-1] == "#소고기"
+    spans = {span.name: span for span in tracer.spans if span.kind == "stage"}
+    hashtags, feedback = spans["hashtags"], spans["feedback"]
+    assert hashtags.attributes["source"] == "draft"
+    assert hashtags.start_time_unix_nano < feedback.end_time_unix_nano
@@ -0,0 +1,66 @@
+import pytest
+
+from blog_agent.agent.jobs import Job, JobLimitError, JobQueue, JobSettings
+
+
+@pytest.fixture(autouse=True)
+def slow_models(fake_llm):
+    fake_llm(latency=0.05)
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return JobSettings(workers=2, jobs_per_user=1, queue_per_user=2, path=str(tmp_path / "jobs.sqlite3"))
+
+
+def test_job_is_reattached_and_persisted(settings, post_guide):
+    # given
+    jobs = JobQueue(settings)
+    job: Job = jobs.submit("user", post_guide)
+    # when
+    reattached: Job = jobs.submit("user", post_guide)
+    events = list(jobs.follow(job.id))
+    # then
+    assert reattached.id == job.id
+    assert events[0].stage == "plan"
+    assert events[-1].stage == "post"
+    stored: Job = JobQueue(settings).get(job.id)
+    assert stored.status == "succeeded"
+    assert stored.result.post == events[-1].content
+    # The fake model answers the same hashtag candidates, which are written once.
+    assert stored.result.hashtags == events[-1].hashtags
+    assert len(stored.result.hashtags) == 2
+    assert stored.events == events
+
+
+def test_user_cannot_queue_more_jobs_than_limit(settings, post_guide):
+    # given
+    jobs = JobQueue(settings)
+    queued: list[Job] = [
+        jobs.submit("user", post_guide.model_copy(update={"max_length": max_length})) for max_length in (1000, 1500)
+    ]
+    # when
+    with pytest.raises(JobLimitError):
+        jobs.submit("user", post_guide.model_copy(update={"max_length": 2000}))
+    other: Job = jobs.submit("other", post_guide)
+    # then
+    assert list(jobs.follow(other.id))[-1].stage == "post"
+    assert [jobs.get(job.id).status for job in queued if list(jobs.follow(job.id))] == ["succeeded", "succeeded"]
+
+
+def test_progress_of_job_is_followed_while_writing(settings, post_guide):
+    # given
+    jobs = JobQueue(settings)
+    job: Job = jobs.submit("user", post_guide)
+    events = jobs.follow(job.id)
+    # when
+    plan = next(events)
+    status: str = jobs.get(job.id).status
+    progress = list(events)
+    # then
+    assert plan.stage == "plan"
+    assert status == "running"
+    assert [event.stage for event in progress].count("paragraph") == len(plan.plan.bodies) + 2
+    revision: list[str] = [event.content for event in progress if event.stage == "revision"]
+    assert len(revision) > 1
+    assert "".join(revision) == progress[-1].content
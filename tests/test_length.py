@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from blog_agent.agent.length import LengthController, LengthTarget, set_length_controller
+from blog_agent.agent.post import PostEvent, stream_post, write_post
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.telemetry import ASKED_LETTERS, Tracer
+
+
+@pytest.fixture(autouse=True)
+def controller():
+    set_length_controller(None)
+    yield
+    set_length_controller(None)
+
+
+def response(letters: int, tokens: int, finish_reason: str = "stop") -> AIMessage:
+    return AIMessage(
+        content="가" * letters,
+        usage_metadata={"input_tokens": 0, "output_tokens": tokens, "total_tokens": tokens},
+        response_metadata={"finish_reason": finish_reason},
+    )
+
+
+def test_short_responses_ask_for_more_letters(tmp_path):
+    # given
+    path = str(tmp_path / "length.json")
+    controller = LengthController(path=path)
+    target: LengthTarget = controller.target("gpt-4o", 500)
+    # when
+    controller.observe(target, response(400, 200))
+    controller.observe(target, response(400, 200))
+    written: bool = os.path.exists(path)
+    controller.flush()
+    calibrated: LengthTarget = LengthController(path=path).target("gpt-4o", 500)
+    # then
+    # Observations are batched instead of rewriting the file after every response.
+    assert not written
+    assert (target.prompt_letter_count, target.max_completion_tokens) == (500, 700)
+    assert (calibrated.prompt_letter_count, calibrated.max_completion_tokens) == (625, 700)
+
+
+def test_cut_responses_only_teach_letters_per_token():
+    # given
+    controller = LengthController()
+    target: LengthTarget = controller.target("gpt-4o", 500)
+    # when
+    controller.observe(target, response(300, 300, finish_reason="length"))
+    # then
+    stats = controller.stats("gpt-4o")
+    assert (stats.samples, stats.chars_per_token, stats.fulfillment) == (1, 1.0, 1.0)
+
+
+def test_learned_lengths_reduce_paragraph_calls(fake_llm, post_guide, monkeypatch):
+    # given
+    # The same guide is written again instead of answered from the store.
+    monkeypatch.setenv("BLOG_AGENT_POST_STORE", "none")
+    fake_llm(fulfillment=0.8)
+    post_guide = post_guide.model_copy(update={"max_length": 500})
+    first = Tracer(exporter=lambda span: None)
+    write_post(post_guide, policy=RetryPolicy(backoff=0), tracer=first)
+    # when
+    second = Tracer(exporter=lambda span: None)
+    write_post(post_guide, policy=RetryPolicy(backoff=0), tracer=second)
+    # then
+    assert paragraph_calls(first) > paragraph_calls(second) == 5
+    introduction = next(span for span in second.spans if span.name == "introduction")
+    assert introduction.attributes[ASKED_LETTERS] == 375
+
+
+def paragraph_calls(tracer: Tracer) -> int:
+    return sum(stage.llm_calls for stage in tracer.summary() if stage.stage in ("introduction", "body", "conclusion"))
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_short_revision_is_continued_instead_of_revised_again(fake_llm, post_guide, mode):
+    # given
+    fake_llm(response_letters=1000)
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    events: list[PostEvent] = list(stream_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0), tracer=tracer))
+    # then
+    revision = next(stage for stage in tracer.summary() if stage.stage == "revision")
+    assert (revision.llm_calls, revision.retries) == (2, 1)
+    assert all(event.stage != "retry" for event in events)
+    post: str = events[-1].content
+    assert len(post) >= 1500
+    assert "".join(event.content for event in events if event.stage == "revision") == post
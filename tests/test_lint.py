@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from blog_agent.agent.lint import LintReport
+from blog_agent.agent.post import (
+    Draft,
+    DraftDetail,
+    Feedback,
+    PostEvent,
+    WritingPlanDetail,
+    _afeedback_draft,
+    _astream_revised_draft,
+    lint_draft,
+)
+from blog_agent.agent.retry import RetryBudget
+from blog_agent.agent.telemetry import Tracer
+
+
+@pytest.fixture(autouse=True)
+def lint_feedback(monkeypatch):
+    monkeypatch.setenv("BLOG_AGENT_FEEDBACK", "lint")
+
+
+@pytest.fixture
+def post_guide(post_guide):
+    return post_guide.model_copy(update={"max_length": 200, "keywords": ["소고기", "등심"]})
+
+
+def draft(introduction: str, body: str, conclusion: str) -> Draft:
+    return Draft(
+        introduction=DraftDetail(plan=WritingPlanDetail(subject="방문", letter_count=50), paragraph=introduction),
+        bodies=[DraftDetail(plan=WritingPlanDetail(subject="등심", letter_count=100), paragraph=body)],
+        conclusion=DraftDetail(plan=WritingPlanDetail(subject="재방문", letter_count=50), paragraph=conclusion),
+    )
+
+
+@pytest.fixture
+def clean_draft():
+    return draft(
+        "안녕하세요, 오늘 소개해드릴 곳은 소고기 천국입니다! 주말 저녁에 소고기를 먹으러 다녀왔습니다.",
+        "숙성 등심은 두툼하게 썰려 나왔고, 직원분이 알맞게 구워 주셨습니다. " * 3 + "소고기의 육즙이 살아 있었습니다.",
+        "고기를 다 먹은 뒤 된장찌개로 식사를 마무리했습니다. 다음에도 소고기 천국에 다시 방문하고 싶었습니다.",
+    )
+
+
+def test_lint_finds_violations_of_paragraphs(post_guide):
+    # given
+    broken = draft("오늘은 정말 맛있는 고기를 먹었다.", "최고의 등심이었다.", "다음에 또 가겠다.")
+    # when
+    report: LintReport = lint_draft(post_guide, broken)
+    # then
+    assert [(violation.paragraph, violation.rule) for violation in report.violations] == [
+        ("introduction", "greeting"),
+        ("introduction", "length"),
+        ("introduction", "prohibited"),
+        ("introduction", "keywords"),
+        ("body 1", "length"),
+        ("body 1", "prohibited"),
+        ("conclusion", "length"),
+        ("conclusion", "keywords"),
+        ("conclusion", "closing"),
+        ("overall", "length"),
+    ]
+    assert (report.score("introduction"), report.score("body 1")) == (2, 6)
+
+
+def test_feedback_only_has_violations(post_guide, clean_draft):
+    # given
+    clean_draft.bodies[0].paragraph += " 정말 부드러웠습니다."
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    feedback: Feedback = asyncio.run(_afeedback_draft(post_guide, clean_draft, RetryBudget(tracer=tracer)))
+    # then
+    assert (feedback.introduction.score, feedback.bodies[0].score) == (10, 8)
+    assert feedback.bodies[0].advise == "Remove prohibited expressions: 정말."
+    assert not any(span.kind == "llm" for span in tracer.spans)
+
+
+def test_draft_without_violations_is_not_revised(post_guide, clean_draft):
+    # given
+    tracer = Tracer(exporter=lambda span: None)
+    budget = RetryBudget(tracer=tracer)
+    feedback: Feedback = asyncio.run(_afeedback_draft(post_guide, clean_draft, budget))
+
+    async def revise() -> list[PostEvent]:
+        return [event async for event in _astream_revised_draft(post_guide, clean_draft, feedback, budget)]
+
+    # when
+    events: list[PostEvent] = asyncio.run(revise())
+    # then
+    assert [event.stage for event in events] == ["revision", "post"]
+    assert events[-1].content.startswith("안녕하세요, 오늘 소개해드릴 곳은 소고기 천국입니다!")
+    assert not any(span.kind == "llm" for span in tracer.spans)
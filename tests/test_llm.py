@@ -0,0 +1,89 @@
+import asyncio
+import subprocess
+import sys
+
+import httpx
+import pytest
+
+from blog_agent.agent import llm
+from blog_agent.agent.llm import HttpPoolSettings
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "TEST_API_KEY")
+    llm.reset()
+    yield
+    llm.reset()
+
+
+def test_chat_model_is_shared_by_key():
+    # when
+    first = llm.chat_model("gpt-4o-mini", temperature=0.52, max_completion_tokens=100)
+    second = llm.chat_model("gpt-4o-mini", temperature=0.52, max_completion_tokens=100)
+    other = llm.chat_model("gpt-4o-mini", temperature=0.52, max_completion_tokens=200)
+    # then
+    assert first is second
+    assert first is not other
+    assert first.http_client is other.http_client is llm.get_http_client()
+
+
+def test_async_connections_are_pooled_per_event_loop():
+    # given
+    built: list[httpx.AsyncBaseTransport] = []
+
+    def build() -> httpx.AsyncBaseTransport:
+        built.append(httpx.MockTransport(lambda request: httpx.Response(200)))
+        return built[-1]
+
+    client = httpx.AsyncClient(transport=llm.LoopBoundTransport(build))
+
+    async def send_twice() -> None:
+        await client.get("http://openai.test")
+        await client.get("http://openai.test")
+
+    # when
+    asyncio.run(send_twice())
+    asyncio.run(send_twice())
+    # then
+    assert len(built) == 2
+
+
+def test_http_pool_settings_from_env(monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_HTTP_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("BLOG_AGENT_HTTP_KEEPALIVE_EXPIRY", "3.5")
+    # when
+    settings = HttpPoolSettings.from_env()
+    # then
+    assert settings.max_connections == 7
+    assert settings.max_keepalive_connections == 20
+    assert settings.keepalive_expiry == 3.5
+
+
+def test_llm_stack_is_imported_by_the_first_generation():
+    # given
+    probe = (
+        "import sys\n"
+        "from blog_agent.agent import PostGuide\n"
+        "print('langchain_openai' in sys.modules)\n"
+        "from blog_agent.agent import llm\n"
+        "llm.chat_model('gpt-4o-mini', temperature=0.52, max_completion_tokens=100)\n"
+        "print('langchain_openai' in sys.modules)\n"
+    )
+    # when
+    completed = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    # then
+    assert completed.stdout.split() == ["False", "True"]
+
+
+def test_prompt_templates_are_shared_by_chains():
+    # given
+    messages = (("system", "Write about {subject}."), ("human", "{post_guide}"))
+    template = llm.prompt_template(*messages, placeholder="messages")
+    # when
+    llm.reset()
+    # then
+    assert llm.prompt_template(*messages, placeholder="messages") is template
+    assert template.input_variables == ["messages", "post_guide", "subject"]
+    assert llm.prompt_template(*messages) is not template
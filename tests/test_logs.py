@@ -0,0 +1,54 @@
+import json
+import logging
+
+from blog_agent.agent.post import WritingPlan, WritingPlanDetail
+from blog_agent.logs import ArtifactStore, JsonFormatter, configure_logging, payload, stop_logging
+
+
+def test_payloads_are_previewed_as_json():
+    # given
+    formatter = JsonFormatter(preview_letters=10)
+    record = logging.LogRecord("blog_agent.agent.post", logging.INFO, "post.py", 1, "Final post", None, None)
+    record.__dict__.update(payload("소고기" * 10))
+    # when
+    entry: dict = json.loads(formatter.format(record))
+    # then
+    assert entry["message"] == "Final post"
+    assert entry["payload"] == "소고기소고기소고기소…(+20 letters)"
+    assert entry["payload_letters"] == 30
+
+
+def test_full_payloads_are_stored_as_artifacts_by_listeners(monkeypatch, tmp_path):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_LOG_ARTIFACTS", "on")
+    monkeypatch.setenv("BLOG_AGENT_LOG_ARTIFACT_PATH", str(tmp_path / "artifacts"))
+    log_path = tmp_path / "blog-agent.log"
+    config = {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {"json": {"()": "blog_agent.logs.JsonFormatter", "preview_letters": 30}},
+        "handlers": {"file": {"class": "logging.FileHandler", "formatter": "json", "filename": str(log_path)}},
+        "loggers": {"blog_agent.test": {"level": "INFO", "propagate": False, "handlers": ["file"]}},
+    }
+    (config_path := tmp_path / "logconfig.json").write_text(json.dumps(config))
+    plan = WritingPlan(
+        introduction=WritingPlanDetail(subject="소고기 천국", letter_count=500),
+        bodies=[WritingPlanDetail(subject="등심", letter_count=500)],
+        conclution=WritingPlanDetail(subject="재방문", letter_count=500),
+    )
+    logger = logging.getLogger("blog_agent.test")
+    try:
+        configure_logging(str(config_path))
+        # when
+        logger.info("Writing plan of %d bodies", 1, extra=payload(plan))
+        plan.bodies.clear()
+    finally:
+        stop_logging()
+        logger.handlers.clear()
+    # then
+    entry: dict = json.loads(log_path.read_text())
+    assert entry["message"] == "Writing plan of 1 bodies"
+    assert entry["payload"].endswith(f"…(+{entry['payload_letters'] - 30} letters)")
+    artifact: dict = ArtifactStore(str(tmp_path / "artifacts")).read(entry["artifact"])
+    # The payload is serialized when it is logged, before the plan is changed.
+    assert WritingPlan.model_validate_json(artifact["payload"]).bodies[0].subject == "등심"
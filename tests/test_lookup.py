@@ -0,0 +1,107 @@
+import pytest
+
+from blog_agent.agent.lookup import AhoCorasick, LookupIndex, quoted_name, reset_indexes
+from blog_agent.agent.post import find_restaurant
+from blog_agent.agent.review import ReviewGuide, extract_keywords
+from blog_agent.agent.telemetry import LOOKUP, Tracer
+
+
+@pytest.fixture(autouse=True)
+def lookup(tmp_path, monkeypatch, fake_llm):
+    monkeypatch.setenv("BLOG_AGENT_LOOKUP_PATH", str(tmp_path / "lookup.jsonl"))
+    reset_indexes()
+    yield
+    reset_indexes()
+
+
+def lookups(tracer: Tracer) -> list[tuple[str, int]]:
+    stages = [span for span in tracer.spans if span.kind == "stage"]
+    return [(span.attributes[LOOKUP], stage.llm_calls) for span, stage in zip(stages, tracer.summary(), strict=True)]
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    # given
+    automaton: AhoCorasick[str] = AhoCorasick()
+    for pattern in ("소고기", "고기천국", "천국"):
+        automaton.add(pattern, pattern)
+    # when
+    matches = list(automaton.search("소고기천국"))
+    # then
+    assert sorted(matches) == [(0, 3, "소고기"), (1, 5, "고기천국"), (3, 5, "천국")]
+
+
+def test_quoted_name():
+    assert quoted_name('서울의 "소고기 천국" 다녀왔어요!') == "소고기 천국"
+    assert quoted_name("「소고기 천국」 재방문") == "소고기 천국"
+    assert quoted_name("소고기 천국 다녀왔어요") is None
+    assert quoted_name("[서울/강남] 소고기 천국 다녀왔어요") is None
+    assert quoted_name('<내돈내산> "소고기 천국" 후기') == "소고기 천국"
+
+
+def test_known_names_match_whole_words():
+    # given
+    index: LookupIndex[str] = LookupIndex("restaurant")
+    index.add("명동", "명동")
+    # when
+    inside_word: str | None = index.longest_match("명동교자 본점 후기", whole_words=True)
+    whole_word: str | None = index.longest_match("명동 맛집 후기", whole_words=True)
+    # then
+    assert inside_word is None
+    assert whole_word == "명동"
+    assert index.longest_match("명동교자 본점 후기") == "명동"
+
+
+def test_quoted_names_are_known_after_different_titles_quote_them():
+    # given
+    index: LookupIndex[str] = LookupIndex("restaurant")
+    # when
+    index.suggest("소고기 천국", "소고기 천국", source='"소고기 천국" 다녀왔어요')
+    index.suggest("소고기 천국", "소고기 천국", source='"소고기 천국" 다녀왔어요')
+    known_by_one_title: str | None = index.get("소고기 천국")
+    index.suggest("소고기 천국", "소고기 천국", source='"소고기 천국" 재방문')
+    # then
+    assert known_by_one_title is None
+    assert index.get("소고기 천국") == "소고기 천국"
+
+
+def test_restaurant_is_found_without_llm_after_first_answer(tmp_path):
+    # given
+    first = Tracer(exporter=lambda span: None)
+    restaurant: str = find_restaurant("주말에 다녀온 고깃집", tracer=first)
+    # when
+    second = Tracer(exporter=lambda span: None)
+    found: str = find_restaurant(f"{restaurant.replace(' ', '')} 재방문 후기!", tracer=second)
+    quoted = Tracer(exporter=lambda span: None)
+    find_restaurant('서울의 "소고기 천국" 다녀왔어요!', tracer=quoted)
+    # then
+    assert found == restaurant
+    assert lookups(first) == [("llm", 1)]
+    assert lookups(second) == [("gazetteer", 0)]
+    assert lookups(quoted) == [("quoted", 0)]
+    # The quoted name is a guess of a single title, so it isn't stored.
+    assert len(LookupIndex("restaurant", path=str(tmp_path / "lookup.jsonl"))) == 1
+
+
+def test_keywords_of_repeat_products_are_reused():
+    # given
+    review_guide = ReviewGuide(
+        category="전자제품",
+        product="무선 이어폰",
+        score=4,
+        max_length=1000,
+        positive_review="음질이 좋다",
+        negative_review="케이스가 크다",
+        sponsored=True,
+        purchased_date="2025-01-01",
+        arrived_date="2025-01-03",
+        packaging_state="깔끔했다",
+    )
+    keywords: list[str] = extract_keywords(review_guide)
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    reused: list[str] = extract_keywords(
+        review_guide.model_copy(update={"product": "무선이어폰!", "sponsored": False}), tracer=tracer
+    )
+    # then
+    assert reused == [*keywords, "내돈내산"]
+    assert lookups(tracer) == [("gazetteer", 0)]
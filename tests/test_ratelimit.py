@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+
+from blog_agent.agent import llm
+from blog_agent.agent.ratelimit import (
+    ModelRateLimiter,
+    RateLimitSettings,
+    RateLimitStats,
+    get_rate_limiter,
+    observe_response,
+    rate_limit_stats,
+    reset_rate_limiters,
+)
+
+
+@pytest.fixture(autouse=True)
+def limiters():
+    reset_rate_limiters()
+    yield
+    reset_rate_limiters()
+
+
+def test_requests_wait_for_tokens_per_minute():
+    # given
+    limiter = ModelRateLimiter("gpt-4o", RateLimitSettings(tokens_per_minute=6000))
+    limiter.acquire(6000)
+    limiter.release(6000, used_tokens=6000)
+    # when
+    waited: float = limiter.acquire(30)
+    limiter.release(30, used_tokens=10)
+    # then
+    assert waited >= 0.25
+    stats: RateLimitStats = limiter.stats()
+    assert (stats.requests, stats.in_flight, stats.waiting) == (2, 0, 0)
+    assert stats.max_wait_seconds == pytest.approx(waited)
+
+
+def test_limits_adapt_to_rate_limit_headers():
+    # given
+    limiter = ModelRateLimiter("gpt-4o", RateLimitSettings(max_concurrency=16))
+    # when
+    limiter.observe(200, {"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "5"})
+    limiter.observe(429, {"retry-after": "0.3"})
+    started_at: float = time.monotonic()
+    limiter.acquire(10)
+    # then
+    assert time.monotonic() - started_at >= 0.25
+    stats: RateLimitStats = limiter.stats()
+    assert stats.requests_per_minute == 100
+    assert stats.concurrency == 6
+    assert stats.rate_limited == 1
+
+
+def test_chat_models_share_concurrency_of_model(fake_llm, monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_RATE_MAX_CONCURRENCY", "2")
+    fake_llm(latency=0.1)
+    model = llm.chat_model("gpt-4o-mini", temperature=0, max_completion_tokens=10, cache=False)
+
+    async def invoke_all() -> None:
+        await asyncio.gather(*(model.ainvoke("소고기") for _ in range(4)))
+
+    # when
+    started_at: float = time.monotonic()
+    asyncio.run(invoke_all())
+    # then
+    assert time.monotonic() - started_at >= 0.2
+    (stats,) = rate_limit_stats()
+    assert (stats.model, stats.requests, stats.in_flight, stats.waiting) == ("gpt-4o-mini", 4, 0, 0)
+    assert stats.wait_seconds >= 0.2
+
+
+def test_http_hook_observes_headers_of_requested_model():
+    # given
+    headers = {"x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "29000"}
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, headers=headers, json={}))
+    client = httpx.Client(transport=transport, event_hooks={"response": [observe_response]})
+    # when
+    client.post("https://api.openai.com/v1/chat/completions", json={"model": "gpt-4o-2024-11-20", "messages": []})
+    # then
+    assert get_rate_limiter("gpt-4o-2024-11-20").stats().tokens_per_minute == 30000
+
+
+def test_openai_models_reserve_their_completion_tokens(monkeypatch):
+    # given
+    monkeypatch.setenv("OPENAI_API_KEY", "TEST_API_KEY")
+    model = llm._rate_limited_chat_openai()(model="gpt-4o-mini", max_completion_tokens=700)
+    # when
+    tokens: int = model._reserved_tokens([HumanMessage(content="소고기")])
+    # then
+    assert tokens > 700
@@ -0,0 +1,47 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from blog_agent.agent.cache import InMemoryLRUCache
+from blog_agent.agent.retry import RetryBudget, RetryPolicy
+
+
+def test_backoff_is_doubled_up_to_max_backoff():
+    # given
+    policy = RetryPolicy(backoff=0.5, max_backoff=1.5)
+    # when
+    backoffs = [policy.backoff_seconds(retry) for retry in range(1, 5)]
+    # then
+    assert backoffs == [0.5, 1.0, 1.5, 1.5]
+
+
+def test_budget_stops_retry_by_attempts_and_tokens():
+    # given
+    budget = RetryBudget(RetryPolicy(max_attempts=3, max_tokens_per_post=100))
+    message = AIMessage(content="소고기", usage_metadata={"input_tokens": 40, "output_tokens": 20, "total_tokens": 60})
+    # when
+    budget.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+    # then
+    assert budget.total_tokens == 60
+    assert budget.can_retry(2) is True
+    assert budget.can_retry(3) is False
+
+    budget.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+    assert budget.is_exhausted is True
+    assert budget.can_retry(1) is False
+
+
+def test_budget_is_not_charged_by_cached_responses():
+    # given
+    budget = RetryBudget(RetryPolicy(max_tokens_per_post=100))
+    usage = {"input_tokens": 40, "output_tokens": 20, "total_tokens": 60}
+    llm = GenericFakeChatModel(
+        messages=iter([AIMessage(content="소고기", usage_metadata=usage)]), cache=InMemoryLRUCache()
+    )
+    # when
+    llm.invoke("소고기 천국", {"callbacks": [budget]})
+    cached = llm.invoke("소고기 천국", {"callbacks": [budget]})
+    # then
+    assert cached.content == "소고기"
+    assert budget.total_tokens == 60
+    assert budget.is_exhausted is False
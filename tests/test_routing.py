@@ -0,0 +1,81 @@
+import pytest
+
+from blog_agent.agent.post import write_hashtags
+from blog_agent.agent.ratelimit import get_rate_limiter, reset_rate_limiters
+from blog_agent.agent.routing import ModelRouter, RouteMetrics, RoutingSettings, route_metrics, set_router
+from blog_agent.agent.telemetry import FALLBACK, MODEL, RETRIES, Span, Tracer
+
+
+@pytest.fixture(autouse=True)
+def router():
+    reset_rate_limiters()
+    set_router(None)
+    yield
+    set_router(None)
+    reset_rate_limiters()
+
+
+def stage_span(name: str, seconds: float, **attributes: str | float | bool) -> Span:
+    return Span(
+        name=name,
+        kind="stage",
+        trace_id="trace",
+        span_id=name,
+        start_time_unix_nano=0,
+        end_time_unix_nano=int(seconds * 1e9),
+        attributes=attributes,
+    )
+
+
+def test_environment_moves_stages_between_tiers(monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_ROUTING", '{"routes": {"hashtags": "fast"}, "tiers": {"fast": "gpt-4.1-mini"}}')
+    # when
+    settings = RoutingSettings.from_env()
+    # then
+    assert settings.route("hashtags").tier == "fast"
+    assert settings.route("feedback").fallback == "fast"
+    assert settings.tiers == {"quality": "gpt-4o-2024-11-20", "fast": "gpt-4.1-mini"}
+    with pytest.raises(ValueError):
+        RoutingSettings(routes={"hashtags": "cheap"})
+
+
+def test_stages_with_fallbacks_avoid_rate_limited_models():
+    # given
+    router = ModelRouter(RoutingSettings())
+    # when
+    get_rate_limiter("gpt-4o-2024-11-20").observe(429, {"retry-after": "10"})
+    # then
+    assert router.model("feedback") == ("gpt-4o-mini", True)
+    assert router.model("introduction") == ("gpt-4o-2024-11-20", False)
+
+
+def test_stages_fall_back_while_latency_spikes():
+    # given
+    router = ModelRouter(RoutingSettings(min_samples=3))
+    for _ in range(5):
+        router.observe(stage_span("plan", 1.0, **{MODEL: "gpt-4o-2024-11-20"}))
+    assert router.model("plan") == ("gpt-4o-2024-11-20", False)
+    # when
+    for _ in range(3):
+        router.observe(stage_span("plan", 5.0, **{MODEL: "gpt-4o-2024-11-20", RETRIES: 1}))
+    router.observe(stage_span("plan", 0.5, **{MODEL: "gpt-4o-mini", FALLBACK: True}))
+    # then
+    assert router.model("plan") == ("gpt-4o-mini", True)
+    metrics: dict[str, RouteMetrics] = {metrics.model: metrics for metrics in router.metrics()}
+    assert metrics["gpt-4o-2024-11-20"].spans == 8
+    assert metrics["gpt-4o-2024-11-20"].retry_rate == pytest.approx(3 / 8)
+    assert metrics["gpt-4o-mini"].fallbacks == 1
+
+
+def test_stage_spans_record_metrics_of_routed_models(fake_llm, post_guide, monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_ROUTING", '{"routes": {"hashtags": "fast"}}')
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    write_hashtags("소고기를 먹었다.", post_guide, tracer=tracer)
+    # then
+    assert {span.attributes[MODEL] for span in tracer.spans if span.kind == "llm"} == {"gpt-4o-mini"}
+    assert [(metrics.stage, metrics.model, metrics.spans) for metrics in route_metrics()] == [
+        ("hashtags", "gpt-4o-mini", 1)
+    ]
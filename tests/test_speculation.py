@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from blog_agent.agent import post
+from blog_agent.agent.post import WritingPlan, WritingPlanDetail, write_post
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.speculation import reset_speculation_stats, speculation_stats
+from blog_agent.agent.telemetry import SPECULATION, Tracer
+
+
+@pytest.fixture(autouse=True)
+def speculation(fake_llm):
+    reset_speculation_stats()
+    yield
+    reset_speculation_stats()
+
+
+def retried_plans(monkeypatch, first_subject: str, final_subject: str) -> None:
+    """The first plan is too short, so the plan is retried once"""
+    plans = iter(
+        [
+            WritingPlan(
+                introduction=WritingPlanDetail(subject=first_subject, letter_count=100),
+                bodies=[WritingPlanDetail(subject="등심", letter_count=100)],
+                conclution=WritingPlanDetail(subject="재방문", letter_count=100),
+            ),
+            WritingPlan(
+                introduction=WritingPlanDetail(subject=final_subject, letter_count=500),
+                bodies=[WritingPlanDetail(subject="등심", letter_count=500)],
+                conclution=WritingPlanDetail(subject="재방문", letter_count=500),
+            ),
+        ]
+    )
+    monkeypatch.setattr(post, "_plan_writing_post_chain", lambda model: RunnableLambda(lambda prompt: next(plans)))
+
+
+def introductions(tracer: Tracer) -> int:
+    return sum(1 for span in tracer.spans if span.name == "introduction")
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_introduction_of_first_plan_is_kept_when_subject_matches(post_guide, monkeypatch, mode):
+    # given
+    retried_plans(monkeypatch, first_subject="첫 방문", final_subject=" 첫 방문")
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    written: str = write_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0), tracer=tracer)
+    # then
+    assert written
+    assert introductions(tracer) == 1
+    assert tracer.spans[-1].attributes[SPECULATION] == "hit"
+    assert speculation_stats().hit_rate == 1.0
+
+
+def test_introduction_of_first_plan_is_discarded_when_subject_changes(post_guide, monkeypatch):
+    # given
+    retried_plans(monkeypatch, first_subject="첫 방문", final_subject="웨이팅")
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    write_post(post_guide, mode="parallel", policy=RetryPolicy(backoff=0), tracer=tracer)
+    # then
+    assert tracer.spans[-1].attributes[SPECULATION] == "miss"
+    assert (speculation_stats().hits, speculation_stats().misses) == (0, 1)
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_missed_introduction_is_cancelled_while_it_is_written(post_guide, monkeypatch, mode):
+    # given
+    retried_plans(monkeypatch, first_subject="첫 방문", final_subject="웨이팅")
+    cancelled: list[str] = []
+    written = post._awrite_post_introduction
+
+    async def write_introduction(post_guide, plan, budget) -> str:
+        if plan.subject != "첫 방문":
+            return await written(post_guide, plan, budget)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(plan.subject)
+            raise
+        return ""
+
+    monkeypatch.setattr(post, "_awrite_post_introduction", write_introduction)
+    # when
+    written_post: str = write_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0))
+    # then
+    assert written_post
+    assert cancelled == ["첫 방문"]
+
+
+def test_speculation_can_be_turned_off(post_guide, monkeypatch):
+    # given
+    monkeypatch.setenv("BLOG_AGENT_SPECULATIVE_PLANNING", "off")
+    retried_plans(monkeypatch, first_subject="첫 방문", final_subject="첫 방문")
+    tracer = Tracer(exporter=lambda span: None)
+    # when
+    write_post(post_guide, mode="sequential", policy=RetryPolicy(backoff=0), tracer=tracer)
+    # then
+    assert introductions(tracer) == 1
+    assert SPECULATION not in tracer.spans[-1].attributes
+    assert speculation_stats().hits + speculation_stats().misses == 0
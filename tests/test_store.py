@@ -0,0 +1,76 @@
+import pytest
+
+from blog_agent.agent.post import PostEvent, PostGuide, PostRecord, stream_post
+from blog_agent.agent.retry import RetryPolicy
+from blog_agent.agent.review import Review, ReviewGuide, write_product_review
+from blog_agent.agent.store import PostStore, StoredRecord, get_post_store, guide_key
+from blog_agent.agent.telemetry import LOOKUP, Tracer
+
+pytestmark = pytest.mark.usefixtures("fake_llm")
+
+
+def llm_calls(tracer: Tracer) -> list[str]:
+    return [span.name for span in tracer.spans if span.kind == "llm"]
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_same_guide_is_answered_from_store(post_guide, mode):
+    # given
+    post_guide = post_guide.model_copy(update={"max_length": 500})
+    written: list[PostEvent] = list(
+        stream_post(post_guide, mode=mode, policy=RetryPolicy(backoff=0), tracer=Tracer(exporter=lambda span: None))
+    )
+    # when
+    tracer = Tracer(exporter=lambda span: None)
+    stored: list[PostEvent] = list(stream_post(post_guide, mode=mode, tracer=tracer, hashtags=True))
+    # then
+    paragraphs: int = len(written[0].plan.bodies) + 2
+    assert [event.stage for event in stored] == ["plan", *["paragraph"] * paragraphs, "feedback", "revision", "post"]
+    assert stored[0].plan == written[0].plan
+    assert stored[-1].content == written[-1].content
+    assert stored[-1].hashtags
+    # Only hashtags are written, because the stored post didn't have them.
+    assert len(llm_calls(tracer)) == 1
+    record: PostRecord = get_post_store().load(guide_key("post", post_guide), PostRecord)
+    assert record.draft.introduction.paragraph == stored[1].content
+    assert record.hashtags == stored[-1].hashtags
+    post_span = next(span for span in tracer.spans if span.name == "post")
+    assert post_span.attributes[LOOKUP] == "store"
+
+
+def test_reviews_are_stored_and_searched():
+    # given
+    review_guide = ReviewGuide(
+        category="가전",
+        product="무선 청소기",
+        score=5,
+        max_length=500,
+        positive_review="흡입력이 좋다",
+        negative_review="무겁다",
+        sponsored=False,
+        purchased_date="2024-01-01",
+        arrived_date="2024-01-02",
+        packaging_state="깔끔하다",
+    )
+    review: Review = write_product_review(review_guide)
+    # when
+    tracer = Tracer(exporter=lambda span: None)
+    stored: Review = write_product_review(review_guide, tracer=tracer)
+    # then
+    assert stored == review
+    assert not llm_calls(tracer)
+
+
+def test_records_are_searched_by_prefixes_of_words(tmp_path):
+    # given
+    store = PostStore(str(tmp_path / "posts.sqlite3"))
+    post_guide = PostGuide(title="소고기 천국", review="맛있다", max_length=500, keywords=["소고기"], foods=["등심"])
+    record = PostRecord(post_guide=post_guide, post="두툼한 등심을 숯불에 구웠다. 소고기를 좋아한다면 추천한다.")
+    store.save(guide_key("post", post_guide), "post", post_guide.title, record.post, record)
+    # when
+    results: list[StoredRecord] = store.search("소고기 숯불")
+    # then
+    assert [(result.kind, result.title) for result in results] == [("post", "소고기 천국")]
+    assert "[숯불에]" in results[0].snippet
+    assert store.search("소고기", kind="review") == []
+    assert store.search("냉면") == []
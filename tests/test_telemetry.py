@@ -0,0 +1,45 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from blog_agent.agent.cache import InMemoryLRUCache
+from blog_agent.agent.telemetry import CACHE_HIT, RETRIES, Tracer
+
+
+def test_tracer_records_llm_calls_as_children_of_stages():
+    # given
+    spans = []
+    tracer = Tracer(exporter=spans.append)
+    usage = {"input_tokens": 40, "output_tokens": 20, "total_tokens": 60}
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="소고기", usage_metadata=usage)] * 2))
+    # when
+    with tracer.span("post"), tracer.span("introduction") as span:
+        llm.invoke("소고기 천국", tracer.config(span))
+        llm.invoke("소고기 천국", tracer.config(span))
+        span.attributes[RETRIES] = 1
+    # then
+    post, introduction = tracer.summary()
+    assert (post.stage, post.spans, post.llm_calls) == ("post", 1, 0)
+    assert (introduction.llm_calls, introduction.prompt_tokens, introduction.completion_tokens) == (2, 80, 40)
+    assert introduction.retries == 1
+    root = next(span for span in spans if span.name == "post")
+    assert all(span.trace_id == root.trace_id for span in spans)
+    assert [span.parent_span_id is None for span in spans].count(True) == 1
+
+
+def test_cached_responses_are_not_counted_as_llm_calls():
+    # given
+    tracer = Tracer(exporter=lambda span: None)
+    usage = {"input_tokens": 40, "output_tokens": 20, "total_tokens": 60}
+    llm = GenericFakeChatModel(
+        messages=iter([AIMessage(content="소고기", usage_metadata=usage)]), cache=InMemoryLRUCache()
+    )
+    # when
+    with tracer.span("plan") as span:
+        llm.invoke("소고기 천국", tracer.config(span))
+        llm.invoke("소고기 천국", tracer.config(span))
+    with tracer.span("plan") as span:
+        llm.invoke("소고기 천국", tracer.config(span))
+    # then
+    (plan,) = tracer.summary()
+    assert (plan.spans, plan.llm_calls, plan.prompt_tokens, plan.completion_tokens) == (2, 1, 40, 20)
+    assert [bool(span.attributes.get(CACHE_HIT)) for span in tracer.spans] == [False, True, False, True, True]